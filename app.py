@@ -2,12 +2,11 @@
 Aplicação Flask para análise de lucratividade do Mercado Livre.
 """
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, make_response
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, make_response, Response, stream_with_context
 import os
 import threading
 import time
 from datetime import datetime, timedelta
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from database import DatabaseManager
 from meli_api import MercadoLivreAPI
@@ -15,8 +14,15 @@ from profitability import ProfitabilityCalculator
 
 # Carregar variáveis de ambiente
 load_dotenv()
-from auth_manager import AuthManager
-from webhook_processor import WebhookProcessor, WebhookLogger
+from auth_manager import (AuthManager, start_session_sweeper, stop_session_sweeper,
+                          start_consistency_validator, stop_consistency_validator)
+from webhook_processor import WebhookProcessor, WebhookLogger, WebhookRetrier
+from login_bootstrap import LoginBootstrap
+from import_jobs import ImportJobQueue, import_job_queue
+from importers import start_import_worker
+from progress_events import progress_events
+from work_scheduler import work_scheduler
+from leader_election import leader_election
 from token_monitor import start_token_monitoring, stop_token_monitoring, get_users_needing_reauth, force_sync_user
 from functools import wraps
 
@@ -63,7 +69,9 @@ api = MercadoLivreAPI()
 calculator = ProfitabilityCalculator()
 auth_manager = AuthManager()
 webhook_processor = WebhookProcessor(api, db)
+webhook_retrier = WebhookRetrier(webhook_processor)
 webhook_logger = WebhookLogger(db)
+login_bootstrap = LoginBootstrap(api, auth_manager)
 
 # Decorator para verificar login
 def login_required(f):
@@ -87,345 +95,6 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-# Sistema de status de importação por usuário
-import_status_por_usuario = {}
-
-def obter_status_importacao_usuario(user_id):
-    """Obtém ou cria status de importação para um usuário específico"""
-    if user_id not in import_status_por_usuario:
-        import_status_por_usuario[user_id] = {
-            'produtos': {
-                'ativo': False,
-                'progresso': 0,
-                'total': 0,
-                'atual': 0,
-                'status': 'Aguardando...',
-                'inicio': None,
-                'fim': None,
-                'sucesso': 0,
-                'erros': 0
-            },
-            'vendas': {
-                'ativo': False,
-                'progresso': 0,
-                'total': 0,
-                'atual': 0,
-                'status': 'Aguardando...',
-                'inicio': None,
-                'fim': None,
-                'sucesso': 0,
-                'erros': 0
-            }
-        }
-    return import_status_por_usuario[user_id]
-
-# Executor global para threads - Aumentado para suportar múltiplos usuários
-executor = ThreadPoolExecutor(max_workers=10)
-
-def processar_produto_individual(mlb, user_id):
-    """Processa um produto individual - para uso em paralelo - OTIMIZADO."""
-    try:
-        detalhes_completos = api.obter_detalhes_completos_produto(mlb, user_id)
-        if detalhes_completos:
-            if db.salvar_produto_completo(detalhes_completos, user_id):
-                return {'sucesso': True, 'mlb': mlb}
-            else:
-                return {'sucesso': False, 'mlb': mlb, 'erro': 'Falha ao salvar no banco'}
-        else:
-            return {'sucesso': False, 'mlb': mlb, 'erro': 'Falha ao obter detalhes'}
-    except Exception as e:
-        return {'sucesso': False, 'mlb': mlb, 'erro': str(e)}
-
-def processar_lote_produtos(mlbs_batch, user_id):
-    """Processa um lote de produtos de forma otimizada."""
-    resultados = []
-    detalhes_batch = []
-    
-    # Coleta detalhes de todos os produtos do lote
-    for mlb in mlbs_batch:
-        try:
-            detalhes = api.obter_detalhes_completos_produto(mlb, user_id)
-            if detalhes:
-                detalhes_batch.append(detalhes)
-                resultados.append({'sucesso': True, 'mlb': mlb})
-            else:
-                resultados.append({'sucesso': False, 'mlb': mlb, 'erro': 'Falha ao obter detalhes'})
-        except Exception as e:
-            resultados.append({'sucesso': False, 'mlb': mlb, 'erro': str(e)})
-    
-    # Salva todos os produtos do lote de uma vez
-    if detalhes_batch:
-        try:
-            if db.salvar_produtos_lote(detalhes_batch, user_id):
-                # Atualiza resultados para sucesso
-                for resultado in resultados:
-                    if resultado.get('sucesso') and resultado.get('mlb') in [d['produto'].get('id') or d['produto'].get('mlb') for d in detalhes_batch]:
-                        resultado['salvo'] = True
-            else:
-                # Marca todos como falha de salvamento
-                for resultado in resultados:
-                    if resultado.get('sucesso'):
-                        resultado['sucesso'] = False
-                        resultado['erro'] = 'Falha ao salvar lote no banco'
-        except Exception as e:
-            for resultado in resultados:
-                if resultado.get('sucesso'):
-                    resultado['sucesso'] = False
-                    resultado['erro'] = f'Erro ao salvar lote: {str(e)}'
-    
-    return resultados
-
-def importar_produtos_background(user_id):
-    """Função para importar produtos em background."""
-    import_status = obter_status_importacao_usuario(user_id)
-    
-    try:
-        # Inicializa status
-        import_status['produtos']['ativo'] = True
-        import_status['produtos']['status'] = 'Buscando lista de produtos...'
-        import_status['produtos']['inicio'] = datetime.now()
-        import_status['produtos']['progresso'] = 0
-        import_status['produtos']['atual'] = 0
-        import_status['produtos']['sucesso'] = 0
-        import_status['produtos']['erros'] = 0
-        
-        # Importa categorias primeiro (se necessário)
-        try:
-            access_token = db.obter_access_token(user_id)
-            if access_token:
-                # Verifica se já existem categorias no banco
-                conn = db.conectar()
-                if conn:
-                    with conn.cursor() as cursor:
-                        cursor.execute("SELECT COUNT(*) FROM categorias_mlb")
-                        count = cursor.fetchone()[0]
-                        if count == 0:
-                            print("📋 Importando categorias automaticamente...")
-                            categorias = api.obter_categorias_site(access_token, "MLB")
-                            if categorias:
-                                db.salvar_categorias_mlb(categorias)
-                                print(f"✅ {len(categorias)} categorias importadas com sucesso")
-                    conn.close()
-        except Exception as e:
-            print(f"⚠️ Erro ao importar categorias automaticamente: {e}")
-        
-        # Obtém lista de produtos
-        produtos_ids = api.obter_produtos_usuario(user_id)
-        
-        if not produtos_ids:
-            import_status['produtos']['status'] = 'Nenhum produto encontrado'
-            import_status['produtos']['ativo'] = False
-            import_status['produtos']['fim'] = datetime.now()
-            return
-        
-        import_status['produtos']['total'] = len(produtos_ids)
-        import_status['produtos']['status'] = f'Importando {len(produtos_ids)} produtos...'
-        
-        # Processa produtos em lotes para máxima velocidade
-        max_workers = 6  # 6 threads simultâneas para lotes
-        tamanho_lote = 5  # 5 produtos por lote
-        produtos_processados = 0
-        
-        # Divide produtos em lotes
-        lotes = [produtos_ids[i:i + tamanho_lote] for i in range(0, len(produtos_ids), tamanho_lote)]
-        
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Submete todos os lotes para processamento paralelo
-            future_to_lote = {
-                executor.submit(processar_lote_produtos, lote, user_id): lote 
-                for lote in lotes
-            }
-            
-            # Processa resultados conforme completam
-            for future in as_completed(future_to_lote):
-                if not import_status['produtos']['ativo']:  # Permite cancelar
-                    break
-                
-                lote = future_to_lote[future]
-                
-                try:
-                    resultados_lote = future.result()
-                    
-                    # Processa resultados do lote
-                    for resultado in resultados_lote:
-                        produtos_processados += 1
-                        
-                        if resultado['sucesso']:
-                            import_status['produtos']['sucesso'] += 1
-                        else:
-                            import_status['produtos']['erros'] += 1
-                            print(f"❌ Erro no produto {resultado.get('mlb', 'N/A')}: {resultado.get('erro', 'Erro desconhecido')}")
-                        
-                        # Atualiza progresso
-                        import_status['produtos']['atual'] = produtos_processados
-                        import_status['produtos']['progresso'] = int(produtos_processados / len(produtos_ids) * 100)
-                        import_status['produtos']['status'] = f'Processando em lotes: {produtos_processados}/{len(produtos_ids)} produtos'
-                    
-                except Exception as e:
-                    # Marca todos os produtos do lote como erro
-                    for mlb in lote:
-                        produtos_processados += 1
-                        import_status['produtos']['erros'] += 1
-                        print(f"❌ Erro no lote: {e}")
-                    
-                    import_status['produtos']['atual'] = produtos_processados
-                    import_status['produtos']['progresso'] = int(produtos_processados / len(produtos_ids) * 100)
-                
-                # Log a cada 20 produtos (reduzido)
-                if produtos_processados % 20 == 0:
-                    print(f"💾 {import_status['produtos']['sucesso']}/{len(produtos_ids)} produtos salvos (paralelo)")
-        
-        # Finaliza
-        import_status['produtos']['progresso'] = 100
-        import_status['produtos']['status'] = f'Concluído! {import_status["produtos"]["sucesso"]} produtos importados, {import_status["produtos"]["erros"]} erros'
-        import_status['produtos']['fim'] = datetime.now()
-        
-        print(f"✅ Importação concluída: {import_status['produtos']['sucesso']} produtos salvos")
-        
-    except Exception as e:
-        import_status['produtos']['status'] = f'Erro: {str(e)}'
-        import_status['produtos']['erros'] += 1
-        print(f"❌ Erro na importação: {e}")
-    finally:
-        import_status['produtos']['ativo'] = False
-
-def importar_vendas_background(user_id):
-    """Função para importar vendas em background (estratégia de duas fases)."""
-    import_status = obter_status_importacao_usuario(user_id)
-    
-    print(f"🚀 Iniciando importar_vendas_background para user_id: {user_id}")
-    
-    try:
-        # Inicializa status
-        import_status['vendas']['ativo'] = True
-        import_status['vendas']['status'] = 'Buscando IDs das vendas...'
-        import_status['vendas']['inicio'] = datetime.now()
-        import_status['vendas']['progresso'] = 0
-        import_status['vendas']['atual'] = 0
-        import_status['vendas']['sucesso'] = 0
-        import_status['vendas']['erros'] = 0
-        
-        # FASE 1: Obter todos os IDs das vendas (rápido)
-        print(f"🔍 FASE 1: Buscando todos os IDs de vendas para user_id: {user_id}")
-        
-        def callback_ids(total_ids, status):
-            """Callback para atualizar status durante busca de IDs"""
-            import_status['vendas']['status'] = f'Buscando IDs... {status} ({total_ids} encontrados)'
-            import_status['vendas']['total'] = total_ids
-            import_status['vendas']['progresso'] = min(25, int(total_ids / 200))  # Progresso de 0-25%
-        
-        order_ids = api.obter_todos_ids_vendas(user_id, callback_ids)
-        print(f"📊 IDs encontrados: {len(order_ids)}")
-        
-        if not order_ids:
-            import_status['vendas']['status'] = 'Nenhuma venda encontrada'
-            import_status['vendas']['ativo'] = False
-            import_status['vendas']['fim'] = datetime.now()
-            return
-        
-        # Atualiza status após fase 1
-        import_status['vendas']['total'] = len(order_ids)
-        import_status['vendas']['status'] = f'Importando {len(order_ids)} vendas...'
-        import_status['vendas']['progresso'] = 25  # 25% após buscar IDs
-        
-        # FASE 2: Importar cada venda individualmente
-        print(f"🔍 FASE 2: Importando {len(order_ids)} vendas uma por uma...")
-        
-        access_token = api.db.obter_access_token(user_id)
-        if not access_token:
-            import_status['vendas']['status'] = 'Erro: Token de acesso não encontrado'
-            import_status['vendas']['ativo'] = False
-            return
-        
-        # Processa vendas em paralelo otimizado
-        print(f"🚀 Iniciando importação paralela de {len(order_ids)} vendas...")
-        
-        def processar_venda_individual(venda_data):
-            """Processa uma venda individual (para uso em paralelo)"""
-            try:
-                order_id = venda_data.get('id')
-                if not order_id:
-                    return {'sucesso': False, 'order_id': 'N/A', 'erro': 'ID não encontrado'}
-                
-                # Salva venda usando nova estrutura
-                if db.salvar_venda_completa(venda_data, user_id):
-                    return {'sucesso': True, 'order_id': order_id}
-                else:
-                    return {'sucesso': False, 'order_id': order_id, 'erro': 'Falha ao salvar'}
-            except Exception as e:
-                return {'sucesso': False, 'order_id': venda_data.get('id', 'N/A'), 'erro': str(e)}
-        
-        # Configuração de paralelismo otimizada
-        max_workers = min(15, len(order_ids))  # Aumentado para 15 threads
-        batch_size = 100  # Aumentado para 100 vendas por lote
-        
-        print(f"⚙️ Configuração: {max_workers} threads, lotes de {batch_size} vendas")
-        
-        # Processa em lotes para controle de progresso
-        total_processed = 0
-        for batch_start in range(0, len(order_ids), batch_size):
-            if not import_status['vendas']['ativo']:  # Permite cancelar
-                break
-                
-            batch_end = min(batch_start + batch_size, len(order_ids))
-            batch_order_ids = order_ids[batch_start:batch_end]
-            
-            print(f"📦 Processando lote {batch_start//batch_size + 1}: vendas {batch_start + 1}-{batch_end}")
-            
-            # Busca detalhes das vendas do lote em paralelo
-            vendas_detalhadas = api.obter_vendas_paralelo(batch_order_ids, access_token, max_workers)
-            
-            # Processa salvamento em paralelo
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                # Submete todas as vendas do lote para salvamento
-                future_to_venda = {
-                    executor.submit(processar_venda_individual, venda): venda 
-                    for venda in vendas_detalhadas
-                }
-                
-                # Processa resultados conforme ficam prontos
-                for future in as_completed(future_to_venda):
-                    if not import_status['vendas']['ativo']:  # Permite cancelar
-                        break
-                        
-                    result = future.result()
-                    total_processed += 1
-                    
-                    if result['sucesso']:
-                        import_status['vendas']['sucesso'] += 1
-                    else:
-                        import_status['vendas']['erros'] += 1
-                        print(f"❌ Erro na venda {result['order_id']}: {result.get('erro', 'Erro desconhecido')}")
-                    
-                    # Atualiza progresso
-                    import_status['vendas']['atual'] = total_processed
-                    import_status['vendas']['progresso'] = 25 + int(total_processed / len(order_ids) * 75)
-                    import_status['vendas']['status'] = f'Processando venda {total_processed}/{len(order_ids)}: {result["order_id"]}'
-                    
-                    # Log a cada 20 vendas processadas (otimizado)
-                    if total_processed % 20 == 0:
-                        print(f"💾 {import_status['vendas']['sucesso']}/{total_processed} vendas salvas (Lote atual: {batch_start//batch_size + 1})")
-            
-            # Pequena pausa entre lotes para não sobrecarregar a API
-            if batch_end < len(order_ids):
-                time.sleep(0.3)  # Reduzido para acelerar
-        
-        # Finaliza
-        import_status['vendas']['progresso'] = 100
-        import_status['vendas']['status'] = f'Concluído! {import_status["vendas"]["sucesso"]} vendas importadas, {import_status["vendas"]["erros"]} erros'
-        import_status['vendas']['fim'] = datetime.now()
-        
-        print(f"✅ Importação de vendas concluída: {import_status['vendas']['sucesso']} vendas salvas")
-        
-    except Exception as e:
-        import_status['vendas']['status'] = f'Erro: {str(e)}'
-        import_status['vendas']['erros'] += 1
-        print(f"❌ Erro na importação de vendas: {e}")
-        import traceback
-        traceback.print_exc()
-    finally:
-        import_status['vendas']['ativo'] = False
-
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
@@ -444,20 +113,10 @@ def index():
             
             usuario = auth_manager.verificar_login(username, password)
             if usuario:
-                # Verificar se deve encerrar sessão existente (comportamento configurável)
-                from configuracao_sessoes import ConfiguracaoSessoes
-                
-                if not ConfiguracaoSessoes.deve_permitir_multiplas_sessoes():
-                    # Modo atual: encerra sessão anterior
-                    existing_session = auth_manager.verificar_sessao_ativa_usuario(usuario['user_id'])
-                    if existing_session:
-                        print(f"⚠️ Sessão existente encontrada para user_id {usuario['user_id']}, encerrando...")
-                        auth_manager.encerrar_sessao(existing_session['session_token'])
-                
                 # Limpar sessão atual
                 session.clear()
                 
-                # Criar nova sessão
+                # Criar nova sessão (encerra as anteriores se sessões múltiplas não forem permitidas)
                 session_token = auth_manager.criar_sessao(
                     usuario['user_id'], 
                     'password',
@@ -526,6 +185,22 @@ def limpar_todas_sessoes():
     except Exception as e:
         return jsonify({'success': False, 'message': f'Erro: {str(e)}'})
 
+@app.route('/debug/limpar-sessoes-expiradas', methods=['POST'])
+def limpar_sessoes_expiradas():
+    """Remove sessões e códigos de verificação expirados em lotes."""
+    try:
+        resultado = auth_manager.limpar_sessoes_expiradas()
+        
+        if resultado['success']:
+            return jsonify({
+                'success': True,
+                'message': f'{resultado["sessoes_removidas"]} sessões e {resultado["codigos_removidos"]} códigos expirados removidos',
+                'resultado': resultado
+            })
+        return jsonify({'success': False, 'message': resultado.get('message', 'Erro ao limpar sessões expiradas')})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Erro: {str(e)}'})
+
 @app.route('/debug/validar-consistencia', methods=['POST'])
 def validar_consistencia():
     """Valida e corrige inconsistências entre tabelas de usuários."""
@@ -537,6 +212,13 @@ def validar_consistencia():
                 return jsonify({
                     'success': True, 
                     'message': f'Validação concluída: {resultado["inconsistencias_corrigidas"]} inconsistências corrigidas',
+                    'detalhes': resultado['detalhes'],
+                    'verificacoes': resultado['verificacoes']
+                })
+            elif resultado['inconsistencias_encontradas'] > 0:
+                return jsonify({
+                    'success': True, 
+                    'message': f'Validação concluída: {resultado["inconsistencias_encontradas"]} inconsistências requerem ação manual',
                     'detalhes': resultado['detalhes']
                 })
             else:
@@ -831,26 +513,6 @@ def users_needing_reauth():
         'total': len(usuarios)
     })
 
-@app.route('/api/token/start-monitor', methods=['POST'])
-@login_required
-def start_monitor():
-    """Inicia o monitor de tokens (admin only)."""
-    try:
-        start_token_monitoring()
-        return jsonify({'success': True, 'message': 'Monitor de tokens iniciado!'})
-    except Exception as e:
-        return jsonify({'success': False, 'message': f'Erro ao iniciar monitor: {e}'})
-
-@app.route('/api/token/stop-monitor', methods=['POST'])
-@login_required
-def stop_monitor():
-    """Para o monitor de tokens (admin only)."""
-    try:
-        stop_token_monitoring()
-        return jsonify({'success': True, 'message': 'Monitor de tokens parado!'})
-    except Exception as e:
-        return jsonify({'success': False, 'message': f'Erro ao parar monitor: {e}'})
-
 # ===== APIs DE STATUS DE ENVIO =====
 
 @app.route('/api/shipping/statuses')
@@ -948,6 +610,92 @@ def get_sync_status():
     except Exception as e:
         return jsonify({'success': False, 'message': f'Erro ao obter status de sincronização: {e}'})
 
+@app.route('/api/sync/metricas')
+@login_required
+def get_sync_metricas():
+    """Retorna as métricas da fila de sincronização automática e do agendador global."""
+    try:
+        from sync_manager import obter_sync_manager
+        sync_manager = obter_sync_manager()
+        
+        # A fila de sincronização só roda no líder: nos outros workers vale o que ele publicou
+        if leader_election.eh_lider('sincronizacao_automatica'):
+            agendamento = sync_manager.obter_metricas_agendamento()
+            lider, atualizado_em = leader_election.node_id, None
+        else:
+            publicado = leader_election.obter_estado('sincronizacao_automatica') or {}
+            agendamento = publicado.get('estado')
+            lider, atualizado_em = publicado.get('lider'), publicado.get('atualizado_em')
+        
+        return jsonify({
+            'success': True,
+            'agendamento': agendamento,
+            'lider': lider,
+            'agendamento_atualizado_em': atualizado_em,
+            # O agendador global é de cada processo
+            'processo': leader_election.node_id,
+            'agendador': work_scheduler.obter_estatisticas()
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Erro ao obter métricas de sincronização: {e}'})
+
+@app.route('/api/background/lideres')
+@login_required
+def get_background_lideres():
+    """Retorna qual processo lidera cada loop de background."""
+    return jsonify({
+        'success': True,
+        'este_processo': leader_election.node_id,
+        'lideres': leader_election.obter_lideres()
+    })
+
+@app.route('/api/bootstrap/status')
+@login_required
+def get_bootstrap_status():
+    """Retorna o status do bootstrap pós-login do usuário."""
+    user_id = session.get('user_id')
+    status = login_bootstrap.obter_status(user_id)
+    
+    if not status:
+        return jsonify({'success': True, 'ativo': False, 'etapas': {}})
+    
+    etapas = {
+        nome: {
+            'status': etapa['status'],
+            'mensagem': etapa['mensagem'],
+            'inicio': etapa['inicio'].isoformat() if etapa['inicio'] else None,
+            'fim': etapa['fim'].isoformat() if etapa['fim'] else None
+        }
+        for nome, etapa in status['etapas'].items()
+    }
+    
+    return jsonify({
+        'success': True,
+        'ativo': status['ativo'],
+        'inicio': status['inicio'].isoformat(),
+        'fim': status['fim'].isoformat() if status['fim'] else None,
+        'etapas': etapas
+    })
+
+@app.route('/api/eventos')
+@login_required
+def stream_eventos_progresso():
+    """Stream SSE com eventos de progresso de importações, sincronizações e webhooks."""
+    user_id = session.get('user_id')
+    
+    # O EventSource reenvia o id do último evento recebido ao reconectar
+    ultimo_id = request.headers.get('Last-Event-ID') or request.args.get('ultimo_id')
+    try:
+        ultimo_id = int(ultimo_id) if ultimo_id else None
+    except ValueError:
+        ultimo_id = None
+    
+    return Response(
+        stream_with_context(progress_events.stream_sse(user_id, ultimo_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/sync/vendas', methods=['POST'])
 @login_required
 def sync_vendas_manual():
@@ -961,8 +709,8 @@ def sync_vendas_manual():
         # Inicializar sincronização se necessário
         sync_manager.inicializar_sync_usuario(user_id)
         
-        # Executar sincronização em thread separada para não bloquear
-        future = executor.submit(sync_manager.sincronizar_vendas_incremental, user_id)
+        # Executar sincronização no agendador global para não bloquear
+        work_scheduler.submeter(user_id, 'interactive', sync_manager.sincronizar_vendas_incremental, user_id)
         
         return jsonify({
             'success': True, 
@@ -985,8 +733,8 @@ def sync_produtos_manual():
         # Inicializar sincronização se necessário
         sync_manager.inicializar_sync_usuario(user_id)
         
-        # Executar sincronização em thread separada para não bloquear
-        future = executor.submit(sync_manager.sincronizar_produtos_incremental, user_id)
+        # Executar sincronização no agendador global para não bloquear
+        work_scheduler.submeter(user_id, 'interactive', sync_manager.sincronizar_produtos_incremental, user_id)
         
         return jsonify({
             'success': True, 
@@ -1032,6 +780,22 @@ def get_sync_history():
         if conn.is_connected():
             conn.close()
 
+@app.route('/api/sync/history/daily')
+@login_required
+def get_sync_history_daily():
+    """Retorna o resumo diário das sincronizações (agregados mantidos após a retenção)."""
+    user_id = session.get('user_id')
+    dias = min(max(request.args.get('dias', 30, type=int), 1), 365)
+    
+    try:
+        from sync_manager import obter_sync_manager
+        return jsonify({
+            'success': True,
+            'daily': obter_sync_manager().obter_historico_diario(user_id, dias)
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Erro ao obter resumo diário: {e}'})
+
 @app.route('/api/sync/initialize', methods=['POST'])
 @login_required
 def initialize_sync():
@@ -1104,20 +868,7 @@ def callback():
         if user_id:
             print(f"👤 User ID: {user_id}")
             
-            # Garantir consistência entre tabelas usuarios_auth e user_info
-            auth_manager.garantir_consistencia_usuario(user_id)
-            
-            # Verificar se deve encerrar sessão existente (comportamento configurável)
-            from configuracao_sessoes import ConfiguracaoSessoes
-            
-            if not ConfiguracaoSessoes.deve_permitir_multiplas_sessoes():
-                # Modo atual: encerra sessão anterior
-                existing_session = auth_manager.verificar_sessao_ativa_usuario(user_id)
-                if existing_session:
-                    print(f"⚠️ Sessão existente encontrada para user_id {user_id}, encerrando...")
-                    auth_manager.encerrar_sessao(existing_session['session_token'])
-            
-            # Criar nova sessão
+            # Criar nova sessão (encerra as anteriores se sessões múltiplas não forem permitidas)
             session_token = auth_manager.criar_sessao(
                 user_id, 
                 'mercadolivre',
@@ -1131,6 +882,10 @@ def callback():
                 session['login_type'] = 'mercadolivre'
                 session['session_token'] = session_token
                 print(f"✅ Nova sessão criada: {session_token[:20]}...")
+                
+                # Dados do usuário, consistência e sincronização inicial rodam em background
+                login_bootstrap.iniciar(user_id)
+                
                 flash('🎉 Autenticação realizada com sucesso!', 'success')
                 return redirect(url_for('dashboard'))
             else:
@@ -1593,6 +1348,21 @@ def api_produtos():
     except Exception as e:
         return jsonify({'success': False, 'message': f'Erro interno: {str(e)}'})
 
+@app.route('/api/produtos/alteracoes')
+@login_required
+def api_produtos_alteracoes():
+    """Alterações de preço, estoque, status, tipo de anúncio e frete posteriores ao cursor."""
+    try:
+        user_id = session['user_id']
+        desde = request.args.get('desde', 0, type=int)
+        limite = min(max(request.args.get('limit', 500, type=int), 1), 5000)
+        mlb = request.args.get('mlb', '').strip() or None
+        
+        resultado = db.obter_alteracoes_produtos(user_id, desde, limite, mlb)
+        return jsonify({'success': True, **resultado})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Erro ao obter alterações de produtos: {e}'})
+
 @app.route('/api/vendas')
 def api_vendas():
     """API para buscar vendas com filtros e paginação."""
@@ -1747,14 +1517,6 @@ def importar_produtos():
     
     user_id = session['user_id']
     
-    # Verifica se já há uma importação ativa
-    import_status = obter_status_importacao_usuario(user_id)
-    if import_status['produtos']['ativo']:
-        return jsonify({
-            'success': False, 
-            'message': 'Já existe uma importação de produtos em andamento!'
-        })
-    
     # Verifica se o token ainda é válido
     access_token = db.obter_access_token(user_id)
     if not access_token:
@@ -1764,16 +1526,20 @@ def importar_produtos():
             'redirect': '/auth'
         })
     
-    print(f"🔑 Iniciando importação em background para user_id: {user_id}")
+    # Enfileira o job (um único job ativo por usuário e tipo)
+    job_id, criado = import_job_queue.enfileirar(user_id, 'produtos')
+    if not criado:
+        return jsonify({
+            'success': False, 
+            'message': 'Já existe uma importação de produtos em andamento!' if job_id else 'Erro ao iniciar importação'
+        })
     
-    # Inicia importação em thread separada
-    thread = threading.Thread(target=importar_produtos_background, args=(user_id,))
-    thread.daemon = True
-    thread.start()
+    print(f"🔑 Importação de produtos enfileirada para user_id: {user_id} (job {job_id})")
     
     return jsonify({
         'success': True, 
-        'message': 'Importação iniciada! Acompanhe o progresso na tela.'
+        'message': 'Importação iniciada! Acompanhe o progresso na tela.',
+        'job_id': job_id
     })
 
 @app.route('/importar/status')
@@ -1781,22 +1547,20 @@ def importar_produtos():
 def status_importacao():
     """Retorna status atual das importações para o usuário logado."""
     user_id = session.get('user_id')
-    import_status = obter_status_importacao_usuario(user_id)
-    return jsonify(import_status)
+    return jsonify(import_job_queue.obter_status_usuario(user_id))
 
 @app.route('/importar/cancelar/<tipo>')
 @login_required
 def cancelar_importacao(tipo):
     """Cancela uma importação em andamento para o usuário logado."""
     user_id = session.get('user_id')
-    import_status = obter_status_importacao_usuario(user_id)
     
-    if tipo in import_status:
-        import_status[tipo]['ativo'] = False
-        import_status[tipo]['status'] = 'Cancelado pelo usuário'
-        import_status[tipo]['fim'] = datetime.now()
+    if tipo not in ImportJobQueue.TIPOS:
+        return jsonify({'success': False, 'message': 'Tipo de importação inválido'})
+    
+    if import_job_queue.solicitar_cancelamento(user_id, tipo):
         return jsonify({'success': True, 'message': f'Importação de {tipo} cancelada'})
-    return jsonify({'success': False, 'message': 'Tipo de importação inválido'})
+    return jsonify({'success': False, 'message': f'Nenhuma importação de {tipo} em andamento'})
 
 @app.route('/importar/vendas', methods=['POST'])
 def importar_vendas():
@@ -1806,14 +1570,6 @@ def importar_vendas():
     
     user_id = session['user_id']
     
-    # Verifica se já há uma importação ativa
-    import_status = obter_status_importacao_usuario(user_id)
-    if import_status['vendas']['ativo']:
-        return jsonify({
-            'success': False,
-            'message': 'Já existe uma importação de vendas em andamento!'
-        })
-    
     # Verifica se o token ainda é válido
     access_token = db.obter_access_token(user_id)
     if not access_token:
@@ -1823,24 +1579,20 @@ def importar_vendas():
             'redirect': '/auth'
         })
     
-    print(f"🔑 Iniciando importação de vendas em background para user_id: {user_id}")
-    
-    # Inicia importação usando threading tradicional com melhor gerenciamento
-    def run_import():
-        try:
-            importar_vendas_background(user_id)
-        except Exception as e:
-            print(f"❌ Erro na thread de importação: {e}")
-            import traceback
-            traceback.print_exc()
+    # Enfileira o job (um único job ativo por usuário e tipo)
+    job_id, criado = import_job_queue.enfileirar(user_id, 'vendas')
+    if not criado:
+        return jsonify({
+            'success': False,
+            'message': 'Já existe uma importação de vendas em andamento!' if job_id else 'Erro ao iniciar importação'
+        })
     
-    thread = threading.Thread(target=run_import, daemon=True)
-    thread.start()
-    print(f"🧵 Thread de importação iniciada: {thread.name}")
+    print(f"🔑 Importação de vendas enfileirada para user_id: {user_id} (job {job_id})")
     
     return jsonify({
         'success': True, 
-        'message': 'Importação de vendas iniciada! Acompanhe o progresso na tela.'
+        'message': 'Importação de vendas iniciada! Acompanhe o progresso na tela.',
+        'job_id': job_id
     })
 
 @app.route('/api/vendas/detalhes/<venda_id>')
@@ -2449,20 +2201,34 @@ def webhook_mercadolivre():
             print("❌ Notificação inválida: sem campo 'topic'")
             return jsonify({'status': 'error', 'message': 'Notificação inválida'}), 400
         
-        # Processar notificação usando o sistema universal
-        success = webhook_processor.process_notification(notification_data)
+        # Grava na fila persistente antes de confirmar: sem o 200 o ML reenvia a notificação
+        queue_id = webhook_processor.queue.enfileirar(notification_data)
+        if not queue_id:
+            return jsonify({'status': 'error', 'message': 'Falha ao registrar notificação'}), 500
         
-        if success:
-            print(f"✅ Webhook processado com sucesso: {notification_data.get('topic')}")
-            return jsonify({'status': 'success', 'message': 'Notificação processada com sucesso'}), 200
-        else:
-            print(f"❌ Falha ao processar webhook: {notification_data.get('topic')}")
-            return jsonify({'status': 'error', 'message': 'Falha ao processar notificação'}), 500
+        # Processar no agendador global (classe webhook) e responder na hora:
+        # o ML espera a confirmação em poucos segundos. Se falhar, o webhook_retrier reprocessa
+        try:
+            work_scheduler.submeter(notification_data.get('user_id'), 'webhook',
+                                    processar_webhook_agendado, queue_id, notification_data)
+        except Exception as e:
+            print(f"⚠️ Notificação {queue_id} fica para o reprocessamento: {e}")
+        return jsonify({'status': 'success', 'message': 'Notificação recebida'}), 200
         
     except Exception as e:
         print(f"❌ Erro ao processar webhook: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+def processar_webhook_agendado(queue_id, notification_data):
+    """Processa uma notificação recebida (executado no agendador global)."""
+    success = webhook_processor.process_queued(queue_id, notification_data)
+    
+    if success:
+        print(f"✅ Webhook processado com sucesso: {notification_data.get('topic')}")
+    else:
+        print(f"❌ Falha ao processar webhook: {notification_data.get('topic')}")
+    return success
+
 @app.route('/api/webhook/stats')
 @login_required
 def webhook_stats():
@@ -2935,45 +2701,75 @@ def gerar_pdf_relatorio(analise_data):
         print(f"❌ Erro ao gerar PDF: {e}")
         return gerar_csv_relatorio(analise_data)
 
-if __name__ == '__main__':
+def registrar_loops_background():
+    """Registra na eleição de líder os loops que devem rodar num único processo.
+    
+    Chamada por iniciar_processo() em cada processo: só o líder de cada papel
+    executa o loop, e outro processo assume em segundos se ele cair.
+    """
+    from sync_manager import (inicializar_sync_manager, start_sync_history_compactor, stop_sync_history_compactor,
+                              start_nightly_order_reconciler, stop_nightly_order_reconciler)
+    sync_manager = inicializar_sync_manager()
+    
+    def iniciar_sincronizacao():
+        # Inicializar sincronização para usuários existentes
+        for user_id in db.obter_usuarios_com_tokens():
+            sync_manager.inicializar_sync_usuario(user_id)
+        sync_manager.iniciar_sincronizacao_automatica()
+    
+    leader_election.registrar('sincronizacao_automatica', iniciar_sincronizacao,
+                              sync_manager.parar_sincronizacao_automatica,
+                              estado=sync_manager.obter_metricas_agendamento)
+    leader_election.registrar('monitor_tokens', start_token_monitoring, stop_token_monitoring)
+    leader_election.registrar('limpeza_sessoes', start_session_sweeper, stop_session_sweeper)
+    # Valida consistência entre tabelas de usuários (ao assumir e periodicamente)
+    leader_election.registrar('validacao_consistencia', start_consistency_validator, stop_consistency_validator)
+    # Agrega o histórico de sincronizações por dia e remove execuções antigas
+    leader_election.registrar('compactacao_historico_sync', start_sync_history_compactor, stop_sync_history_compactor)
+    # Confere as vendas dos últimos dias com a API e recupera as ausentes (de madrugada)
+    leader_election.registrar('reconciliacao_noturna_vendas', start_nightly_order_reconciler, stop_nightly_order_reconciler)
+    # Reprocessa notificações de webhook que falharam ou se perderam com a queda de um processo
+    leader_election.registrar('reprocessamento_webhooks', webhook_retrier.start, webhook_retrier.stop)
+
+_processo_iniciado = False
+_processo_lock = threading.Lock()
+
+def iniciar_processo():
+    """Inicialização de cada processo que atende a aplicação (idempotente).
+    
+    Cria as tabelas, inicia o worker de importação e entra na eleição de líder
+    dos loops de background. Chamada no `python app.py` e, sob gunicorn, no
+    hook post_worker_init de gunicorn.conf.py (depois do fork de cada worker).
+    """
+    global _processo_iniciado
+    with _processo_lock:
+        if _processo_iniciado:
+            return
+        _processo_iniciado = True
+    
     # Cria tabelas se não existirem
     db.criar_tabelas()
+    progress_events.criar_tabela()
+    webhook_processor.queue.criar_tabela()
+    login_bootstrap.criar_tabela()
 
-    # Valida consistência entre tabelas de usuários
-    try:
-        resultado = auth_manager.validar_consistencia_todas_tabelas()
-        if resultado['success'] and resultado['inconsistencias_corrigidas'] > 0:
-            print(f"🔧 Validação de consistência: {resultado['inconsistencias_corrigidas']} inconsistências corrigidas")
-        elif resultado['success']:
-            print("✅ Validação de consistência: sistema está consistente")
-        else:
-            print(f"⚠️ Erro na validação de consistência: {resultado.get('message', 'Erro desconhecido')}")
-    except Exception as e:
-        print(f"⚠️ Erro ao executar validação de consistência: {e}")
-
-    # Inicia monitor de tokens automaticamente
+    # Inicia worker da fila de importação (outros processos podem rodar `python importers.py`);
+    # roda em todos os processos: cada job é reivindicado com lease por um único worker
     try:
-        start_token_monitoring()
-        print("🔄 Monitor de tokens iniciado automaticamente")
+        start_import_worker()
     except Exception as e:
-        print(f"⚠️ Erro ao iniciar monitor de tokens: {e}")
-
-    # Inicia sistema de sincronização incremental
+        print(f"⚠️ Erro ao iniciar worker de importação: {e}")
+    
+    # Sincronização automática, monitor de tokens e manutenção: só no processo líder de cada um
     try:
-        from sync_manager import inicializar_sync_manager
-        sync_manager = inicializar_sync_manager()
-        
-        # Inicializar sincronização para usuários existentes
-        usuarios_com_tokens = db.obter_usuarios_com_tokens()
-        for user_id in usuarios_com_tokens:
-            sync_manager.inicializar_sync_usuario(user_id)
-        
-        # Iniciar sincronização automática
-        sync_manager.iniciar_sincronizacao_automatica()
-        print("🔄 Sistema de sincronização incremental iniciado automaticamente")
+        registrar_loops_background()
+        leader_election.iniciar()
     except Exception as e:
-        print(f"⚠️ Erro ao iniciar sistema de sincronização: {e}")
+        print(f"⚠️ Erro ao iniciar loops de background: {e}")
 
+if __name__ == '__main__':
+    iniciar_processo()
+    
     # Obtém porta do ambiente ou usa 3001 como padrão
     port = int(os.getenv('PORT', 3001))
 
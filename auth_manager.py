@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import abc
 import hashlib
 import secrets
 import string
+import threading
+import time
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -297,24 +300,50 @@ class AuthManager:
             conn.close()
     
     def criar_sessao(self, user_id: int, login_type: str, ip_address: str = None, user_agent: str = None) -> str:
-        """Cria nova sessão para o usuário."""
+        """Cria nova sessão para o usuário.
+        
+        Limite de sessões, remoção das mais antigas (ou de todas, no modo de
+        sessão única) e INSERT rodam numa única transação/conexão; as sessões
+        ativas do usuário ficam travadas (SELECT ... FOR UPDATE) até o commit.
+        """
         conn = None
         try:
             from configuracao_sessoes import ConfiguracaoSessoes
             
-            # Verificar se pode criar nova sessão
-            if not self.verificar_limite_sessoes_usuario(user_id):
-                print(f"❌ Limite de sessões excedido para usuário {user_id}")
-                return None
-            
-            # Encerrar sessões antigas se necessário
-            self.encerrar_sessoes_antigas_usuario(user_id)
-            
             conn = self.conectar()
             if not conn:
                 return None
             
+            inicio_lock = time.monotonic()
+            sessoes_removidas = 0
+            
             with conn.cursor() as cursor:
+                if ConfiguracaoSessoes.deve_permitir_multiplas_sessoes():
+                    max_sessoes = ConfiguracaoSessoes.obter_max_sessoes_por_usuario()
+                    
+                    # Trava as sessões ativas do usuário (mais antigas primeiro)
+                    cursor.execute("""
+                        SELECT id FROM sessoes_ativas 
+                        WHERE user_id = %s AND expires_at > NOW()
+                        ORDER BY created_at ASC
+                        FOR UPDATE
+                    """, (user_id,))
+                    sessoes = cursor.fetchall()
+                    
+                    # Abre espaço para a nova sessão removendo as mais antigas
+                    if len(sessoes) >= max_sessoes:
+                        ids_remover = [sessao[0] for sessao in sessoes[:len(sessoes) - max_sessoes + 1]]
+                        placeholders = ', '.join(['%s'] * len(ids_remover))
+                        cursor.execute(
+                            f"DELETE FROM sessoes_ativas WHERE id IN ({placeholders})",
+                            tuple(ids_remover)
+                        )
+                        sessoes_removidas = cursor.rowcount
+                else:
+                    # Sessão única: encerra as anteriores na mesma transação
+                    cursor.execute("DELETE FROM sessoes_ativas WHERE user_id = %s", (user_id,))
+                    sessoes_removidas = cursor.rowcount
+                
                 # Gerar token de sessão
                 session_token = secrets.token_urlsafe(32)
                 
@@ -329,11 +358,15 @@ class AuthManager:
                 """, (user_id, session_token, login_type, expires_at, ip_address, user_agent))
                 
                 conn.commit()
-                print(f"✅ Nova sessão criada para usuário {user_id} (expira em {horas_expiracao}h)")
+                tempo_lock_ms = (time.monotonic() - inicio_lock) * 1000
+                print(f"✅ Nova sessão criada para usuário {user_id} (expira em {horas_expiracao}h, "
+                      f"{sessoes_removidas} sessões antigas removidas, lock {tempo_lock_ms:.1f}ms)")
                 return session_token
                 
         except Exception as e:
             print(f"Erro ao criar sessão: {e}")
+            if conn and conn.is_connected():
+                conn.rollback()
             return None
         finally:
             if conn and conn.is_connected():
@@ -427,80 +460,6 @@ class AuthManager:
         finally:
             conn.close()
     
-    def verificar_limite_sessoes_usuario(self, user_id: int) -> bool:
-        """Verifica se usuário pode criar nova sessão (respeitando limite)"""
-        conn = None
-        try:
-            from configuracao_sessoes import ConfiguracaoSessoes
-            
-            if not ConfiguracaoSessoes.deve_permitir_multiplas_sessoes():
-                return True  # Se não permite múltiplas, sempre pode criar (substitui a anterior)
-            
-            conn = self.conectar()
-            if not conn:
-                return False
-            
-            with conn.cursor() as cursor:
-                cursor.execute("""
-                    SELECT COUNT(*) FROM sessoes_ativas 
-                    WHERE user_id = %s AND expires_at > NOW()
-                """, (user_id,))
-                
-                count = cursor.fetchone()[0]
-                max_sessoes = ConfiguracaoSessoes.obter_max_sessoes_por_usuario()
-                
-                return count < max_sessoes
-                
-        except Exception as e:
-            print(f"Erro ao verificar limite de sessões: {e}")
-            return True  # Em caso de erro, permite criar
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
-    
-    def encerrar_sessoes_antigas_usuario(self, user_id: int):
-        """Encerra sessões antigas do usuário se exceder o limite"""
-        conn = None
-        try:
-            from configuracao_sessoes import ConfiguracaoSessoes
-            
-            if not ConfiguracaoSessoes.deve_permitir_multiplas_sessoes():
-                return  # Se não permite múltiplas, não precisa encerrar antigas
-            
-            conn = self.conectar()
-            if not conn:
-                return
-            
-            max_sessoes = ConfiguracaoSessoes.obter_max_sessoes_por_usuario()
-            
-            with conn.cursor() as cursor:
-                # Buscar sessões ativas ordenadas por data de criação (mais antigas primeiro)
-                cursor.execute("""
-                    SELECT id FROM sessoes_ativas 
-                    WHERE user_id = %s AND expires_at > NOW()
-                    ORDER BY created_at ASC
-                """, (user_id,))
-                
-                sessoes = cursor.fetchall()
-                
-                # Se exceder o limite, remove as mais antigas
-                if len(sessoes) >= max_sessoes:
-                    sessoes_para_remover = sessoes[:len(sessoes) - max_sessoes + 1]
-                    
-                    for sessao_id in sessoes_para_remover:
-                        cursor.execute("""
-                            DELETE FROM sessoes_ativas WHERE id = %s
-                        """, (sessao_id[0],))
-                    
-                    conn.commit()
-                    print(f"Encerradas {len(sessoes_para_remover)} sessões antigas do usuário {user_id}")
-                
-        except Exception as e:
-            print(f"Erro ao encerrar sessões antigas: {e}")
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
-    
     def garantir_consistencia_usuario(self, user_id: int) -> bool:
         """Garante que um usuário tenha entradas consistentes em ambas as tabelas."""
         conn = self.conectar()
@@ -509,40 +468,37 @@ class AuthManager:
         
         try:
             with conn.cursor() as cursor:
-                # Verificar se existe em usuarios_auth
-                cursor.execute("SELECT username, email FROM usuarios_auth WHERE user_id = %s", (user_id,))
-                usuario_auth = cursor.fetchone()
-                
-                # Verificar se existe em user_info
-                cursor.execute("SELECT nickname, first_name, email FROM user_info WHERE user_id = %s", (user_id,))
-                usuario_info = cursor.fetchone()
+                # Cria a entrada em user_info a partir de usuarios_auth numa única instrução
+                cursor.execute("""
+                    INSERT INTO user_info (user_id, nickname, first_name, email, status)
+                    SELECT ua.user_id, ua.username, ua.username, ua.email, 'active'
+                    FROM usuarios_auth ua
+                    WHERE ua.user_id = %s
+                    AND NOT EXISTS (SELECT 1 FROM user_info ui WHERE ui.user_id = ua.user_id)
+                    ORDER BY ua.id
+                    LIMIT 1
+                """, (user_id,))
+                criado = cursor.rowcount > 0
+                conn.commit()
                 
-                if usuario_auth and not usuario_info:
-                    # Existe em auth mas não em info - criar entrada em info
-                    username, email = usuario_auth
-                    cursor.execute("""
-                        INSERT INTO user_info (user_id, nickname, first_name, email, status)
-                        VALUES (%s, %s, %s, %s, %s)
-                    """, (user_id, username, username, email, 'active'))
+                if criado:
                     print(f"✅ Criada entrada em user_info para user_id {user_id} (via OAuth)")
-                    conn.commit()
                     return True
                 
-                elif usuario_info and not usuario_auth:
-                    # Existe em info mas não em auth - não criar entrada em auth automaticamente
-                    # pois isso requer senha que não temos no OAuth
-                    print(f"ℹ️ Usuário {user_id} existe apenas em user_info (login OAuth)")
-                    return True
-                
-                elif usuario_auth and usuario_info:
-                    # Existe em ambas - tudo ok
-                    print(f"✅ Usuário {user_id} tem entradas consistentes em ambas as tabelas")
+                cursor.execute("""
+                    SELECT
+                        EXISTS(SELECT 1 FROM user_info WHERE user_id = %s),
+                        EXISTS(SELECT 1 FROM usuarios_auth WHERE user_id = %s),
+                        EXISTS(SELECT 1 FROM tokens WHERE user_id = %s)
+                """, (user_id, user_id, user_id))
+                tem_info, tem_auth, tem_tokens = cursor.fetchone()
+                
+                if tem_info or tem_auth or tem_tokens:
                     return True
                 
-                else:
-                    # Não existe em nenhuma - isso não deveria acontecer
-                    print(f"⚠️ Usuário {user_id} não encontrado em nenhuma tabela")
-                    return False
+                # Não existe em nenhuma - isso não deveria acontecer
+                print(f"⚠️ Usuário {user_id} não encontrado em nenhuma tabela")
+                return False
                 
         except Exception as e:
             print(f"Erro ao garantir consistência do usuário {user_id}: {e}")
@@ -550,8 +506,101 @@ class AuthManager:
         finally:
             conn.close()
     
+    # Remoção de duplicados (destrutiva): só com CONSISTENCIA_REMOVER_DUPLICADOS=true;
+    # sem a flag os duplicados são apenas reportados
+    REMOVER_DUPLICADOS = os.getenv('CONSISTENCIA_REMOVER_DUPLICADOS', 'false').lower() == 'true'
+    CORRECOES_DUPLICADOS = [
+        ('user_info_duplicados',
+         "Entradas duplicadas em user_info removidas (mantida a mais recente)",
+         """
+            DELETE ui FROM user_info ui
+            JOIN user_info recente ON recente.user_id = ui.user_id AND recente.id > ui.id
+         """),
+        ('tokens_duplicados',
+         "Tokens duplicados removidos (mantido o mais recente)",
+         """
+            DELETE t FROM tokens t
+            JOIN tokens recente ON recente.user_id = t.user_id AND recente.id > t.id
+         """),
+    ]
+    
+    # Correções aplicadas por validar_consistencia_todas_tabelas, na ordem de execução.
+    # Cada uma é uma única instrução baseada em anti-join, independente do número de usuários.
+    CORRECOES_CONSISTENCIA = [
+        ('auth_sem_info',
+         "Entradas criadas em user_info para usuários de usuarios_auth",
+         """
+            INSERT INTO user_info (user_id, nickname, first_name, email, status)
+            SELECT ua.user_id, MIN(ua.username), MIN(ua.username), MIN(ua.email), 'active'
+            FROM usuarios_auth ua
+            LEFT JOIN user_info ui ON ui.user_id = ua.user_id
+            WHERE ui.user_id IS NULL
+            GROUP BY ua.user_id
+         """),
+        ('tokens_sem_info',
+         "Entradas criadas em user_info para usuários com tokens",
+         """
+            INSERT INTO user_info (user_id, status)
+            SELECT DISTINCT t.user_id, 'active'
+            FROM tokens t
+            LEFT JOIN user_info ui ON ui.user_id = t.user_id
+            WHERE ui.user_id IS NULL AND t.user_id IS NOT NULL
+         """),
+        ('sessoes_orfas',
+         "Sessões de usuários inexistentes encerradas",
+         """
+            DELETE s FROM sessoes_ativas s
+            LEFT JOIN user_info ui ON ui.user_id = s.user_id
+            WHERE ui.user_id IS NULL
+         """),
+    ]
+    
+    # Inconsistências apenas reportadas: exigem ação manual
+    VERIFICACOES_CONSISTENCIA = [
+        ('user_info_duplicados',
+         "usuários com entradas duplicadas em user_info",
+         """
+            SELECT COUNT(*), GROUP_CONCAT(user_id ORDER BY user_id SEPARATOR ', ')
+            FROM (SELECT user_id FROM user_info GROUP BY user_id HAVING COUNT(*) > 1) duplicados
+         """),
+        ('tokens_duplicados',
+         "usuários com tokens duplicados",
+         """
+            SELECT COUNT(*), GROUP_CONCAT(user_id ORDER BY user_id SEPARATOR ', ')
+            FROM (SELECT user_id FROM tokens GROUP BY user_id HAVING COUNT(*) > 1) duplicados
+         """),
+        ('info_sem_auth',
+         "usuários existem apenas em user_info - requerem criação manual de conta",
+         """
+            SELECT COUNT(*), GROUP_CONCAT(user_id ORDER BY user_id SEPARATOR ', ')
+            FROM (
+                SELECT DISTINCT ui.user_id
+                FROM user_info ui
+                LEFT JOIN usuarios_auth ua ON ua.user_id = ui.user_id
+                WHERE ua.user_id IS NULL
+            ) orfaos
+         """),
+        ('info_sem_credenciais',
+         "usuários em user_info sem tokens nem conta - não conseguem mais acessar",
+         """
+            SELECT COUNT(*), GROUP_CONCAT(user_id ORDER BY user_id SEPARATOR ', ')
+            FROM (
+                SELECT DISTINCT ui.user_id
+                FROM user_info ui
+                LEFT JOIN usuarios_auth ua ON ua.user_id = ui.user_id
+                LEFT JOIN tokens t ON t.user_id = ui.user_id
+                WHERE ua.user_id IS NULL AND t.user_id IS NULL
+            ) orfaos
+         """),
+    ]
+    
     def validar_consistencia_todas_tabelas(self) -> Dict[str, Any]:
-        """Valida e corrige inconsistências entre todas as tabelas de usuários."""
+        """Valida e corrige inconsistências entre tokens, user_info, usuarios_auth e sessoes_ativas.
+        
+        Todas as verificações são consultas em conjunto (anti-joins), executadas numa
+        única transação; o custo não cresce com o número de chamadas por usuário.
+        Duplicados só são removidos com REMOVER_DUPLICADOS; sem a flag são reportados.
+        """
         conn = self.conectar()
         if not conn:
             return {'success': False, 'message': 'Erro de conexão'}
@@ -560,50 +609,49 @@ class AuthManager:
             'success': True,
             'inconsistencias_encontradas': 0,
             'inconsistencias_corrigidas': 0,
-            'detalhes': []
+            'verificacoes': {},
+            'detalhes': [],
+            'tempo_ms': 0.0
         }
+        inicio = time.monotonic()
         
         try:
             with conn.cursor() as cursor:
-                # 1. Usuários em auth mas não em info
-                cursor.execute("""
-                    SELECT ua.user_id, ua.username, ua.email
-                    FROM usuarios_auth ua
-                    LEFT JOIN user_info ui ON ua.user_id = ui.user_id
-                    WHERE ui.user_id IS NULL
-                """)
-                
-                usuarios_sem_info = cursor.fetchall()
-                for user_id, username, email in usuarios_sem_info:
-                    resultado['inconsistencias_encontradas'] += 1
-                    cursor.execute("""
-                        INSERT INTO user_info (user_id, nickname, first_name, email, status)
-                        VALUES (%s, %s, %s, %s, %s)
-                    """, (user_id, username, username, email, 'active'))
-                    resultado['inconsistencias_corrigidas'] += 1
-                    resultado['detalhes'].append(f"Criada entrada em user_info para user_id {user_id} ({username})")
-                
-                # 2. Usuários em info mas não em auth (apenas reportar, não corrigir automaticamente)
-                cursor.execute("""
-                    SELECT ui.user_id, ui.nickname, ui.email
-                    FROM user_info ui
-                    LEFT JOIN usuarios_auth ua ON ui.user_id = ua.user_id
-                    WHERE ua.user_id IS NULL
-                """)
-                
-                usuarios_sem_auth = cursor.fetchall()
-                for user_id, nickname, email in usuarios_sem_auth:
-                    resultado['inconsistencias_encontradas'] += 1
-                    resultado['detalhes'].append(f"Usuário {user_id} ({nickname}) existe apenas em user_info - requer criação manual de conta")
+                correcoes = (self.CORRECOES_DUPLICADOS if self.REMOVER_DUPLICADOS else []) + self.CORRECOES_CONSISTENCIA
+                for nome, descricao, sql in correcoes:
+                    # A própria correção encontra as linhas: o rowcount é o total corrigido
+                    cursor.execute(sql)
+                    afetadas = max(cursor.rowcount, 0)
+                    
+                    resultado['verificacoes'][nome] = {'encontradas': afetadas, 'corrigidas': afetadas}
+                    resultado['inconsistencias_encontradas'] += afetadas
+                    resultado['inconsistencias_corrigidas'] += afetadas
+                    if afetadas:
+                        resultado['detalhes'].append(f"{descricao}: {afetadas}")
+                
+                for nome, descricao, sql in self.VERIFICACOES_CONSISTENCIA:
+                    if nome in resultado['verificacoes']:
+                        continue  # Já corrigida acima
+                    cursor.execute(sql)
+                    quantidade, amostra = cursor.fetchone()
+                    quantidade = quantidade or 0
+                    
+                    resultado['verificacoes'][nome] = {'encontradas': quantidade, 'corrigidas': 0}
+                    resultado['inconsistencias_encontradas'] += quantidade
+                    if quantidade:
+                        resultado['detalhes'].append(f"{quantidade} {descricao} ({amostra})")
                 
                 conn.commit()
-                
-                if resultado['inconsistencias_corrigidas'] > 0:
-                    print(f"✅ Validação concluída: {resultado['inconsistencias_corrigidas']} inconsistências corrigidas")
-                
-                return resultado
+            
+            resultado['tempo_ms'] = (time.monotonic() - inicio) * 1000
+            if resultado['inconsistencias_corrigidas'] > 0:
+                print(f"✅ Validação concluída: {resultado['inconsistencias_corrigidas']} inconsistências corrigidas "
+                      f"em {resultado['tempo_ms']:.1f}ms")
+            
+            return resultado
                 
         except Exception as e:
+            conn.rollback()
             resultado['success'] = False
             resultado['message'] = f"Erro na validação: {e}"
             print(f"Erro ao validar consistência: {e}")
@@ -611,22 +659,192 @@ class AuthManager:
         finally:
             conn.close()
     
-    def limpar_sessoes_expiradas(self):
-        """Remove sessões expiradas do banco."""
+    def limpar_sessoes_expiradas(self, tamanho_lote: int = None) -> Dict[str, Any]:
+        """Remove sessões e códigos de verificação expirados em lotes limitados.
+        
+        Cada lote é um DELETE ... ORDER BY expires_at LIMIT n com commit próprio,
+        usando o índice idx_expires_at, para não segurar locks longos nas tabelas.
+        """
+        from configuracao_sessoes import ConfiguracaoSessoes
+        
+        if not tamanho_lote:
+            tamanho_lote = ConfiguracaoSessoes.obter_tamanho_lote_limpeza()
+        
+        resultado = {
+            'success': True,
+            'sessoes_removidas': 0,
+            'codigos_removidos': 0,
+            'lotes': 0,
+            'tempo_lock_ms': 0.0
+        }
+        
         conn = self.conectar()
         if not conn:
-            return
+            resultado['success'] = False
+            return resultado
+        
+        tabelas = [
+            ('sessoes_ativas', 'sessoes_removidas'),
+            ('codigos_verificacao', 'codigos_removidos'),
+        ]
         
         try:
             with conn.cursor() as cursor:
-                cursor.execute("""
-                    DELETE FROM sessoes_ativas 
-                    WHERE expires_at <= NOW()
-                """)
-                
-                conn.commit()
+                for tabela, chave in tabelas:
+                    while True:
+                        inicio_lock = time.monotonic()
+                        cursor.execute(f"""
+                            DELETE FROM {tabela} 
+                            WHERE expires_at <= NOW()
+                            ORDER BY expires_at
+                            LIMIT %s
+                        """, (tamanho_lote,))
+                        removidas = cursor.rowcount
+                        conn.commit()
+                        resultado['tempo_lock_ms'] += (time.monotonic() - inicio_lock) * 1000
+                        
+                        if removidas <= 0:
+                            break
+                        
+                        resultado[chave] += removidas
+                        resultado['lotes'] += 1
+                        
+                        if removidas < tamanho_lote:
+                            break
+            
+            return resultado
                 
         except Exception as e:
             print(f"Erro ao limpar sessões expiradas: {e}")
+            resultado['success'] = False
+            resultado['message'] = str(e)
+            return resultado
         finally:
             conn.close()
+
+
+class MaintenanceJob(abc.ABC):
+    """Tarefa de manutenção executada periodicamente em background"""
+    
+    nome = 'manutenção'
+    
+    def __init__(self, auth_manager: AuthManager = None):
+        self.auth_manager = auth_manager or AuthManager()
+        self.running = False
+        self.job_thread = None
+        self._stop_event = threading.Event()
+        self.ultimo_resultado = None
+    
+    def start(self):
+        """Inicia a tarefa em background"""
+        if self.running:
+            print(f"⚠️ Tarefa de {self.nome} já está rodando")
+            return
+        
+        if self.job_thread and self.job_thread.is_alive():
+            # stop() não espera a rodada em curso: o loop antigo termina antes de o novo começar
+            print(f"⏳ Aguardando a rodada anterior de {self.nome} terminar")
+            self.job_thread.join()
+        
+        self.running = True
+        self._stop_event.clear()
+        self.job_thread = threading.Thread(target=self._job_loop, daemon=True)
+        self.job_thread.start()
+        print(f"🧹 Tarefa automática de {self.nome} iniciada")
+    
+    def stop(self):
+        """Para a tarefa em background"""
+        self.running = False
+        self._stop_event.set()
+        if self.job_thread and self.job_thread.is_alive():
+            self.job_thread.join(timeout=5)
+        print(f"⏹️ Tarefa automática de {self.nome} parada")
+    
+    def executar(self) -> Dict[str, Any]:
+        """Executa uma rodada da tarefa e registra o resultado"""
+        resultado = self._executar()
+        resultado['executado_em'] = datetime.now()
+        self.ultimo_resultado = resultado
+        return resultado
+    
+    @abc.abstractmethod
+    def _executar(self) -> Dict[str, Any]:
+        """Executa uma rodada da tarefa"""
+    
+    @abc.abstractmethod
+    def _intervalo_segundos(self) -> float:
+        """Intervalo entre rodadas, em segundos"""
+    
+    def _job_loop(self):
+        """Loop principal da tarefa"""
+        while self.running:
+            try:
+                self.executar()
+            except Exception as e:
+                print(f"❌ Erro na tarefa de {self.nome}: {e}")
+            
+            if self._stop_event.wait(self._intervalo_segundos()):
+                break
+
+
+class SessionSweeper(MaintenanceJob):
+    """Limpeza periódica de sessões e códigos de verificação expirados"""
+    
+    nome = 'limpeza de sessões'
+    
+    def _executar(self) -> Dict[str, Any]:
+        resultado = self.auth_manager.limpar_sessoes_expiradas()
+        
+        if resultado['sessoes_removidas'] or resultado['codigos_removidos']:
+            print(f"🧹 Limpeza: {resultado['sessoes_removidas']} sessões e "
+                  f"{resultado['codigos_removidos']} códigos expirados removidos "
+                  f"em {resultado['lotes']} lotes (lock {resultado['tempo_lock_ms']:.1f}ms)")
+        return resultado
+    
+    def _intervalo_segundos(self) -> float:
+        from configuracao_sessoes import ConfiguracaoSessoes
+        return ConfiguracaoSessoes.obter_intervalo_limpeza_minutos() * 60
+
+
+class ConsistencyValidator(MaintenanceJob):
+    """Validação periódica de consistência entre as tabelas de usuários"""
+    
+    nome = 'validação de consistência'
+    
+    def _executar(self) -> Dict[str, Any]:
+        resultado = self.auth_manager.validar_consistencia_todas_tabelas()
+        
+        if not resultado['success']:
+            print(f"⚠️ Erro na validação de consistência: {resultado.get('message', 'Erro desconhecido')}")
+        elif resultado['inconsistencias_encontradas'] > 0:
+            print(f"🔧 Validação de consistência: {resultado['inconsistencias_encontradas']} encontradas, "
+                  f"{resultado['inconsistencias_corrigidas']} corrigidas")
+            for detalhe in resultado['detalhes']:
+                print(f"   - {detalhe}")
+        else:
+            print("✅ Validação de consistência: sistema está consistente")
+        return resultado
+    
+    def _intervalo_segundos(self) -> float:
+        from configuracao_sessoes import ConfiguracaoSessoes
+        return ConfiguracaoSessoes.obter_intervalo_consistencia_minutos() * 60
+
+# Instâncias globais das tarefas de manutenção
+session_sweeper = SessionSweeper()
+consistency_validator = ConsistencyValidator()
+
+def start_session_sweeper():
+    """Inicia a limpeza periódica de sessões expiradas"""
+    session_sweeper.start()
+
+def stop_session_sweeper():
+    """Para a limpeza periódica de sessões expiradas"""
+    session_sweeper.stop()
+
+def start_consistency_validator():
+    """Inicia a validação periódica de consistência entre tabelas"""
+    consistency_validator.start()
+
+def stop_consistency_validator():
+    """Para a validação periódica de consistência entre tabelas"""
+    consistency_validator.stop()
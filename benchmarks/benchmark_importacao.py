@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Benchmark da Importação
+Executa a importação de produtos e de vendas de ponta a ponta (fila de jobs,
+pipeline, gravação) contra o servidor falso da API e um banco MySQL
+descartável, e reporta vazão, requisições e instruções SQL por entidade e
+pico de memória
+
+Uso:
+    python benchmarks/benchmark_importacao.py --anuncios 2000 --pedidos 20000 --latencia-ms 80
+
+O MySQL é o das variáveis DB_HOST/DB_USER/DB_PASSWORD; o banco de nome
+--banco é criado do zero e removido ao final (a menos de --manter-banco).
+As contagens de instruções SQL vêm dos contadores globais do servidor, então
+use um MySQL sem outros clientes para números confiáveis.
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import subprocess
+from datetime import datetime
+from typing import Dict, Any
+
+DIRETORIO_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIRETORIO_BENCHMARKS))
+
+# Contadores globais do MySQL lidos antes e depois de cada fase
+CONTADORES_SQL = ('Questions', 'Com_select', 'Com_insert', 'Com_update', 'Com_delete', 'Com_commit')
+
+
+def iniciar_servidor_fake(args) -> subprocess.Popen:
+    """Inicia o servidor falso em outro processo (não disputa o GIL com a importação)"""
+    comando = [
+        sys.executable, os.path.join(DIRETORIO_BENCHMARKS, 'fake_meli_server.py'),
+        '--seller-id', str(args.seller_id),
+        '--anuncios', str(args.anuncios),
+        '--pedidos', str(args.pedidos),
+        '--latencia-ms', str(args.latencia_ms),
+        '--distribuicao', args.distribuicao,
+        '--taxa-429', str(args.taxa_429),
+        '--retry-after', str(args.retry_after),
+        '--limite-offset', str(args.limite_offset),
+        '--semente', str(args.semente)
+    ]
+    processo = subprocess.Popen(comando, stdout=subprocess.PIPE, text=True)
+    os.environ['MELI_API_BASE_URL'] = processo.stdout.readline().strip()
+    return processo
+
+
+def preparar_banco(nome_banco: str):
+    """Recria o banco descartável e aponta a aplicação para ele"""
+    import mysql.connector
+    from dotenv import load_dotenv
+    load_dotenv()
+    
+    conn = mysql.connector.connect(
+        host=os.getenv('DB_HOST'), user=os.getenv('DB_USER'), password=os.getenv('DB_PASSWORD')
+    )
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP DATABASE IF EXISTS `{nome_banco}`")
+            cursor.execute(f"CREATE DATABASE `{nome_banco}` CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci")
+    finally:
+        conn.close()
+    os.environ['DB_NAME'] = nome_banco
+
+
+def remover_banco(nome_banco: str):
+    import mysql.connector
+    conn = mysql.connector.connect(
+        host=os.getenv('DB_HOST'), user=os.getenv('DB_USER'), password=os.getenv('DB_PASSWORD')
+    )
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP DATABASE IF EXISTS `{nome_banco}`")
+    finally:
+        conn.close()
+
+
+def ler_contadores_sql(db) -> Dict[str, int]:
+    conn = db.conectar()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SHOW GLOBAL STATUS WHERE Variable_name IN ({})".format(
+                ', '.join(['%s'] * len(CONTADORES_SQL))), CONTADORES_SQL)
+            return {nome: int(valor) for nome, valor in cursor.fetchall()}
+    finally:
+        conn.close()
+
+
+def ler_estatisticas_fake(reiniciar: bool = False) -> Dict[str, Any]:
+    import requests
+    base_url = os.environ['MELI_API_BASE_URL']
+    if reiniciar:
+        requests.get(f"{base_url}/_fake/reset", timeout=5)
+    return requests.get(f"{base_url}/_fake/stats", timeout=5).json()
+
+
+def pico_rss_mb() -> float:
+    # ru_maxrss em KB no Linux (bytes no macOS)
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+
+def executar_fase(tipo: str, user_id: int, db) -> Dict[str, Any]:
+    """Enfileira o job e o executa neste processo pelo mesmo caminho do worker"""
+    from import_jobs import import_job_queue, ImportJob, ImportWorker
+    from importers import HANDLERS_IMPORTACAO
+    
+    ler_estatisticas_fake(reiniciar=True)
+    sql_antes = ler_contadores_sql(db)
+    inicio = time.perf_counter()
+    
+    job_id, _ = import_job_queue.enfileirar(user_id, tipo, retomar=False)
+    dados = import_job_queue.reivindicar('benchmark')
+    if not dados or dados['id'] != job_id:
+        raise RuntimeError(f"Não foi possível reivindicar o job de {tipo}")
+    job = ImportJob(import_job_queue, dados)
+    ImportWorker(HANDLERS_IMPORTACAO, import_job_queue, num_threads=1)._executar(job)
+    
+    duracao = time.perf_counter() - inicio
+    sql_depois = ler_contadores_sql(db)
+    api = ler_estatisticas_fake()
+    
+    entidades = job.estado['sucesso'] + job.estado['ignorados']
+    por_entidade = (lambda valor: round(valor / entidades, 2)) if entidades else (lambda valor: None)
+    instrucoes = {nome: sql_depois[nome] - sql_antes.get(nome, 0) for nome in sql_depois}
+    
+    return {
+        'tipo': tipo,
+        'status': job.estado['status'],
+        'entidades': entidades,
+        'erros': job.estado['erros'],
+        'segundos': round(duracao, 2),
+        'entidades_por_segundo': round(entidades / duracao, 1) if duracao else None,
+        'requisicoes': api['total'],
+        'requisicoes_por_entidade': por_entidade(api['total']),
+        'requisicoes_por_endpoint': api['requisicoes'],
+        'respostas_429': api['respostas_429'],
+        'instrucoes_sql': instrucoes,
+        'instrucoes_sql_por_entidade': por_entidade(instrucoes.get('Questions', 0)),
+        'pico_rss_mb': round(pico_rss_mb(), 1)
+    }
+
+
+def imprimir_resultado(resultado: Dict[str, Any]):
+    unidade = 'anúncios/s' if resultado['tipo'] == 'produtos' else 'pedidos/s'
+    print(f"\n📊 Importação de {resultado['tipo']}: {resultado['status']}")
+    print(f"   {resultado['entidades']} entidades em {resultado['segundos']}s "
+          f"→ {resultado['entidades_por_segundo']} {unidade}")
+    print(f"   Requisições: {resultado['requisicoes']} ({resultado['requisicoes_por_entidade']} por entidade, "
+          f"{resultado['respostas_429']} respostas 429)")
+    for endpoint, total in sorted(resultado['requisicoes_por_endpoint'].items()):
+        print(f"      {endpoint}: {total}")
+    print(f"   Instruções SQL: {resultado['instrucoes_sql'].get('Questions', 0)} "
+          f"({resultado['instrucoes_sql_por_entidade']} por entidade)")
+    print(f"      {', '.join(f'{nome}={valor}' for nome, valor in resultado['instrucoes_sql'].items() if nome != 'Questions')}")
+    print(f"   Pico de RSS: {resultado['pico_rss_mb']} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark da importação contra a API falsa')
+    parser.add_argument('--anuncios', type=int, default=1000)
+    parser.add_argument('--pedidos', type=int, default=5000)
+    parser.add_argument('--seller-id', type=int, default=123456789)
+    parser.add_argument('--latencia-ms', type=float, default=50.0)
+    parser.add_argument('--distribuicao', choices=['fixa', 'uniforme', 'lognormal'], default='lognormal')
+    parser.add_argument('--taxa-429', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=float, default=0.5)
+    parser.add_argument('--limite-offset', type=int, default=10000)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--fases', default='produtos,vendas', help='Fases a executar, em ordem')
+    parser.add_argument('--banco', default='ml_benchmark', help='Banco descartável (recriado do zero)')
+    parser.add_argument('--manter-banco', action='store_true')
+    parser.add_argument('--json', help='Grava os resultados neste arquivo')
+    args = parser.parse_args()
+    
+    # Sem limitador artificial por padrão: o que se mede é o pipeline
+    os.environ.setdefault('MELI_RATE_LIMIT_RPS', '1000')
+    os.environ.setdefault('MELI_RATE_LIMIT_BURST', '1000')
+    
+    servidor = iniciar_servidor_fake(args)
+    preparar_banco(args.banco)
+    try:
+        # Importados só agora: os módulos leem a URL da API e o banco ao carregar
+        from database import DatabaseManager
+        from import_jobs import import_job_queue
+        from progress_events import progress_events
+        
+        db = DatabaseManager()
+        db.criar_tabelas()
+        import_job_queue.criar_tabela()
+        progress_events.criar_tabela()
+        
+        conn = db.conectar()
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO tokens (access_token, token_type, expires_in, scope, user_id, refresh_token)
+                VALUES (%s, 'Bearer', %s, 'offline_access read write', %s, %s)
+            """, ('APP_USR-benchmark', 10 ** 7, args.seller_id, 'TG-benchmark'))
+        conn.commit()
+        conn.close()
+        
+        print(f"🏁 Benchmark: {args.anuncios} anúncios, {args.pedidos} pedidos, "
+              f"latência {args.latencia_ms}ms ({args.distribuicao}), 429 em {args.taxa_429:.0%}")
+        
+        resultados = []
+        for tipo in [fase.strip() for fase in args.fases.split(',') if fase.strip()]:
+            resultado = executar_fase(tipo, args.seller_id, db)
+            imprimir_resultado(resultado)
+            resultados.append(resultado)
+        
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as arquivo:
+                json.dump({
+                    'executado_em': datetime.now().isoformat(timespec='seconds'),
+                    'parametros': vars(args),
+                    'resultados': resultados
+                }, arquivo, ensure_ascii=False, indent=2)
+            print(f"\n💾 Resultados gravados em {args.json}")
+    finally:
+        servidor.terminate()
+        servidor.wait(timeout=10)
+        if not args.manter_banco:
+            remover_banco(args.banco)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,541 @@
+#!/usr/bin/env python3
+"""
+Servidor Falso da API do Mercado Livre
+Atende os endpoints usados pela importação de produtos e vendas com dados
+gerados a partir de uma semente, latência configurável, injeção de 429 e os
+limites de paginação da API real. Usado pelos benchmarks via MELI_API_BASE_URL
+"""
+
+import json
+import random
+import re
+import threading
+import time
+import uuid
+import argparse
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Optional, Any, Tuple
+from urllib.parse import urlsplit, parse_qs
+
+FUSO_ML = timezone(timedelta(hours=-3))
+
+class ConfiguracaoFake:
+    """Tamanho do vendedor e comportamento da API simulada"""
+    
+    def __init__(self, seller_id: int = 123456789, anuncios: int = 1000, pedidos: int = 5000,
+                 dias_historico: int = 365, latencia_ms: float = 0.0, distribuicao: str = 'fixa',
+                 taxa_429: float = 0.0, retry_after: float = 0.5, limite_offset: int = 10000,
+                 limite_pagina_pedidos: int = 51, limite_pagina_scan: int = 100,
+                 scroll_ttl_segundos: float = 300.0, semente: int = 42):
+        self.seller_id = seller_id
+        self.anuncios = anuncios
+        self.pedidos = pedidos
+        self.dias_historico = dias_historico
+        self.latencia_ms = latencia_ms
+        self.distribuicao = distribuicao  # fixa, uniforme (0..2x) ou lognormal (cauda longa)
+        self.taxa_429 = taxa_429
+        self.retry_after = retry_after
+        self.limite_offset = limite_offset
+        self.limite_pagina_pedidos = limite_pagina_pedidos
+        self.limite_pagina_scan = limite_pagina_scan
+        self.scroll_ttl_segundos = scroll_ttl_segundos
+        self.semente = semente
+
+
+class VendedorFake:
+    """Dados do vendedor simulado (gerados uma vez, determinísticos pela semente)"""
+    
+    def __init__(self, config: ConfiguracaoFake):
+        self.config = config
+        aleatorio = random.Random(config.semente)
+        
+        self.itens = {}
+        self.agora = datetime.now(FUSO_ML).replace(microsecond=0)
+        for indice in range(config.anuncios):
+            mlb = f"MLB{1000000000 + indice}"
+            self.itens[mlb] = self._gerar_item(aleatorio, mlb, indice)
+        self.ids_itens = list(self.itens)
+        self.ids_por_atualizacao = sorted(self.ids_itens, key=lambda mlb: self.itens[mlb]['last_updated'], reverse=True)
+        
+        # Pedidos em ordem de criação, espalhados pelo histórico
+        agora = datetime.now(FUSO_ML).replace(microsecond=0)
+        inicio = agora - timedelta(days=config.dias_historico)
+        passo = (agora - inicio) / max(1, config.pedidos)
+        self.pedidos = {}
+        for indice in range(config.pedidos):
+            criado = inicio + passo * indice
+            pedido = self._gerar_pedido(aleatorio, 2000000000 + indice, criado)
+            self.pedidos[pedido['id']] = pedido
+        self.pedidos_ordenados = sorted(self.pedidos.values(), key=lambda p: p['_criado'])
+    
+    def _gerar_item(self, aleatorio: random.Random, mlb: str, indice: int) -> Dict[str, Any]:
+        preco = round(aleatorio.uniform(19.9, 899.9), 2)
+        variacoes = [
+            {
+                'id': int(f"{indice}{v}") + 170000000000,
+                'price': preco,
+                'available_quantity': aleatorio.randint(0, 50),
+                'sold_quantity': aleatorio.randint(0, 500),
+                'attribute_combinations': [{'id': 'COLOR', 'name': 'Cor', 'value_name': cor}],
+                'attributes': [{'id': 'SELLER_SKU', 'value_name': f"SKU-{indice}-{v}"}],
+                'picture_ids': []
+            }
+            for v, cor in enumerate(aleatorio.sample(['Preto', 'Branco', 'Azul', 'Vermelho'], aleatorio.randint(0, 3)))
+        ]
+        return {
+            'id': mlb,
+            'title': f"Produto de teste {indice}",
+            'price': preco,
+            'currency_id': 'BRL',
+            'available_quantity': aleatorio.randint(0, 200),
+            'sold_quantity': aleatorio.randint(0, 2000),
+            'status': aleatorio.choice(['active', 'active', 'active', 'paused']),
+            'listing_type_id': aleatorio.choice(['gold_special', 'gold_pro']),
+            'category_id': aleatorio.choice(['MLB1055', 'MLB1276', 'MLB1574', 'MLB5726']),
+            'permalink': f"https://produto.mercadolivre.com.br/{mlb[:3]}-{mlb[3:]}-produto-de-teste-_JM",
+            'thumbnail': f"http://http2.mlstatic.com/D_{mlb}-I.jpg",
+            'seller_id': self.config.seller_id,
+            'seller_custom_field': f"SKU-{indice}",
+            'shipping': {'free_shipping': preco >= 79, 'mode': 'me2', 'logistic_type': 'drop_off'},
+            'attributes': [
+                {'id': 'BRAND', 'name': 'Marca', 'value_name': 'Genérica'},
+                {'id': 'SELLER_SKU', 'name': 'SKU', 'value_name': f"SKU-{indice}"}
+            ],
+            'variations': [{'id': v['id']} for v in variacoes],
+            # Espalhado pelo histórico sem consumir o gerador (pedidos iguais para a mesma semente)
+            'last_updated': (self.agora - timedelta(
+                minutes=(indice * 7919) % (self.config.dias_historico * 1440)
+            )).isoformat(timespec='milliseconds'),
+            '_variacoes': variacoes
+        }
+    
+    def _gerar_pedido(self, aleatorio: random.Random, order_id: int, criado: datetime) -> Dict[str, Any]:
+        itens = []
+        for mlb in aleatorio.sample(self.ids_itens, min(len(self.ids_itens), aleatorio.choice([1, 1, 1, 2, 3]))):
+            item = self.itens[mlb]
+            quantidade = aleatorio.randint(1, 3)
+            itens.append({
+                'item': {
+                    'id': mlb,
+                    'title': item['title'],
+                    'category_id': item['category_id'],
+                    'seller_sku': item['seller_custom_field'],
+                    'variation_id': None,
+                    'variation_attributes': []
+                },
+                'quantity': quantidade,
+                'unit_price': item['price'],
+                'full_unit_price': item['price'],
+                'currency_id': 'BRL',
+                'sale_fee': round(item['price'] * 0.16, 2),
+                'listing_type_id': item['listing_type_id']
+            })
+        
+        total = round(sum(i['unit_price'] * i['quantity'] for i in itens), 2)
+        frete = round(aleatorio.uniform(15, 45), 2)
+        atualizado = criado + timedelta(hours=aleatorio.randint(1, 96))
+        data_criacao = criado.isoformat(timespec='milliseconds')
+        return {
+            'id': order_id,
+            'status': aleatorio.choice(['paid', 'paid', 'paid', 'cancelled']),
+            'date_created': data_criacao,
+            'date_closed': data_criacao,
+            'last_updated': atualizado.isoformat(timespec='milliseconds'),
+            'total_amount': total,
+            'paid_amount': round(total + frete, 2),
+            'currency_id': 'BRL',
+            'pack_id': order_id + 1000000000 if aleatorio.random() < 0.1 else None,
+            'tags': ['paid', 'delivered'],
+            'buyer': {
+                'id': aleatorio.randint(100000, 999999999),
+                'nickname': f"COMPRADOR{order_id}",
+                'first_name': 'Comprador',
+                'last_name': 'Teste'
+            },
+            'seller': {'id': self.config.seller_id},
+            'order_items': itens,
+            'payments': [{
+                'id': order_id + 5000000000,
+                'status': 'approved',
+                'payment_method_id': aleatorio.choice(['pix', 'master', 'visa', 'bolbradesco']),
+                'payment_type': 'credit_card',
+                'transaction_amount': total,
+                'total_paid_amount': round(total + frete, 2),
+                'shipping_cost': frete,
+                'installments': aleatorio.choice([1, 1, 3, 6]),
+                'date_approved': data_criacao
+            }],
+            'shipping': {'id': order_id + 4000000000},
+            '_criado': criado,
+            '_frete': frete
+        }
+    
+    @staticmethod
+    def publico(dados: Dict[str, Any]) -> Dict[str, Any]:
+        """Remove os campos internos ('_') antes de responder"""
+        return {chave: valor for chave, valor in dados.items() if not chave.startswith('_')}
+
+
+class EstadoFake:
+    """Estado mutável do servidor: scrolls abertos e contadores de requisições"""
+    
+    def __init__(self, config: ConfiguracaoFake):
+        self.config = config
+        self.vendedor = VendedorFake(config)
+        self.aleatorio = random.Random(config.semente + 1)
+        self.lock = threading.Lock()
+        self.scrolls = {}  # scroll_id -> (posição, expira_em)
+        self.requisicoes = Counter()
+        self.respostas_429 = 0
+        self.inicio = time.monotonic()
+    
+    def latencia(self) -> float:
+        """Latência em segundos sorteada conforme a distribuição configurada"""
+        media = self.config.latencia_ms / 1000
+        if media <= 0:
+            return 0.0
+        with self.lock:
+            if self.config.distribuicao == 'uniforme':
+                return self.aleatorio.uniform(0, 2 * media)
+            if self.config.distribuicao == 'lognormal':
+                # sigma 0.8: mediana abaixo da média e p99 em torno de 5x a média
+                return self.aleatorio.lognormvariate(0, 0.8) * media / 1.377
+            return media
+    
+    def sortear_429(self) -> bool:
+        with self.lock:
+            if self.aleatorio.random() < self.config.taxa_429:
+                self.respostas_429 += 1
+                return True
+            return False
+    
+    def estatisticas(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'requisicoes': dict(self.requisicoes),
+                'total': sum(self.requisicoes.values()),
+                'respostas_429': self.respostas_429,
+                'segundos': round(time.monotonic() - self.inicio, 3)
+            }
+    
+    def zerar(self):
+        with self.lock:
+            self.requisicoes.clear()
+            self.respostas_429 = 0
+            self.inicio = time.monotonic()
+
+
+def _parse_data(valor: Optional[str]) -> Optional[datetime]:
+    if not valor:
+        return None
+    return datetime.fromisoformat(valor.replace('Z', '+00:00'))
+
+
+class ManipuladorFake(BaseHTTPRequestHandler):
+    """Roteia as requisições para os endpoints simulados"""
+    
+    protocol_version = 'HTTP/1.1'
+    estado: EstadoFake = None
+    
+    ROTAS = [
+        ('GET', re.compile(r'^/users/(\d+)/items/search$'), 'scan_itens'),
+        ('GET', re.compile(r'^/items$'), 'multiget_itens'),
+        ('GET', re.compile(r'^/items/([^/]+)/variations$'), 'variacoes_item'),
+        ('GET', re.compile(r'^/items/([^/]+)/sale_price$'), 'preco_venda_item'),
+        ('GET', re.compile(r'^/items/([^/]+)$'), 'item'),
+        ('GET', re.compile(r'^/suggestions/items/([^/]+)/details$'), 'sugestao_item'),
+        ('GET', re.compile(r'^/sites/MLB/listing_prices$'), 'custos_anuncio'),
+        ('GET', re.compile(r'^/users/(\d+)/shipping_options/free$'), 'frete_gratis'),
+        ('GET', re.compile(r'^/orders/search$'), 'busca_pedidos'),
+        ('GET', re.compile(r'^/orders/(\d+)$'), 'pedido'),
+        ('GET', re.compile(r'^/shipments/(\d+)$'), 'envio'),
+        ('GET', re.compile(r'^/users/me$'), 'usuario_atual'),
+        ('POST', re.compile(r'^/oauth/token$'), 'token'),
+    ]
+    
+    def log_message(self, formato, *args):
+        pass
+    
+    def do_GET(self):
+        self._despachar('GET')
+    
+    def do_POST(self):
+        self._despachar('POST')
+    
+    def _despachar(self, metodo: str):
+        partes = urlsplit(self.path)
+        params = {chave: valores[-1] for chave, valores in parse_qs(partes.query).items()}
+        tamanho = int(self.headers.get('Content-Length') or 0)
+        if tamanho:
+            self.rfile.read(tamanho)
+        
+        # Endpoints de controle do benchmark: sem latência e fora das contagens
+        if partes.path == '/_fake/stats':
+            return self._responder(200, self.estado.estatisticas())
+        if partes.path == '/_fake/reset':
+            self.estado.zerar()
+            return self._responder(200, {'ok': True})
+        
+        for metodo_rota, padrao, nome in self.ROTAS:
+            encontrado = padrao.match(partes.path) if metodo_rota == metodo else None
+            if not encontrado:
+                continue
+            
+            with self.estado.lock:
+                self.estado.requisicoes[nome] += 1
+            
+            espera = self.estado.latencia()
+            if espera:
+                time.sleep(espera)
+            
+            if self.estado.sortear_429():
+                return self._responder(429, {'message': 'Too many requests', 'error': 'too_many_requests'},
+                                       {'Retry-After': str(self.estado.config.retry_after)})
+            
+            status, corpo = getattr(self, f'_rota_{nome}')(params, *encontrado.groups())
+            return self._responder(status, corpo)
+        
+        with self.estado.lock:
+            self.estado.requisicoes['nao_encontrado'] += 1
+        self._responder(404, {'message': 'resource not found', 'error': 'not_found', 'status': 404})
+    
+    def _responder(self, status: int, corpo: Any, cabecalhos: Dict[str, str] = None):
+        conteudo = json.dumps(corpo, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(conteudo)))
+        for chave, valor in (cabecalhos or {}).items():
+            self.send_header(chave, valor)
+        self.end_headers()
+        self.wfile.write(conteudo)
+    
+    @staticmethod
+    def _nao_encontrado() -> Tuple[int, Dict[str, Any]]:
+        return 404, {'message': 'resource not found', 'error': 'not_found', 'status': 404}
+    
+    # Produtos
+    
+    def _rota_scan_itens(self, params, seller_id):
+        config = self.estado.config
+        if int(seller_id) != config.seller_id:
+            return 403, {'message': 'forbidden', 'status': 403}
+        
+        limite = min(int(params.get('limit', 50)), config.limite_pagina_scan)
+        ids = self.estado.vendedor.ids_itens
+        
+        if params.get('search_type') != 'scan':
+            offset = int(params.get('offset', 0))
+            if offset > 1000:
+                return 400, {'message': 'Invalid offset. Use search_type=scan', 'status': 400}
+            if params.get('orders') == 'last_updated_desc':
+                ids = self.estado.vendedor.ids_por_atualizacao
+            if params.get('status'):
+                itens = self.estado.vendedor.itens
+                ids = [mlb for mlb in ids if itens[mlb]['status'] == params['status']]
+            return 200, {'results': ids[offset:offset + limite], 'paging': {'total': len(ids), 'offset': offset, 'limit': limite}}
+        
+        agora = time.monotonic()
+        with self.estado.lock:
+            scroll_id = params.get('scroll_id')
+            if scroll_id:
+                posicao, expira_em = self.estado.scrolls.get(scroll_id, (None, 0))
+                if posicao is None or expira_em < agora:
+                    self.estado.scrolls.pop(scroll_id, None)
+                    return 400, {'message': 'scroll_id expired', 'error': 'bad_request', 'status': 400}
+            else:
+                scroll_id = uuid.uuid4().hex
+                posicao = 0
+            
+            self.estado.scrolls[scroll_id] = (posicao + limite, agora + config.scroll_ttl_segundos)
+        
+        return 200, {
+            'seller_id': str(config.seller_id),
+            'results': ids[posicao:posicao + limite],
+            'scroll_id': scroll_id,
+            'paging': {'total': len(ids), 'limit': limite}
+        }
+    
+    def _rota_multiget_itens(self, params):
+        ids = [mlb for mlb in params.get('ids', '').split(',') if mlb][:20]
+        atributos = [a for a in params.get('attributes', '').split(',') if a]
+        resultados = []
+        for mlb in ids:
+            item = self.estado.vendedor.itens.get(mlb)
+            if not item:
+                resultados.append({'code': 404, 'body': {'message': 'resource not found', 'status': 404}})
+                continue
+            corpo = VendedorFake.publico(item)
+            if atributos:
+                corpo = {chave: valor for chave, valor in corpo.items() if chave in atributos}
+            resultados.append({'code': 200, 'body': corpo})
+        return 200, resultados
+    
+    def _rota_item(self, params, mlb):
+        item = self.estado.vendedor.itens.get(mlb)
+        return (200, VendedorFake.publico(item)) if item else self._nao_encontrado()
+    
+    def _rota_variacoes_item(self, params, mlb):
+        item = self.estado.vendedor.itens.get(mlb)
+        return (200, item['_variacoes']) if item else self._nao_encontrado()
+    
+    def _rota_preco_venda_item(self, params, mlb):
+        item = self.estado.vendedor.itens.get(mlb)
+        if not item:
+            return self._nao_encontrado()
+        return 200, {'amount': item['price'], 'regular_amount': None, 'currency_id': 'BRL'}
+    
+    def _rota_sugestao_item(self, params, mlb):
+        # A maioria dos anúncios não tem sugestão de preço
+        item = self.estado.vendedor.itens.get(mlb)
+        if not item or int(mlb[3:]) % 5:
+            return self._nao_encontrado()
+        return 200, {
+            'item_id': mlb,
+            'current_price': {'amount': item['price']},
+            'suggested_price': {'amount': round(item['price'] * 0.95, 2)},
+            'lowest_price': {'amount': round(item['price'] * 0.9, 2)}
+        }
+    
+    def _rota_custos_anuncio(self, params):
+        preco = float(params.get('price', 0))
+        tipo = params.get('listing_type_id', 'gold_special')
+        percentual = 16.5 if tipo == 'gold_pro' else 11.5
+        taxa_fixa = 6.25 if preco < 79 else 0.0
+        # Com listing_type_id informado, a API responde um único objeto
+        return 200, {
+            'listing_type_id': tipo,
+            'listing_type_name': 'Premium' if tipo == 'gold_pro' else 'Clássico',
+            'currency_id': 'BRL',
+            'sale_fee_amount': round(preco * percentual / 100 + taxa_fixa, 2),
+            'sale_fee_details': {
+                'percentage_fee': percentual,
+                'fixed_fee': taxa_fixa,
+                'gross_amount': round(preco * percentual / 100 + taxa_fixa, 2)
+            },
+            'listing_fee_details': {'fixed_fee': 0, 'gross_amount': 0}
+        }
+    
+    def _rota_frete_gratis(self, params, seller_id):
+        item = self.estado.vendedor.itens.get(params.get('item_id', ''))
+        if not item:
+            return self._nao_encontrado()
+        return 200, {'coverage': {'all_country': {'list_cost': round(item['price'] * 0.08 + 12, 2), 'currency_id': 'BRL'}}}
+    
+    # Vendas
+    
+    def _rota_busca_pedidos(self, params):
+        config = self.estado.config
+        if int(params.get('seller', 0)) != config.seller_id:
+            return 403, {'message': 'invalid caller', 'status': 403}
+        
+        offset = int(params.get('offset', 0))
+        limite = int(params.get('limit', 50))
+        if limite > config.limite_pagina_pedidos:
+            return 400, {'message': f'Limit must be lower than {config.limite_pagina_pedidos}', 'status': 400}
+        if offset + limite > config.limite_offset:
+            return 400, {'message': f'Offset must be lower than {config.limite_offset}', 'status': 400}
+        
+        criados_desde = _parse_data(params.get('order.date_created.from'))
+        criados_ate = _parse_data(params.get('order.date_created.to'))
+        atualizados_desde = _parse_data(params.get('order.date_last_updated.from'))
+        atualizados_ate = _parse_data(params.get('order.date_last_updated.to'))
+        
+        pedidos = self.estado.vendedor.pedidos_ordenados
+        if atualizados_desde or atualizados_ate:
+            pedidos = sorted(pedidos, key=lambda p: p['last_updated'])
+        
+        filtrados = [
+            pedido for pedido in pedidos
+            if (not criados_desde or pedido['_criado'] >= criados_desde)
+            and (not criados_ate or pedido['_criado'] <= criados_ate)
+            and (not atualizados_desde or _parse_data(pedido['last_updated']) >= atualizados_desde)
+            and (not atualizados_ate or _parse_data(pedido['last_updated']) <= atualizados_ate)
+            and (not params.get('order.status') or pedido['status'] == params['order.status'])
+        ]
+        if params.get('sort') == 'date_desc':
+            filtrados.reverse()
+        
+        return 200, {
+            'query': params.get('q'),
+            'results': [VendedorFake.publico(p) for p in filtrados[offset:offset + limite]],
+            'paging': {'total': len(filtrados), 'offset': offset, 'limit': limite}
+        }
+    
+    def _rota_pedido(self, params, order_id):
+        pedido = self.estado.vendedor.pedidos.get(int(order_id))
+        return (200, VendedorFake.publico(pedido)) if pedido else self._nao_encontrado()
+    
+    def _rota_envio(self, params, shipment_id):
+        pedido = self.estado.vendedor.pedidos.get(int(shipment_id) - 4000000000)
+        if not pedido:
+            return self._nao_encontrado()
+        return 200, {
+            'id': int(shipment_id),
+            'status': 'delivered',
+            'mode': 'me2',
+            'shipping_option': {'list_cost': pedido['_frete'], 'cost': 0.0, 'currency_id': 'BRL'}
+        }
+    
+    # Conta
+    
+    def _rota_usuario_atual(self, params):
+        return 200, {'id': self.estado.config.seller_id, 'nickname': 'VENDEDOR_BENCHMARK', 'site_id': 'MLB'}
+    
+    def _rota_token(self, params):
+        return 200, {
+            'access_token': f"APP_USR-{uuid.uuid4().hex}",
+            'token_type': 'Bearer',
+            'expires_in': 21600,
+            'scope': 'offline_access read write',
+            'user_id': self.estado.config.seller_id,
+            'refresh_token': f"TG-{uuid.uuid4().hex}"
+        }
+
+
+def criar_servidor(config: ConfiguracaoFake, host: str = '127.0.0.1', porta: int = 0) -> ThreadingHTTPServer:
+    """Cria o servidor (porta 0 = porta livre qualquer; veja server_address)"""
+    manipulador = type('ManipuladorConfigurado', (ManipuladorFake,), {'estado': EstadoFake(config)})
+    servidor = ThreadingHTTPServer((host, porta), manipulador)
+    servidor.daemon_threads = True
+    return servidor
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor falso da API do Mercado Livre')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=0)
+    parser.add_argument('--seller-id', type=int, default=123456789)
+    parser.add_argument('--anuncios', type=int, default=1000)
+    parser.add_argument('--pedidos', type=int, default=5000)
+    parser.add_argument('--dias-historico', type=int, default=365)
+    parser.add_argument('--latencia-ms', type=float, default=0.0)
+    parser.add_argument('--distribuicao', choices=['fixa', 'uniforme', 'lognormal'], default='fixa')
+    parser.add_argument('--taxa-429', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=float, default=0.5)
+    parser.add_argument('--limite-offset', type=int, default=10000)
+    parser.add_argument('--scroll-ttl', type=float, default=300.0)
+    parser.add_argument('--semente', type=int, default=42)
+    args = parser.parse_args()
+    
+    config = ConfiguracaoFake(
+        seller_id=args.seller_id, anuncios=args.anuncios, pedidos=args.pedidos,
+        dias_historico=args.dias_historico, latencia_ms=args.latencia_ms, distribuicao=args.distribuicao,
+        taxa_429=args.taxa_429, retry_after=args.retry_after, limite_offset=args.limite_offset,
+        scroll_ttl_segundos=args.scroll_ttl, semente=args.semente
+    )
+    servidor = criar_servidor(config, args.host, args.porta)
+    host, porta = servidor.server_address[:2]
+    # Primeira linha da saída: URL base, lida pelo benchmark ao iniciar o servidor
+    print(f"http://{host}:{porta}", flush=True)
+    
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+if __name__ == "__main__":
+    main()
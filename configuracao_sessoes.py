@@ -10,6 +10,9 @@ class ConfiguracaoSessoes:
     PERMITIR_MULTIPLAS_SESSOES_MESMO_USUARIO = False  # Mude para True para permitir
     MAX_SESSOES_POR_USUARIO = 3  # Máximo de sessões simultâneas por usuário
     TEMPO_EXPIRACAO_SESSAO_HORAS = 24  # Tempo de expiração da sessão
+    INTERVALO_LIMPEZA_MINUTOS = 15  # Intervalo entre limpezas de sessões/códigos expirados
+    TAMANHO_LOTE_LIMPEZA = 1000  # Máximo de linhas removidas por DELETE na limpeza
+    INTERVALO_CONSISTENCIA_MINUTOS = 360  # Intervalo entre validações de consistência das tabelas de usuários
     
     @classmethod
     def deve_permitir_multiplas_sessoes(cls):
@@ -25,6 +28,21 @@ class ConfiguracaoSessoes:
     def obter_tempo_expiracao_horas(cls):
         """Retorna o tempo de expiração em horas"""
         return cls.TEMPO_EXPIRACAO_SESSAO_HORAS
+    
+    @classmethod
+    def obter_intervalo_limpeza_minutos(cls):
+        """Retorna o intervalo entre execuções da limpeza de expirados"""
+        return cls.INTERVALO_LIMPEZA_MINUTOS
+    
+    @classmethod
+    def obter_tamanho_lote_limpeza(cls):
+        """Retorna o número máximo de linhas removidas por lote na limpeza"""
+        return cls.TAMANHO_LOTE_LIMPEZA
+    
+    @classmethod
+    def obter_intervalo_consistencia_minutos(cls):
+        """Retorna o intervalo entre validações de consistência"""
+        return cls.INTERVALO_CONSISTENCIA_MINUTOS
 
 # Exemplo de uso:
 # Para permitir múltiplas sessões simultâneas para o mesmo usuário:
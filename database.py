@@ -7,8 +7,12 @@ from mysql.connector import Error
 from dotenv import load_dotenv
 import os
 import json
-from datetime import datetime
-from typing import Optional, List, Dict, Any
+import hashlib
+import threading
+import time
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+from typing import Optional, List, Dict, Any, Tuple
 
 # Importar funções de tradução
 try:
@@ -28,6 +32,15 @@ except ImportError:
 # Carrega as variáveis de ambiente
 load_dotenv()
 
+# URL base da API do Mercado Livre (sobrescrita para apontar para um servidor local, ex.: benchmarks)
+MELI_API_BASE_URL = os.getenv('MELI_API_BASE_URL', 'https://api.mercadolibre.com').rstrip('/')
+
+# Colunas de produtos cujas mudanças são registradas em product_changes
+CAMPOS_ALTERACAO_PRODUTO = ('price', 'avaliable_quantity', 'status', 'listing_type_id', 'frete', 'frete_gratis')
+# Alterações mais novas que isso ainda podem ter ids menores não confirmados em outras
+# transações; a leitura por cursor só as entrega depois desse atraso
+ATRASO_LEITURA_ALTERACOES_SEGUNDOS = int(os.getenv('PRODUCT_CHANGES_ATRASO_SEGUNDOS', 10))
+
 def safe_float(value, default=0.0):
     """Conversão segura para float"""
     if value is None or value == '' or value == 'N/A':
@@ -70,6 +83,64 @@ def safe_datetime(value):
     except (ValueError, TypeError):
         return None
 
+class EstadoReautenticacao:
+    """Tabela em memória do flag tokens.needs_reauth por usuário.
+    
+    É atualizada pelos eventos que alteram o flag (marcação para reautenticação,
+    salvamento de tokens, sincronização de dados perdidos) e recarregada em lote,
+    para que caminhos quentes como os webhooks não precisem consultar o banco a
+    cada notificação. As invalidações só valem no processo que alterou o flag:
+    cada entrada expira em TTL_SEGUNDOS, e cada processo recarrega a tabela
+    (uma consulta) quando ela expira.
+    """
+    
+    TTL_SEGUNDOS = int(os.getenv('REAUTH_CACHE_TTL_SEGUNDOS', 60))
+    
+    def __init__(self):
+        self._estado = {}  # user_id -> (flag, instante monotônico em que foi lido)
+        self._carregado_em = None
+        self._lock = threading.Lock()
+    
+    def obter(self, user_id: int) -> Optional[bool]:
+        """Retorna o flag conhecido do usuário ou None se não houver entrada válida."""
+        with self._lock:
+            entrada = self._estado.get(user_id)
+            if entrada and time.monotonic() - entrada[1] < self.TTL_SEGUNDOS:
+                return entrada[0]
+            return None
+    
+    def definir(self, user_id: int, needs_reauth: bool) -> None:
+        """Registra o flag atual do usuário."""
+        with self._lock:
+            self._estado[user_id] = (bool(needs_reauth), time.monotonic())
+    
+    def reivindicar_recarga(self) -> bool:
+        """True se a tabela expirou e esta thread deve recarregá-la (uma por TTL)"""
+        with self._lock:
+            agora = time.monotonic()
+            if self._carregado_em is not None and agora - self._carregado_em < self.TTL_SEGUNDOS:
+                return False
+            self._carregado_em = agora
+            return True
+    
+    def invalidar(self, user_id: int = None) -> None:
+        """Descarta a entrada de um usuário (ou de todos)."""
+        with self._lock:
+            if user_id is None:
+                self._estado.clear()
+            else:
+                self._estado.pop(user_id, None)
+    
+    def carregar(self, estados: Dict[int, bool]) -> None:
+        """Substitui a tabela inteira pelo estado lido do banco."""
+        with self._lock:
+            agora = time.monotonic()
+            self._estado = {user_id: (bool(flag), agora) for user_id, flag in estados.items()}
+            self._carregado_em = agora
+
+# Estado de reautenticação compartilhado por todas as instâncias do processo
+estado_reautenticacao = EstadoReautenticacao()
+
 class DatabaseManager:
     """Classe para gerenciar conexões e operações do banco de dados."""
     
@@ -306,18 +377,40 @@ class DatabaseManager:
                         total_success INT DEFAULT 0,
                         total_errors INT DEFAULT 0,
                         last_processed DATETIME,
+                        last_success_at DATETIME NULL,
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
                         UNIQUE KEY unique_user_topic (user_id, topic)
                     )
                 """)
                 
+                # Alterações de produtos por campo, gravadas junto com os lotes de produtos
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS product_changes (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        user_id INT NOT NULL,
+                        product_id VARCHAR(50) NOT NULL,
+                        change_type ENUM('created', 'updated', 'deleted', 'status_changed') NOT NULL,
+                        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        old_data JSON NULL,
+                        new_data JSON NULL,
+                        synced_at TIMESTAMP NULL,
+                        INDEX idx_user_product (user_id, product_id),
+                        INDEX idx_user_change (user_id, id),
+                        INDEX idx_changed_at (changed_at),
+                        INDEX idx_synced (synced_at)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+                """)
+                
                 conn.commit()
                 print("Todas as tabelas foram criadas/verificadas com sucesso!")
                 
                 # Verifica e corrige estrutura das tabelas
                 self._verificar_estrutura_produtos(cursor)
                 self._verificar_estrutura_tokens(cursor)
+                self._verificar_estrutura_vendas(cursor)
+                self._verificar_estrutura_product_changes(cursor)
+                self._verificar_estrutura_webhook_stats(cursor)
                 
                 return True
                 
@@ -411,10 +504,57 @@ class DatabaseManager:
                 if not has_updated_at:
                     cursor.execute("ALTER TABLE tokens ADD COLUMN updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP")
                     print("Coluna updated_at adicionada à tabela tokens!")
+            
+            # Checkpoint da recuperação de vendas perdidas (sincronizar_dados_perdidos)
+            cursor.execute("SHOW COLUMNS FROM tokens LIKE 'recovery_checkpoint'")
+            if not cursor.fetchone():
+                cursor.execute("ALTER TABLE tokens ADD COLUMN recovery_checkpoint DATETIME NULL")
+                print("Coluna recovery_checkpoint adicionada à tabela tokens!")
                 
         except Error as e:
             print(f"Erro ao verificar estrutura da tabela tokens: {e}")
     
+    def _verificar_estrutura_vendas(self, cursor):
+        """Verifica e corrige a estrutura da tabela vendas."""
+        try:
+            # Hash do pedido gravado, usado para pular vendas sem alteração
+            cursor.execute("SHOW COLUMNS FROM vendas LIKE 'hash_conteudo'")
+            if not cursor.fetchone():
+                cursor.execute("ALTER TABLE vendas ADD COLUMN hash_conteudo CHAR(40) NULL")
+                print("Coluna hash_conteudo adicionada à tabela vendas!")
+            
+            # Contagens por janela de criação (reconciliação com a API)
+            cursor.execute("SHOW INDEX FROM vendas WHERE Key_name = 'idx_user_criacao'")
+            if not cursor.fetchall():
+                cursor.execute("ALTER TABLE vendas ADD INDEX idx_user_criacao (user_id, data_criacao)")
+                print("Índice idx_user_criacao adicionado à tabela vendas!")
+        
+        except Error as e:
+            print(f"Erro ao verificar estrutura da tabela vendas: {e}")
+    
+    def _verificar_estrutura_product_changes(self, cursor):
+        """Adiciona o índice da leitura incremental de alterações em tabelas antigas"""
+        try:
+            cursor.execute("SHOW INDEX FROM product_changes WHERE Key_name = 'idx_user_change'")
+            if not cursor.fetchall():
+                print("🔧 Adicionando índice idx_user_change em product_changes...")
+                cursor.execute("ALTER TABLE product_changes ADD INDEX idx_user_change (user_id, id)")
+                print("✅ Índice idx_user_change adicionado")
+        except Error as e:
+            print(f"⚠️ Erro ao verificar estrutura da tabela product_changes: {e}")
+    
+    def _verificar_estrutura_webhook_stats(self, cursor):
+        """Adiciona a data do último webhook processado com sucesso (cobertura por tópico)"""
+        try:
+            cursor.execute("SHOW COLUMNS FROM webhook_stats LIKE 'last_success_at'")
+            if not cursor.fetchall():
+                print("🔧 Adicionando coluna last_success_at em webhook_stats...")
+                cursor.execute("ALTER TABLE webhook_stats ADD COLUMN last_success_at DATETIME NULL AFTER last_processed")
+                cursor.execute("UPDATE webhook_stats SET last_success_at = last_processed WHERE total_success > 0")
+                print("✅ Coluna last_success_at adicionada")
+        except Error as e:
+            print(f"⚠️ Erro ao verificar estrutura da tabela webhook_stats: {e}")
+    
     def salvar_tokens(self, dados: Dict[str, Any]) -> bool:
         """Salva ou atualiza tokens de acesso."""
         if not dados:
@@ -471,6 +611,9 @@ class DatabaseManager:
                     print('Novos tokens inseridos com sucesso!')
                 
                 conn.commit()
+                
+                # Tokens novos: o flag de reautenticação precisa ser relido do banco
+                estado_reautenticacao.invalidar(user_id)
                 return True
                 
         except Error as e:
@@ -547,6 +690,87 @@ class DatabaseManager:
             if conn.is_connected():
                 conn.close()
     
+    def carregar_estado_reautenticacao(self) -> bool:
+        """Recarrega em uma única consulta o flag needs_reauth de todos os usuários."""
+        conn = self.conectar()
+        if not conn:
+            return False
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT user_id, COALESCE(needs_reauth, 0) FROM tokens")
+                estado_reautenticacao.carregar({user_id: flag for user_id, flag in cursor.fetchall()})
+                return True
+        except Error as e:
+            print(f"Erro ao carregar estado de reautenticação: {e}")
+            return False
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def obter_estado_recuperacao(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Obtém datas de reautenticação/sincronização e o checkpoint da recuperação."""
+        conn = self.conectar()
+        if not conn:
+            return None
+        
+        try:
+            with conn.cursor(dictionary=True) as cursor:
+                cursor.execute("""
+                    SELECT last_reauth_attempt, last_sync_attempt, recovery_checkpoint
+                    FROM tokens WHERE user_id = %s
+                """, (user_id,))
+                return cursor.fetchone()
+        except Error as e:
+            print(f"Erro ao obter estado da recuperação: {e}")
+            return None
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def salvar_checkpoint_recuperacao(self, user_id: int, checkpoint: datetime) -> bool:
+        """Registra até onde a janela de recuperação já foi gravada."""
+        conn = self.conectar()
+        if not conn:
+            return False
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE tokens SET recovery_checkpoint = %s WHERE user_id = %s
+                """, (checkpoint, user_id))
+                conn.commit()
+                return True
+        except Error as e:
+            print(f"Erro ao salvar checkpoint da recuperação: {e}")
+            return False
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def concluir_recuperacao(self, user_id: int) -> bool:
+        """Marca a recuperação de dados perdidos como concluída."""
+        conn = self.conectar()
+        if not conn:
+            return False
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE tokens 
+                    SET last_sync_attempt = NOW(), needs_reauth = 0, recovery_checkpoint = NULL
+                    WHERE user_id = %s
+                """, (user_id,))
+                conn.commit()
+                estado_reautenticacao.definir(user_id, False)
+                return True
+        except Error as e:
+            print(f"Erro ao concluir recuperação: {e}")
+            return False
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
     def salvar_user_info(self, dados: Dict[str, Any]) -> bool:
         """Salva informações do usuário."""
         if not dados:
@@ -1624,6 +1848,7 @@ class DatabaseManager:
         
         try:
             with conn.cursor() as cursor:
+                self._gravar_alteracao_produto(cursor, user_id, mlb, {'status': novo_status}, somente_existente=True)
                 cursor.execute("""
                     UPDATE produtos 
                     SET status = %s, updated_at = NOW()
@@ -1634,6 +1859,7 @@ class DatabaseManager:
                 return cursor.rowcount > 0
         except Error as e:
             print(f"Erro ao atualizar status do produto {mlb}: {e}")
+            conn.rollback()
             return False
         finally:
             if conn.is_connected():
@@ -1898,6 +2124,11 @@ class DatabaseManager:
                 if not cursor.fetchone():
                     return False
                 
+                self._gravar_alteracao_produto(cursor, user_id, mlb, {
+                    'price': dados.get('price'), 'avaliable_quantity': dados.get('quantity'),
+                    'status': dados.get('status')
+                }, somente_existente=True)
+                
                 # Atualizar produto (apenas campos editáveis)
                 cursor.execute("""
                     UPDATE produtos 
@@ -1930,6 +2161,10 @@ class DatabaseManager:
         
         try:
             with conn.cursor() as cursor:
+                self._gravar_alteracao_produto(cursor, user_id, mlb, {
+                    campo: dados.get(campo) for campo in CAMPOS_ALTERACAO_PRODUTO
+                }, somente_existente=True)
+                
                 # Atualizar dados completos do produto
                 cursor.execute("""
                     UPDATE produtos 
@@ -2487,6 +2722,10 @@ class DatabaseManager:
                 # Verificar se produto já existe
                 cursor.execute("SELECT id FROM produtos WHERE mlb = %s AND user_id = %s", (mlb, user_id))
                 produto_existe = cursor.fetchone()
+                self._gravar_alteracao_produto(cursor, user_id, mlb, {
+                    'price': price, 'avaliable_quantity': available_quantity, 'status': status,
+                    'listing_type_id': listing_type_id, 'frete': valor_frete, 'frete_gratis': frete_gratis
+                })
                 
                 if produto_existe:
                     # Atualiza produto principal
@@ -2531,6 +2770,9 @@ class DatabaseManager:
                         # Verificar se variação já existe
                         cursor.execute("SELECT id FROM produtos WHERE mlb = %s AND user_id = %s", (variation_mlb, user_id))
                         variacao_existe = cursor.fetchone()
+                        self._gravar_alteracao_produto(cursor, user_id, variation_mlb, {
+                            'price': variation_price, 'avaliable_quantity': variation_quantity
+                        })
                         
                         if variacao_existe:
                             # Atualiza variação
@@ -2569,18 +2811,36 @@ class DatabaseManager:
             if conn.is_connected():
                 conn.close()
 
-    def salvar_produtos_lote(self, dados_lote: List[Dict[str, Any]], user_id: int) -> bool:
-        """Salva múltiplos produtos de uma vez - ULTRA OTIMIZADO."""
+    def salvar_produtos_lote(self, dados_lote: List[Dict[str, Any]], user_id: int, conn=None,
+                             contagem: Dict[str, int] = None) -> bool:
+        """Salva múltiplos produtos de uma vez - ULTRA OTIMIZADO.
+        
+        Se conn for informada, ela é reutilizada e não é fechada. Se contagem
+        for informada, recebe 'criados' e 'atualizados' (anúncios principais),
+        classificados pela mesma consulta que decide entre INSERT e UPDATE, e
+        'alterados': os atualizados com diferença em algum campo rastreado
+        (no anúncio ou numa variação).
+        """
         if not dados_lote:
             return False
         
-        conn = self.conectar()
+        conexao_propria = conn is None
+        if conexao_propria:
+            conn = self.conectar()
         if not conn:
             return False
         
         try:
             conn.autocommit = False
             with conn.cursor() as cursor:
+                # Estado atual de todos os anúncios e variações do lote numa consulta:
+                # decide entre INSERT e UPDATE e é a base das alterações por campo
+                atuais = self._obter_campos_rastreados(cursor, self._mlbs_do_lote(dados_lote))
+                alteracoes = []
+                principais = {((dados or {}).get('produto') or {}).get('id') for dados in dados_lote} - {None}
+                novos = principais.difference(atuais)
+                alterados = set()
+                
                 for dados_completos in dados_lote:
                     if not dados_completos or not dados_completos.get('produto'):
                         continue
@@ -2624,9 +2884,14 @@ class DatabaseManager:
                         if frete_gratis == 0:
                             valor_frete = 0
                     
-                    # Verifica se produto já existe
-                    cursor.execute("SELECT mlb FROM produtos WHERE mlb = %s", (mlb,))
-                    if cursor.fetchone():
+                    existe = mlb in atuais
+                    if self._registrar_alteracao_produto(alteracoes, atuais, user_id, mlb, {
+                        'price': price, 'avaliable_quantity': available_quantity, 'status': status,
+                        'listing_type_id': listing_type_id, 'frete': valor_frete, 'frete_gratis': frete_gratis
+                    }):
+                        alterados.add(mlb)
+                    
+                    if existe:
                         # Atualiza
                         cursor.execute("""
                             UPDATE produtos
@@ -2733,9 +2998,13 @@ class DatabaseManager:
                             variation_attribute = variation.get('variation_attribute', '')
                             variation_value = variation.get('variation_value', '')
                             
-                            # Verificar se variação já existe
-                            cursor.execute("SELECT mlb FROM produtos WHERE mlb = %s", (variation_mlb,))
-                            if cursor.fetchone():
+                            variacao_existe = variation_mlb in atuais
+                            if self._registrar_alteracao_produto(alteracoes, atuais, user_id, variation_mlb, {
+                                'price': variation_price, 'avaliable_quantity': variation_quantity
+                            }):
+                                alterados.add(mlb)
+                            
+                            if variacao_existe:
                                 # Atualiza variação
                                 cursor.execute("""
                                     UPDATE produtos
@@ -2761,8 +3030,14 @@ class DatabaseManager:
                                       thumbnail, frete_gratis, modo_de_envio, status, category, valor_frete,
                                       mlb, variation_attribute, variation_value, variation_sku, user_id))
                 
+                self._inserir_alteracoes_produto(cursor, alteracoes)
+                
                 # Commit da transação
                 conn.commit()
+                if contagem is not None:
+                    contagem['criados'] = len(novos)
+                    contagem['atualizados'] = len(principais) - len(novos)
+                    contagem['alterados'] = len(alterados - novos)
                 return True
                 
         except Exception as e:
@@ -2770,9 +3045,143 @@ class DatabaseManager:
             conn.rollback()
             return False
         finally:
-            if conn and conn.is_connected():
+            if conexao_propria and conn and conn.is_connected():
                 conn.close()
 
+    @staticmethod
+    def _mlbs_do_lote(dados_lote: List[Dict[str, Any]]) -> List[str]:
+        """MLBs dos anúncios do lote e das suas variações (como gravadas em produtos)"""
+        mlbs = []
+        for dados_completos in dados_lote:
+            mlb = ((dados_completos or {}).get('produto') or {}).get('id')
+            if not mlb:
+                continue
+            mlbs.append(mlb)
+            for variation in dados_completos.get('variations') or []:
+                mlbs.append(f"{mlb}-{str(variation.get('id', ''))[-8:]}")
+        return mlbs
+    
+    def _obter_campos_rastreados(self, cursor, mlbs: List[str], user_id: int = None) -> Dict[str, Dict[str, Any]]:
+        """Valores atuais dos campos rastreados em product_changes, por MLB"""
+        if not mlbs:
+            return {}
+        
+        filtro_usuario = "AND user_id = %s" if user_id is not None else ""
+        cursor.execute(f"""
+            SELECT mlb, {', '.join(CAMPOS_ALTERACAO_PRODUTO)}
+            FROM produtos
+            WHERE mlb IN ({', '.join(['%s'] * len(mlbs))}) {filtro_usuario}
+        """, (*mlbs, *([user_id] if user_id is not None else [])))
+        return {row[0]: dict(zip(CAMPOS_ALTERACAO_PRODUTO, row[1:])) for row in cursor.fetchall()}
+    
+    @staticmethod
+    def _inserir_alteracoes_produto(cursor, alteracoes: List[Tuple]):
+        """Grava as alterações acumuladas por _registrar_alteracao_produto"""
+        if alteracoes:
+            cursor.executemany("""
+                INSERT INTO product_changes (user_id, product_id, change_type, old_data, new_data)
+                VALUES (%s, %s, %s, %s, %s)
+            """, alteracoes)
+    
+    def _gravar_alteracao_produto(self, cursor, user_id: int, mlb: str, novos: Dict[str, Any],
+                                  somente_existente: bool = False):
+        """Registra a alteração de um anúncio gravado fora de salvar_produtos_lote.
+        
+        Chamado antes do UPDATE/INSERT, na mesma transação. Com somente_existente,
+        nada é registrado se o anúncio não existir para o usuário (a gravação não
+        cria o anúncio).
+        """
+        atuais = self._obter_campos_rastreados(cursor, [mlb], user_id)
+        if somente_existente and mlb not in atuais:
+            return
+        
+        alteracoes = []
+        self._registrar_alteracao_produto(alteracoes, atuais, user_id, mlb, novos)
+        self._inserir_alteracoes_produto(cursor, alteracoes)
+    
+    @staticmethod
+    def _normalizar_campo_produto(valor: Any) -> Any:
+        """Mesma representação para o valor do banco (Decimal) e o da API (float/int)"""
+        if isinstance(valor, (Decimal, float)):
+            return round(float(valor), 2)
+        return valor
+    
+    def _registrar_alteracao_produto(self, alteracoes: List[Tuple], atuais: Dict[str, Dict[str, Any]],
+                                     user_id: int, mlb: str, novos: Dict[str, Any]) -> bool:
+        """Acrescenta a alteração do anúncio, só com os campos que mudaram (nada se nenhum mudou).
+        
+        atuais passa a refletir os novos valores (o mesmo MLB pode se repetir no lote).
+        Retorna se alguma alteração foi acrescentada.
+        """
+        novos = {campo: self._normalizar_campo_produto(valor) for campo, valor in novos.items()}
+        anteriores = atuais.get(mlb)
+        atuais[mlb] = {**(anteriores or {}), **novos}
+        
+        if anteriores is None:
+            alteracoes.append((user_id, mlb, 'created', None, json.dumps(novos)))
+            return True
+        
+        anteriores = {campo: self._normalizar_campo_produto(valor) for campo, valor in anteriores.items()}
+        mudancas = [campo for campo, valor in novos.items() if anteriores.get(campo) != valor]
+        if mudancas:
+            alteracoes.append((
+                user_id, mlb,
+                'status_changed' if 'status' in mudancas else 'updated',
+                json.dumps({campo: anteriores.get(campo) for campo in mudancas}),
+                json.dumps({campo: novos[campo] for campo in mudancas})
+            ))
+        return bool(mudancas)
+    
+    def obter_alteracoes_produtos(self, user_id: int, desde_id: int = 0, limite: int = 500,
+                                  mlb: str = None) -> Dict[str, Any]:
+        """Alterações de produtos do usuário posteriores ao cursor desde_id, em ordem.
+        
+        O cursor retornado é o id da última alteração lida; passá-lo na próxima
+        chamada continua de onde esta parou. Os ids são reservados no INSERT, mas
+        as transações confirmam fora de ordem: só são lidas alterações com mais de
+        ATRASO_LEITURA_ALTERACOES_SEGUNDOS, para que o cursor não passe por cima
+        de uma alteração de id menor ainda não confirmada.
+        """
+        conn = self.conectar()
+        if not conn:
+            return {'alteracoes': [], 'cursor': desde_id}
+        
+        try:
+            with conn.cursor(dictionary=True) as cursor:
+                filtro_mlb = "AND product_id = %s" if mlb else ""
+                cursor.execute(f"""
+                    SELECT id, product_id, change_type, changed_at, old_data, new_data
+                    FROM product_changes
+                    WHERE user_id = %s AND id > %s {filtro_mlb}
+                    AND changed_at <= NOW() - INTERVAL %s SECOND
+                    ORDER BY id
+                    LIMIT %s
+                """, (user_id, desde_id, *([mlb] if mlb else []), ATRASO_LEITURA_ALTERACOES_SEGUNDOS, limite))
+                
+                alteracoes = []
+                for row in cursor.fetchall():
+                    alteracoes.append({
+                        'id': row['id'],
+                        'mlb': row['product_id'],
+                        'tipo': row['change_type'],
+                        'data': row['changed_at'].isoformat() if row['changed_at'] else None,
+                        'anterior': json.loads(row['old_data']) if row['old_data'] else None,
+                        'novo': json.loads(row['new_data']) if row['new_data'] else None
+                    })
+                
+                return {
+                    'alteracoes': alteracoes,
+                    'cursor': alteracoes[-1]['id'] if alteracoes else desde_id,
+                    'mais': len(alteracoes) == limite
+                }
+        
+        except Error as e:
+            print(f"❌ Erro ao obter alterações de produtos: {e}")
+            return {'alteracoes': [], 'cursor': desde_id}
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
     def salvar_custos_venda(self, pack_id: str, mlb: str, custos: dict) -> bool:
         """Salva custos específicos de uma venda (pack)."""
         conn = self.conectar()
@@ -3011,7 +3420,7 @@ class DatabaseManager:
                 return None
             
             # Buscar dados do shipment
-            url = f'https://api.mercadolibre.com/shipments/{shipping_id}'
+            url = f'{MELI_API_BASE_URL}/shipments/{shipping_id}'
             headers = {"Authorization": f"Bearer {access_token}"}
             
             response = requests.get(url, headers=headers, timeout=10)
@@ -4064,256 +4473,443 @@ class DatabaseManager:
             if conn.is_connected():
                 conn.close()
 
+    # Colunas de vendas gravadas pelo upsert em lote (na ordem de _preparar_venda)
+    COLUNAS_VENDAS = (
+        'user_id', 'venda_id', 'pack_id', 'data_aprovacao', 'data_criacao',
+        'comprador_id', 'comprador_nome', 'comprador_email', 'status',
+        'valor_total', 'taxa_ml', 'frete_total', 'total_produtos',
+        'payment_method', 'shipping_method', 'status_pagamento', 'status_envio',
+        'data_envio', 'data_entrega', 'codigo_rastreamento', 'transportadora',
+        'observacoes', 'ultima_atualizacao',
+        'status_envio_descricao', 'status_envio_categoria', 'status_envio_original',
+        'status_envio_detalhe', 'data_ultima_atualizacao_envio',
+        'codigo_rastreamento_detalhado', 'transportadora_detalhada',
+        'endereco_entrega', 'observacoes_envio',
+        'status_pagamento_pt', 'payment_method_pt', 'shipping_method_pt',
+        'status_pedido_pt', 'status_envio_pt', 'categoria_envio_pt',
+        'hash_conteudo'
+    )
+    VENDAS_POR_INSTRUCAO = 100  # Linhas por INSERT multi-linha
+    
     def salvar_venda_com_status(self, dados_venda: Dict[str, Any], user_id: int) -> bool:
         """Salva/atualiza venda com informações de status detalhado."""
-        print(f"🚀 Iniciando salvar_venda_com_status para user_id: {user_id}")
+        return self.salvar_vendas_lote([dados_venda], user_id)['sucesso'] == 1
+    
+    def enriquecer_frete_vendas(self, vendas: List[Dict[str, Any]], user_id: int) -> None:
+        """Busca na API de shipments o frete das vendas que não o trazem no pedido.
+        
+        Deve rodar fora de qualquer transação; o valor fica em venda['_frete_shipments']
+        e vendas já enriquecidas não são consultadas de novo.
+        """
+        for venda in vendas:
+            if '_frete_shipments' in venda:
+                continue
+            
+            frete = None
+            shipping_id = (venda.get('shipping') or {}).get('id')
+            if shipping_id and self._extrair_frete_pedido(venda) == 0:
+                frete = self._buscar_frete_shipments(shipping_id, user_id)
+                if frete:
+                    print(f"🚚 Frete encontrado na API de shipments: R$ {frete:.2f}")
+            venda['_frete_shipments'] = frete
+    
+    @staticmethod
+    def _hash_venda(dados_venda: Dict[str, Any]) -> str:
+        """Hash do pedido como recebido da API (chaves internas '_' ficam de fora)."""
+        conteudo = {chave: valor for chave, valor in dados_venda.items() if not chave.startswith('_')}
+        return hashlib.sha1(json.dumps(conteudo, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    
+    def filtrar_vendas_alteradas(self, vendas: List[Dict[str, Any]], user_id: int) -> List[Dict[str, Any]]:
+        """Retorna só as vendas novas ou alteradas desde a última gravação."""
+        if not vendas:
+            return []
+        
         conn = self.conectar()
         if not conn:
-            return False
+            return list(vendas)
+        
+        try:
+            return self._filtrar_vendas_alteradas(conn, vendas, user_id)
+        except Exception as e:
+            print(f"⚠️ Erro ao comparar vendas com o banco: {e}")
+            return list(vendas)
+        finally:
+            conn.close()
+    
+    def _filtrar_vendas_alteradas(self, conn, vendas: List[Dict[str, Any]], user_id: int,
+                                  novas: set = None) -> List[Dict[str, Any]]:
+        """Vendas novas ou cujo hash difere do gravado (uma consulta por lote).
+        
+        Se novas for informado, recebe os IDs das vendas ainda não gravadas.
+        """
+        hashes = {str(venda.get('id', '')): self._hash_venda(venda) for venda in vendas}
+        
+        with conn.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT venda_id, hash_conteudo FROM vendas
+                WHERE user_id = %s AND venda_id IN ({', '.join(['%s'] * len(hashes))})
+            """, (user_id, *hashes))
+            gravados = {str(venda_id): hash_conteudo for venda_id, hash_conteudo in cursor.fetchall()}
+        # Encerra o snapshot de leitura antes das consultas de frete
+        conn.commit()
+        
+        if novas is not None:
+            novas.update(venda_id for venda_id in hashes if venda_id not in gravados)
+        return [venda for venda in vendas if gravados.get(str(venda.get('id', ''))) != hashes[str(venda.get('id', ''))]]
+    
+    def salvar_vendas_lote(self, vendas: List[Dict[str, Any]], user_id: int, conn=None,
+                           apenas_alteradas: bool = False) -> Dict[str, Any]:
+        """Salva um lote de vendas com upserts multi-linha numa única transação.
+        
+        vendas e venda_itens são gravadas em instruções multi-linha; os itens
+        só são reescritos quando mudaram. Se o lote falhar, cada venda é
+        regravada sob um SAVEPOINT e as que falharem de novo são reportadas em
+        'ids_com_erro'. Se conn for informada (ex.: conexão dedicada de um
+        gravador), ela é reutilizada e não é fechada.
+        
+        Com apenas_alteradas, vendas cujo pedido não mudou desde a última
+        gravação (mesmo hash) não são regravadas e contam em 'inalteradas', e
+        a mesma consulta separa as vendas novas: 'criadas' conta as novas
+        gravadas com sucesso (as demais gravadas são atualizações).
+        """
+        resultado = {'sucesso': 0, 'erros': 0, 'ids_com_erro': [], 'inalteradas': 0, 'criadas': 0}
+        if not vendas:
+            return resultado
+        
+        conexao_propria = conn is None
+        if conexao_propria:
+            conn = self.conectar()
+        if not conn:
+            resultado['erros'] = len(vendas)
+            resultado['ids_com_erro'] = [str(venda.get('id', '')) for venda in vendas]
+            return resultado
+        
+        novas = set()
+        try:
+            self._salvar_vendas_lote(conn, vendas, user_id, apenas_alteradas, resultado, novas)
+            resultado['criadas'] = len(novas.difference(resultado['ids_com_erro']))
+            return resultado
+        finally:
+            if conexao_propria:
+                conn.close()
+    
+    def _salvar_vendas_lote(self, conn, vendas: List[Dict[str, Any]], user_id: int,
+                            apenas_alteradas: bool, resultado: Dict[str, Any], novas: set) -> Dict[str, Any]:
+        """Corpo de salvar_vendas_lote, numa conexão já aberta."""
+        def registrar_erro(venda_id: str, erro):
+            print(f"❌ Erro ao salvar venda {venda_id} no lote: {erro}")
+            resultado['erros'] += 1
+            resultado['ids_com_erro'].append(venda_id)
+        
+        if apenas_alteradas:
+            try:
+                alteradas = self._filtrar_vendas_alteradas(conn, vendas, user_id, novas)
+            except Exception as e:
+                print(f"⚠️ Erro ao comparar vendas com o banco ({e}) - gravando todas")
+                conn.rollback()
+                alteradas = vendas
+            resultado['inalteradas'] = len(vendas) - len(alteradas)
+            resultado['sucesso'] = resultado['inalteradas']
+            vendas = alteradas
+            if not vendas:
+                return resultado
+        
+        # Chamadas de rede fora da transação de gravação
+        self.enriquecer_frete_vendas(vendas, user_id)
+        
+        preparadas = []
+        for venda in vendas:
+            try:
+                preparadas.append(self._preparar_venda(venda, user_id))
+            except Exception as e:
+                registrar_erro(str(venda.get('id', '')), e)
+        
+        if not preparadas:
+            return resultado
         
         try:
             with conn.cursor() as cursor:
-                # Extrair dados básicos
-                venda_id = str(dados_venda.get('id', ''))
-                pack_id = str(dados_venda.get('pack_id', venda_id))
-                
-                # Dados do comprador
-                buyer = dados_venda.get('buyer', {})
-                comprador_id = str(buyer.get('id', ''))
-                comprador_nome = buyer.get('nickname', '')
-                comprador_email = buyer.get('email', '')
-                
-                # Datas (conversão segura)
-                data_aprovacao = safe_datetime(dados_venda.get('date_closed'))  # Usar date_closed como data de aprovação
-                data_criacao = safe_datetime(dados_venda.get('date_created'))
-                
-                # Valores (tratando None com conversões seguras)
-                valor_total = safe_float(dados_venda.get('total_amount'), 0)
-                
-                # Calcular taxa ML dos payments
-                taxa_ml = 0
-                payments = dados_venda.get('payments', [])
-                if payments:
-                    taxa_ml = safe_float(payments[0].get('marketplace_fee'), 0)
-                
-                # Busca frete em múltiplas fontes
-                shipping = dados_venda.get('shipping', {})
-                frete_total = float(shipping.get('cost', 0))
-                
-                # Se não encontrar no shipping, busca nos pagamentos
-                if frete_total == 0:
-                    payments = dados_venda.get('payments', [])
-                    for payment in payments:
-                        shipping_cost = payment.get('shipping_cost', 0)
-                        if shipping_cost and shipping_cost > 0:
-                            frete_total = float(shipping_cost)
-                            break
-                
-                # Se ainda não encontrar, busca em billing_info
-                if frete_total == 0:
-                    billing = dados_venda.get('billing_info', {})
-                    if billing:
-                        shipping_cost = billing.get('shipping_cost', 0)
-                        if shipping_cost and shipping_cost > 0:
-                            frete_total = float(shipping_cost)
-                
-                # Se ainda não encontrar frete, busca na API de shipments
-                if frete_total == 0:
-                    shipping_id = shipping.get('id')
-                    if shipping_id:
-                        try:
-                            frete_data = self._buscar_frete_shipments(shipping_id, user_id)
-                            if frete_data:
-                                frete_total = float(frete_data)
-                                print(f"🚚 Frete encontrado na API de shipments: R$ {frete_total:.2f}")
-                        except Exception as e:
-                            print(f"❌ Erro ao buscar frete na API de shipments: {e}")
-                
-                # Aplica desconto/bônus se disponível
-                desconto_bonus = 0
-                if 'discounts' in dados_venda and dados_venda['discounts']:
-                    desconto_bonus = float(dados_venda['discounts'].get('amount', 0))
-                elif 'coupon_amount' in dados_venda:
-                    desconto_bonus = float(dados_venda.get('coupon_amount', 0))
-                
-                # Se não encontrar desconto explícito, calcula baseado na diferença
-                if desconto_bonus == 0:
-                    taxa_ml_esperada = valor_total * 0.14
-                    if taxa_ml < taxa_ml_esperada:
-                        diferenca_taxa = taxa_ml_esperada - taxa_ml
-                        if diferenca_taxa > 0 and frete_total == 0:
-                            desconto_bonus = diferenca_taxa
-                            print(f"🎁 Desconto calculado baseado na diferença da taxa ML: R$ {desconto_bonus:.2f}")
-                
-                # Aplica desconto na taxa ML final
-                if desconto_bonus > 0:
-                    taxa_ml = max(0, taxa_ml - desconto_bonus)
-                    print(f"🎁 Taxa ML ajustada com desconto: R$ {taxa_ml:.2f}")
-                
-                # Status detalhado dos payments com tradução
-                from translations import translate_payment_status, translate_payment_method, translate_shipping_method
-                
-                status_pagamento = 'unknown'
-                status_pagamento_pt = 'Desconhecido'
-                payment_method_pt = 'Desconhecido'
-                
-                if payments:
-                    status_pagamento = payments[0].get('status', 'unknown')
-                    status_pagamento_pt = translate_payment_status(status_pagamento)
-                    payment_method_pt = translate_payment_method(payments[0].get('payment_method_id', 'unknown'))
-                
-                # Status de envio detalhado usando o novo sistema
-                from shipping_status import map_ml_shipping_status
-                
-                ml_status = dados_venda.get('status', 'unknown')
-                status_detail = dados_venda.get('status_detail', '')
-                fulfilled = dados_venda.get('fulfilled', False)
-                
-                status_envio, status_descricao, status_categoria = map_ml_shipping_status(
-                    ml_status, status_detail, fulfilled
-                )
-                
-                # Dados de envio detalhados com tradução
-                shipping = dados_venda.get('shipping', {})
-                data_envio = None
-                data_entrega = None
-                codigo_rastreamento = ''
-                transportadora = ''
-                
-                # Extrair informações detalhadas de envio
-                codigo_rastreamento_detalhado = shipping.get('tracking_number', '')
-                transportadora_detalhada = shipping.get('service_name', '')
-                shipping_method_pt = translate_shipping_method(shipping.get('id', 'unknown'))
-                
-                # Traduzir status do pedido
-                status_pedido_pt = translate_order_status(dados_venda.get('status', 'unknown'))
-                
-                # Endereço de entrega
-                receiver_address = dados_venda.get('receiver_address', {})
-                endereco_entrega = ''
-                if receiver_address:
-                    endereco_parts = []
-                    if receiver_address.get('address_line'):
-                        endereco_parts.append(receiver_address['address_line'])
-                    if receiver_address.get('city'):
-                        endereco_parts.append(receiver_address['city'])
-                    if receiver_address.get('state'):
-                        endereco_parts.append(receiver_address['state'])
-                    if receiver_address.get('zip_code'):
-                        endereco_parts.append(receiver_address['zip_code'])
-                    endereco_entrega = ', '.join(endereco_parts)
-                
-                # Observações detalhadas
-                observacoes_envio = f"Status Original: {ml_status}"
-                if status_detail:
-                    observacoes_envio += f" | Detalhe: {status_detail}"
-                if fulfilled is not None:
-                    observacoes_envio += f" | Fulfilled: {fulfilled}"
-                
-                # Observações gerais
-                observacoes = f"Status: {dados_venda.get('status', 'unknown')}"
-                if dados_venda.get('status_detail'):
-                    observacoes += f" | Detalhe: {dados_venda.get('status_detail')}"
-                
-                # Inserir/atualizar venda principal
-                cursor.execute("""
-                    INSERT INTO vendas (
-                        user_id, venda_id, pack_id, data_aprovacao, data_criacao,
-                        comprador_id, comprador_nome, comprador_email, status,
-                        valor_total, taxa_ml, frete_total, total_produtos,
-                        payment_method, shipping_method, status_pagamento, status_envio,
-                        data_envio, data_entrega, codigo_rastreamento, transportadora,
-                        observacoes, ultima_atualizacao,
-                        status_envio_descricao, status_envio_categoria, status_envio_original,
-                        status_envio_detalhe, data_ultima_atualizacao_envio,
-                        codigo_rastreamento_detalhado, transportadora_detalhada,
-                        endereco_entrega, observacoes_envio,
-                        status_pagamento_pt, payment_method_pt, shipping_method_pt,
-                        status_pedido_pt, status_envio_pt, categoria_envio_pt
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON DUPLICATE KEY UPDATE
-                        pack_id = VALUES(pack_id),
-                        data_aprovacao = VALUES(data_aprovacao),
-                        data_criacao = VALUES(data_criacao),
-                        comprador_id = VALUES(comprador_id),
-                        comprador_nome = VALUES(comprador_nome),
-                        comprador_email = VALUES(comprador_email),
-                        status = VALUES(status),
-                        valor_total = VALUES(valor_total),
-                        taxa_ml = VALUES(taxa_ml),
-                        frete_total = VALUES(frete_total),
-                        total_produtos = VALUES(total_produtos),
-                        payment_method = VALUES(payment_method),
-                        shipping_method = VALUES(shipping_method),
-                        status_pagamento = VALUES(status_pagamento),
-                        status_envio = VALUES(status_envio),
-                        data_envio = VALUES(data_envio),
-                        data_entrega = VALUES(data_entrega),
-                        codigo_rastreamento = VALUES(codigo_rastreamento),
-                        transportadora = VALUES(transportadora),
-                        observacoes = VALUES(observacoes),
-                        ultima_atualizacao = VALUES(ultima_atualizacao),
-                        status_envio_descricao = VALUES(status_envio_descricao),
-                        status_envio_categoria = VALUES(status_envio_categoria),
-                        status_envio_original = VALUES(status_envio_original),
-                        status_envio_detalhe = VALUES(status_envio_detalhe),
-                        data_ultima_atualizacao_envio = VALUES(data_ultima_atualizacao_envio),
-                        codigo_rastreamento_detalhado = VALUES(codigo_rastreamento_detalhado),
-                        transportadora_detalhada = VALUES(transportadora_detalhada),
-                        endereco_entrega = VALUES(endereco_entrega),
-                        observacoes_envio = VALUES(observacoes_envio),
-                        status_pagamento_pt = VALUES(status_pagamento_pt),
-                        payment_method_pt = VALUES(payment_method_pt),
-                        shipping_method_pt = VALUES(shipping_method_pt),
-                        status_pedido_pt = VALUES(status_pedido_pt),
-                        status_envio_pt = VALUES(status_envio_pt),
-                        categoria_envio_pt = VALUES(categoria_envio_pt),
-                        updated_at = CURRENT_TIMESTAMP
-                """, (
-                    user_id, venda_id, pack_id, data_aprovacao, data_criacao,
-                    comprador_id, comprador_nome, comprador_email, dados_venda.get('status', 'unknown'),
-                    valor_total, taxa_ml, frete_total, len(dados_venda.get('order_items', [])),
-                    payments[0].get('payment_method_id', '') if payments else '', 
-                    shipping.get('id', ''),
-                    status_pagamento, status_envio, data_envio, data_entrega,
-                    codigo_rastreamento, transportadora, observacoes, dados_venda.get('last_updated'),
-                    status_descricao, status_categoria, ml_status, status_detail,
-                    dados_venda.get('last_updated'), codigo_rastreamento_detalhado,
-                    transportadora_detalhada, endereco_entrega, observacoes_envio,
-                    status_pagamento_pt, payment_method_pt, shipping_method_pt,
-                    status_pedido_pt, status_descricao, status_categoria
-                ))
-                
-                # Processar itens da venda
-                order_items = dados_venda.get('order_items', [])
-                if order_items:
-                    # Remover itens antigos
-                    cursor.execute("DELETE FROM venda_itens WHERE venda_id = %s AND user_id = %s", (venda_id, user_id))
-                    
-                    # Inserir novos itens
-                    for item in order_items:
-                        cursor.execute("""
-                            INSERT INTO venda_itens (
-                                user_id, venda_id, item_id, item_mlb, item_titulo, quantidade,
-                                preco_unitario, preco_total, categoria_id
-                            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        """, (
-                            user_id, venda_id, item.get('item', {}).get('id', ''),
-                            item.get('item', {}).get('id', ''), item.get('item', {}).get('title', ''), 
-                            safe_int(item.get('quantity'), 0), safe_float(item.get('unit_price'), 0), 
-                            safe_float(item.get('unit_price'), 0) * safe_int(item.get('quantity'), 0),
-                            item.get('item', {}).get('category_id', '')
-                        ))
+                try:
+                    self._gravar_vendas(cursor, preparadas, user_id)
+                    conn.commit()
+                    resultado['sucesso'] += len(preparadas)
+                    return resultado
+                except Exception as e:
+                    conn.rollback()
+                    if len(preparadas) == 1:
+                        registrar_erro(preparadas[0][0], e)
+                        return resultado
+                    print(f"⚠️ Lote de {len(preparadas)} vendas falhou ({e}) - gravando uma a uma")
+                
+                for venda_preparada in preparadas:
+                    cursor.execute("SAVEPOINT venda_lote")
+                    try:
+                        self._gravar_vendas(cursor, [venda_preparada], user_id)
+                        cursor.execute("RELEASE SAVEPOINT venda_lote")
+                        resultado['sucesso'] += 1
+                    except Exception as e:
+                        cursor.execute("ROLLBACK TO SAVEPOINT venda_lote")
+                        registrar_erro(venda_preparada[0], e)
                 
                 conn.commit()
-                return True
+                return resultado
                 
         except Exception as e:
-            print(f"Erro ao salvar venda com status: {e}")
+            print(f"Erro ao salvar lote de vendas: {e}")
             conn.rollback()
-            return False
-        finally:
-            conn.close()
+            resultado['sucesso'] = resultado['inalteradas']
+            resultado['erros'] = len(vendas)
+            resultado['ids_com_erro'] = [str(venda.get('id', '')) for venda in vendas]
+            return resultado
+    
+    @staticmethod
+    def _extrair_frete_pedido(dados_venda: Dict[str, Any]) -> float:
+        """Frete informado no próprio pedido (shipping, pagamentos ou billing_info)."""
+        shipping = dados_venda.get('shipping') or {}
+        frete_total = float(shipping.get('cost') or 0)
+        
+        # Se não encontrar no shipping, busca nos pagamentos
+        if frete_total == 0:
+            payments = dados_venda.get('payments', [])
+            for payment in payments:
+                shipping_cost = payment.get('shipping_cost', 0)
+                if shipping_cost and shipping_cost > 0:
+                    frete_total = float(shipping_cost)
+                    break
+        
+        # Se ainda não encontrar, busca em billing_info
+        if frete_total == 0:
+            billing = dados_venda.get('billing_info', {})
+            if billing:
+                shipping_cost = billing.get('shipping_cost', 0)
+                if shipping_cost and shipping_cost > 0:
+                    frete_total = float(shipping_cost)
+        
+        return frete_total
+    
+    def _preparar_venda(self, dados_venda: Dict[str, Any], user_id: int):
+        """Converte um pedido da API em (venda_id, linha de vendas, itens).
+        
+        Não acessa banco nem rede; itens é None quando o pedido não traz
+        order_items (os itens gravados são mantidos).
+        """
+        # Extrair dados básicos
+        venda_id = str(dados_venda.get('id', ''))
+        pack_id = str(dados_venda.get('pack_id', venda_id))
+        
+        # Dados do comprador
+        buyer = dados_venda.get('buyer', {})
+        comprador_id = str(buyer.get('id', ''))
+        comprador_nome = buyer.get('nickname', '')
+        comprador_email = buyer.get('email', '')
+        
+        # Datas (conversão segura)
+        data_aprovacao = safe_datetime(dados_venda.get('date_closed'))  # Usar date_closed como data de aprovação
+        data_criacao = safe_datetime(dados_venda.get('date_created'))
+        
+        # Valores (tratando None com conversões seguras)
+        valor_total = safe_float(dados_venda.get('total_amount'), 0)
+        
+        # Calcular taxa ML dos payments
+        taxa_ml = 0
+        payments = dados_venda.get('payments', [])
+        if payments:
+            taxa_ml = safe_float(payments[0].get('marketplace_fee'), 0)
+        
+        # Busca frete em múltiplas fontes (a API de shipments é consultada antes, fora da transação)
+        shipping = dados_venda.get('shipping', {})
+        frete_total = self._extrair_frete_pedido(dados_venda)
+        if frete_total == 0 and dados_venda.get('_frete_shipments'):
+            frete_total = float(dados_venda['_frete_shipments'])
+        
+        # Aplica desconto/bônus se disponível
+        desconto_bonus = 0
+        if 'discounts' in dados_venda and dados_venda['discounts']:
+            desconto_bonus = float(dados_venda['discounts'].get('amount', 0))
+        elif 'coupon_amount' in dados_venda:
+            desconto_bonus = float(dados_venda.get('coupon_amount', 0))
+        
+        # Se não encontrar desconto explícito, calcula baseado na diferença
+        if desconto_bonus == 0:
+            taxa_ml_esperada = valor_total * 0.14
+            if taxa_ml < taxa_ml_esperada:
+                diferenca_taxa = taxa_ml_esperada - taxa_ml
+                if diferenca_taxa > 0 and frete_total == 0:
+                    desconto_bonus = diferenca_taxa
+                    print(f"🎁 Desconto calculado baseado na diferença da taxa ML: R$ {desconto_bonus:.2f}")
+        
+        # Aplica desconto na taxa ML final
+        if desconto_bonus > 0:
+            taxa_ml = max(0, taxa_ml - desconto_bonus)
+            print(f"🎁 Taxa ML ajustada com desconto: R$ {taxa_ml:.2f}")
+        
+        # Status detalhado dos payments com tradução
+        from translations import translate_payment_status, translate_payment_method, translate_shipping_method
+        
+        status_pagamento = 'unknown'
+        status_pagamento_pt = 'Desconhecido'
+        payment_method_pt = 'Desconhecido'
+        
+        if payments:
+            status_pagamento = payments[0].get('status', 'unknown')
+            status_pagamento_pt = translate_payment_status(status_pagamento)
+            payment_method_pt = translate_payment_method(payments[0].get('payment_method_id', 'unknown'))
+        
+        # Status de envio detalhado usando o novo sistema
+        from shipping_status import map_ml_shipping_status
+        
+        ml_status = dados_venda.get('status', 'unknown')
+        status_detail = dados_venda.get('status_detail', '')
+        fulfilled = dados_venda.get('fulfilled', False)
+        
+        status_envio, status_descricao, status_categoria = map_ml_shipping_status(
+            ml_status, status_detail, fulfilled
+        )
+        
+        # Dados de envio detalhados com tradução
+        shipping = dados_venda.get('shipping', {})
+        data_envio = None
+        data_entrega = None
+        codigo_rastreamento = ''
+        transportadora = ''
+        
+        # Extrair informações detalhadas de envio
+        codigo_rastreamento_detalhado = shipping.get('tracking_number', '')
+        transportadora_detalhada = shipping.get('service_name', '')
+        shipping_method_pt = translate_shipping_method(shipping.get('id', 'unknown'))
+        
+        # Traduzir status do pedido
+        status_pedido_pt = translate_order_status(dados_venda.get('status', 'unknown'))
+        
+        # Endereço de entrega
+        receiver_address = dados_venda.get('receiver_address', {})
+        endereco_entrega = ''
+        if receiver_address:
+            endereco_parts = []
+            if receiver_address.get('address_line'):
+                endereco_parts.append(receiver_address['address_line'])
+            if receiver_address.get('city'):
+                endereco_parts.append(receiver_address['city'])
+            if receiver_address.get('state'):
+                endereco_parts.append(receiver_address['state'])
+            if receiver_address.get('zip_code'):
+                endereco_parts.append(receiver_address['zip_code'])
+            endereco_entrega = ', '.join(endereco_parts)
+        
+        # Observações detalhadas
+        observacoes_envio = f"Status Original: {ml_status}"
+        if status_detail:
+            observacoes_envio += f" | Detalhe: {status_detail}"
+        if fulfilled is not None:
+            observacoes_envio += f" | Fulfilled: {fulfilled}"
+        
+        # Observações gerais
+        observacoes = f"Status: {dados_venda.get('status', 'unknown')}"
+        if dados_venda.get('status_detail'):
+            observacoes += f" | Detalhe: {dados_venda.get('status_detail')}"
+        
+        linha_venda = (
+            user_id, venda_id, pack_id, data_aprovacao, data_criacao,
+            comprador_id, comprador_nome, comprador_email, dados_venda.get('status', 'unknown'),
+            valor_total, taxa_ml, frete_total, len(dados_venda.get('order_items', [])),
+            payments[0].get('payment_method_id', '') if payments else '', 
+            shipping.get('id', ''),
+            status_pagamento, status_envio, data_envio, data_entrega,
+            codigo_rastreamento, transportadora, observacoes, dados_venda.get('last_updated'),
+            status_descricao, status_categoria, ml_status, status_detail,
+            dados_venda.get('last_updated'), codigo_rastreamento_detalhado,
+            transportadora_detalhada, endereco_entrega, observacoes_envio,
+            status_pagamento_pt, payment_method_pt, shipping_method_pt,
+            status_pedido_pt, status_descricao, status_categoria,
+            self._hash_venda(dados_venda)
+        )
+        
+        order_items = dados_venda.get('order_items', [])
+        itens = None
+        if order_items:
+            itens = []
+            for item in order_items:
+                item_id = str(item.get('item', {}).get('id', ''))
+                quantidade = safe_int(item.get('quantity'), 0)
+                preco_unitario = safe_float(item.get('unit_price'), 0)
+                itens.append((
+                    item_id, item_id, item.get('item', {}).get('title', ''),
+                    quantidade, preco_unitario, preco_unitario * quantidade,
+                    item.get('item', {}).get('category_id', '')
+                ))
+        
+        return venda_id, linha_venda, itens
+    
+    def _gravar_vendas(self, cursor, preparadas: List[tuple], user_id: int) -> None:
+        """Upsert multi-linha de vendas e sincronização de venda_itens, no cursor/transação do chamador."""
+        colunas = self.COLUNAS_VENDAS
+        linha_sql = '(' + ', '.join(['%s'] * len(colunas)) + ')'
+        atualizacoes = ', '.join(f'{c} = VALUES({c})' for c in colunas if c not in ('user_id', 'venda_id'))
+        
+        for inicio in range(0, len(preparadas), self.VENDAS_POR_INSTRUCAO):
+            bloco = preparadas[inicio:inicio + self.VENDAS_POR_INSTRUCAO]
+            cursor.execute(
+                f"INSERT INTO vendas ({', '.join(colunas)}) VALUES {', '.join([linha_sql] * len(bloco))} "
+                f"ON DUPLICATE KEY UPDATE {atualizacoes}, updated_at = CURRENT_TIMESTAMP",
+                [valor for _, linha, _ in bloco for valor in linha]
+            )
+        
+        itens_por_venda = {venda_id: itens for venda_id, _, itens in preparadas if itens is not None}
+        if itens_por_venda:
+            self._sincronizar_itens_vendas(cursor, itens_por_venda, user_id)
+    
+    def _sincronizar_itens_vendas(self, cursor, itens_por_venda: Dict[str, List[tuple]], user_id: int) -> None:
+        """Aplica em venda_itens só a diferença entre os itens gravados e os recebidos.
+        
+        Itens são comparados por (venda_id, item_id); um grupo que mudou é
+        removido e reinserido, grupos iguais não são tocados.
+        """
+        def normalizar(item_titulo, quantidade, preco_unitario, preco_total, categoria_id):
+            return (item_titulo or '', int(quantidade or 0), round(float(preco_unitario or 0), 2),
+                    round(float(preco_total or 0), 2), categoria_id or '')
+        
+        venda_ids = list(itens_por_venda)
+        placeholders = ', '.join(['%s'] * len(venda_ids))
+        cursor.execute(f"""
+            SELECT venda_id, item_id, item_titulo, quantidade, preco_unitario, preco_total, categoria_id
+            FROM venda_itens
+            WHERE user_id = %s AND venda_id IN ({placeholders})
+        """, (user_id, *venda_ids))
+        
+        gravados = {}
+        for venda_id, item_id, *valores in cursor.fetchall():
+            gravados.setdefault((str(venda_id), str(item_id)), []).append(normalizar(*valores))
+        
+        recebidos = {}
+        linhas = {}
+        for venda_id, itens in itens_por_venda.items():
+            for item in itens:
+                chave = (venda_id, item[0])
+                recebidos.setdefault(chave, []).append(normalizar(*item[2:]))
+                linhas.setdefault(chave, []).append((user_id, venda_id, *item))
+        
+        alterados = [
+            chave for chave in gravados.keys() | recebidos.keys()
+            if sorted(gravados.get(chave, [])) != sorted(recebidos.get(chave, []))
+        ]
+        if not alterados:
+            return
+        
+        remover = [chave for chave in alterados if chave in gravados]
+        if remover:
+            cursor.execute(f"""
+                DELETE FROM venda_itens
+                WHERE user_id = %s AND (venda_id, item_id) IN ({', '.join(['(%s, %s)'] * len(remover))})
+            """, (user_id, *[valor for chave in remover for valor in chave]))
+        
+        inserir = [linha for chave in alterados for linha in linhas.get(chave, [])]
+        if inserir:
+            cursor.execute(f"""
+                INSERT INTO venda_itens (
+                    user_id, venda_id, item_id, item_mlb, item_titulo, quantidade,
+                    preco_unitario, preco_total, categoria_id
+                ) VALUES {', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s, %s)'] * len(inserir))}
+            """, [valor for linha in inserir for valor in linha])
     
     # ===== SISTEMA DE STATUS DE ENVIO DETALHADO =====
     
@@ -4542,19 +5138,23 @@ class DatabaseManager:
         try:
             # Inserir ou atualizar estatísticas
             cursor.execute("""
-                INSERT INTO webhook_stats (user_id, topic, total_received, total_success, total_errors, last_processed)
-                VALUES (%s, %s, 1, %s, %s, NOW())
+                INSERT INTO webhook_stats (user_id, topic, total_received, total_success, total_errors,
+                                           last_processed, last_success_at)
+                VALUES (%s, %s, 1, %s, %s, NOW(), IF(%s, NOW(), NULL))
                 ON DUPLICATE KEY UPDATE
                     total_received = total_received + 1,
                     total_success = total_success + %s,
                     total_errors = total_errors + %s,
-                    last_processed = NOW()
+                    last_processed = NOW(),
+                    last_success_at = IF(%s, NOW(), last_success_at)
             """, (
                 user_id, topic, 
                 1 if success else 0,  # total_success
                 0 if success else 1,  # total_errors
+                success,              # last_success_at
                 1 if success else 0,  # total_success (update)
-                0 if success else 1   # total_errors (update)
+                0 if success else 1,  # total_errors (update)
+                success               # last_success_at (update)
             ))
         except Exception as e:
             print(f"Erro ao atualizar estatísticas de webhook: {e}")
@@ -4663,6 +5263,100 @@ class DatabaseManager:
             if conn.is_connected():
                 conn.close()
     
+    def contar_vendas_por_dia(self, user_id: int, data_inicio: date, data_fim: date) -> Dict[date, Tuple[int, int]]:
+        """(total, canceladas) de vendas por dia de criação, no intervalo inclusivo.
+        
+        data_criacao é gravada no horário das datas da API, então os dias batem
+        com as contagens por dia de MercadoLivreAPI.contar_vendas_por_dia.
+        """
+        conn = self.conectar()
+        if not conn:
+            return {}
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT DATE(data_criacao), COUNT(*), SUM(status = 'cancelled')
+                    FROM vendas
+                    WHERE user_id = %s AND data_criacao >= %s AND data_criacao < %s
+                    GROUP BY DATE(data_criacao)
+                """, (user_id, data_inicio, data_fim + timedelta(days=1)))
+                
+                return {dia: (int(total), int(canceladas or 0)) for dia, total, canceladas in cursor.fetchall()}
+        
+        except Error as e:
+            print(f"❌ Erro ao contar vendas por dia: {e}")
+            return {}
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def contar_vendas_periodo(self, user_id: int, inicio: datetime, fim: datetime) -> Optional[int]:
+        """Vendas criadas em [inicio, fim) (horário das datas da API, como em data_criacao)"""
+        conn = self.conectar()
+        if not conn:
+            return None
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT COUNT(*) FROM vendas
+                    WHERE user_id = %s AND data_criacao >= %s AND data_criacao < %s
+                """, (user_id, inicio, fim))
+                
+                return cursor.fetchone()[0]
+        
+        except Error as e:
+            print(f"❌ Erro ao contar vendas do período: {e}")
+            return None
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def obter_ids_vendas_periodo(self, user_id: int, inicio: datetime, fim: datetime) -> set:
+        """IDs das vendas criadas em [inicio, fim)"""
+        conn = self.conectar()
+        if not conn:
+            return set()
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT venda_id FROM vendas
+                    WHERE user_id = %s AND data_criacao >= %s AND data_criacao < %s
+                """, (user_id, inicio, fim))
+                
+                return {str(row[0]) for row in cursor.fetchall()}
+        
+        except Error as e:
+            print(f"❌ Erro ao obter vendas do período: {e}")
+            return set()
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def contar_produtos_ativos(self, user_id: int) -> Optional[int]:
+        """Total de anúncios ativos no banco (sem contar as linhas de variações)"""
+        conn = self.conectar()
+        if not conn:
+            return None
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT COUNT(*) FROM produtos
+                    WHERE user_id = %s AND status = 'active' AND is_variation = 0
+                """, (user_id,))
+                
+                return cursor.fetchone()[0]
+        
+        except Error as e:
+            print(f"❌ Erro ao contar produtos ativos: {e}")
+            return None
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
     def verificar_produto_existe(self, user_id: int, produto_id: str) -> bool:
         """Verifica se um produto já existe no banco de dados"""
         conn = self.conectar()
@@ -0,0 +1,10 @@
+"""
+Configuração do gunicorn (`gunicorn app:app`)
+Cada worker inicializa o próprio processo depois do fork: tabelas, worker de
+importação e eleição de líder dos loops de background
+"""
+
+def post_worker_init(worker):
+    # Threads não sobrevivem ao fork: a inicialização precisa rodar no worker, não no master
+    from app import iniciar_processo
+    iniciar_processo()
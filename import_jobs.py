@@ -0,0 +1,788 @@
+#!/usr/bin/env python3
+"""
+Fila Persistente de Jobs de Importação
+Jobs de importação ficam na tabela import_jobs e são executados por workers
+que os reivindicam com lease e heartbeat, em qualquer processo ou máquina
+"""
+
+import os
+import json
+import socket
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Callable, Tuple
+from mysql.connector import errorcode
+from database import DatabaseManager
+from progress_events import progress_events
+from work_scheduler import CancellationToken
+import logging
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class ImportJobQueue:
+    """Acesso à tabela import_jobs"""
+    
+    TIPOS = ('produtos', 'vendas')
+    ESTADOS_ATIVOS = ('pending', 'running')
+    # Jobs que pararam com lotes por fazer: a próxima importação do tipo os retoma
+    ESTADOS_RETOMAVEIS = ('error', 'cancelled', 'partial')
+    
+    LEASE_SEGUNDOS = 60  # Tempo sem heartbeat até o job poder ser reivindicado por outro worker
+    MAX_TENTATIVAS = 3  # Reivindicações (inclusive após queda do worker) antes de marcar erro
+    
+    def __init__(self, db_manager: DatabaseManager = None):
+        self.db = db_manager or DatabaseManager()
+    
+    def criar_tabela(self) -> bool:
+        """Cria a tabela de jobs de importação"""
+        conn = self.db.conectar()
+        if not conn:
+            return False
+        
+        try:
+            with conn.cursor() as cursor:
+                # active_key só é preenchida enquanto o job está pendente/executando:
+                # o índice único impede dois jobs ativos do mesmo tipo para o mesmo usuário
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS import_jobs (
+                        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                        user_id INT NOT NULL,
+                        job_type ENUM('produtos', 'vendas') NOT NULL,
+                        status ENUM('pending', 'running', 'success', 'partial', 'error', 'cancelled') NOT NULL DEFAULT 'pending',
+                        active_key VARCHAR(40) AS (
+                            IF(status IN ('pending', 'running'), CONCAT(user_id, ':', job_type), NULL)
+                        ) STORED,
+                        worker_id VARCHAR(150) NULL,
+                        claim_token VARCHAR(36) NULL,
+                        lease_expires_at DATETIME NULL,
+                        heartbeat_at DATETIME NULL,
+                        attempts INT DEFAULT 0,
+                        cancel_requested BOOLEAN DEFAULT FALSE,
+                        progress INT DEFAULT 0,
+                        total_items INT DEFAULT 0,
+                        processed_items INT DEFAULT 0,
+                        success_items INT DEFAULT 0,
+                        error_items INT DEFAULT 0,
+                        skipped_items INT DEFAULT 0,
+                        message VARCHAR(500) NULL,
+                        checkpoint JSON NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        started_at DATETIME NULL,
+                        finished_at DATETIME NULL,
+                        UNIQUE KEY unique_active_job (active_key),
+                        INDEX idx_status_lease (status, lease_expires_at),
+                        INDEX idx_user_type (user_id, job_type)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+                """)
+                
+                cursor.execute("SHOW COLUMNS FROM import_jobs LIKE 'checkpoint'")
+                if not cursor.fetchone():
+                    cursor.execute("ALTER TABLE import_jobs ADD COLUMN checkpoint JSON NULL AFTER message")
+                
+                cursor.execute("SHOW COLUMNS FROM import_jobs LIKE 'skipped_items'")
+                if not cursor.fetchone():
+                    cursor.execute("ALTER TABLE import_jobs ADD COLUMN skipped_items INT DEFAULT 0 AFTER error_items")
+                
+                cursor.execute("SHOW COLUMNS FROM import_jobs LIKE 'status'")
+                coluna = cursor.fetchone()
+                if coluna and 'partial' not in str(coluna[1]):
+                    cursor.execute("""
+                        ALTER TABLE import_jobs MODIFY COLUMN status
+                        ENUM('pending', 'running', 'success', 'partial', 'error', 'cancelled') NOT NULL DEFAULT 'pending'
+                    """)
+                
+                # Lotes descobertos por job: itens, situação e falhas por item
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS import_job_batches (
+                        job_id BIGINT NOT NULL,
+                        batch_no INT NOT NULL,
+                        item_ids JSON NOT NULL,
+                        status ENUM('pending', 'done', 'failed') NOT NULL DEFAULT 'pending',
+                        success_items INT DEFAULT 0,
+                        error_items INT DEFAULT 0,
+                        failed_items JSON NULL,
+                        attempts INT DEFAULT 0,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                        PRIMARY KEY (job_id, batch_no),
+                        INDEX idx_job_status (job_id, status)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+                """)
+                conn.commit()
+                logger.info("✅ Tabela de jobs de importação criada com sucesso")
+                return True
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao criar tabela de jobs de importação: {e}")
+            return False
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def enfileirar(self, user_id: int, tipo: str, retomar: bool = True) -> Tuple[Optional[int], bool]:
+        """Cria um job pendente; retorna (job_id, criado).
+        
+        Se o último job do tipo terminou com erro, cancelado ou com lotes que
+        falharam, ele volta para a fila e continua do checkpoint (retomar=True).
+        Se o usuário já tiver um job ativo do mesmo tipo, retorna o id dele e criado=False.
+        """
+        conn = self.db.conectar()
+        if not conn:
+            return None, False
+        
+        try:
+            with conn.cursor() as cursor:
+                try:
+                    job_id = self._reabrir_job_interrompido(cursor, user_id, tipo) if retomar else None
+                    if not job_id:
+                        cursor.execute("""
+                            INSERT INTO import_jobs (user_id, job_type, message)
+                            VALUES (%s, %s, 'Aguardando worker...')
+                        """, (user_id, tipo))
+                        job_id = cursor.lastrowid
+                    conn.commit()
+                    self.publicar_status(job_id)
+                    return job_id, True
+                except Exception as e:
+                    if getattr(e, 'errno', None) != errorcode.ER_DUP_ENTRY:
+                        raise
+                    conn.rollback()
+                
+                cursor.execute("""
+                    SELECT id FROM import_jobs
+                    WHERE active_key = CONCAT(%s, ':', %s)
+                """, (user_id, tipo))
+                existente = cursor.fetchone()
+                return (existente[0] if existente else None), False
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao enfileirar importação de {tipo} para user_id {user_id}: {e}")
+            return None, False
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def _reabrir_job_interrompido(self, cursor, user_id: int, tipo: str) -> Optional[int]:
+        """Devolve à fila o último job do tipo se ele parou antes de concluir.
+        
+        O job retomado só refaz os lotes pendentes ou com falha. Se a descoberta
+        já tinha terminado, ela é reaberta de forma incremental a partir do cursor
+        antigo, para encontrar o que foi criado depois dele.
+        """
+        cursor.execute("""
+            SELECT id, status, checkpoint, started_at
+            FROM import_jobs
+            WHERE user_id = %s AND job_type = %s
+            ORDER BY id DESC
+            LIMIT 1
+        """, (user_id, tipo))
+        ultimo = cursor.fetchone()
+        if not ultimo or ultimo[1] not in self.ESTADOS_RETOMAVEIS or not ultimo[2]:
+            return None
+        
+        job_id = ultimo[0]
+        checkpoint = json.loads(ultimo[2])
+        if checkpoint.get('descoberta_concluida'):
+            desde = checkpoint.get('descoberta_concluida_em') or ultimo[3].isoformat()
+            checkpoint = self._checkpoint_incremental(tipo, checkpoint, desde)
+        
+        cursor.execute("""
+            UPDATE import_jobs
+            SET status = 'pending', cancel_requested = FALSE, attempts = 0, checkpoint = %s,
+                claim_token = NULL, worker_id = NULL, lease_expires_at = NULL,
+                finished_at = NULL, message = 'Aguardando worker para retomar...'
+            WHERE id = %s AND status = %s
+        """, (json.dumps(checkpoint), job_id, ultimo[1]))
+        if cursor.rowcount <= 0:
+            return None
+        
+        logger.info(f"♻️ Job {job_id} ({tipo}, user_id {user_id}) reaberto a partir do checkpoint")
+        return job_id
+    
+    @staticmethod
+    def _checkpoint_incremental(tipo: str, checkpoint: Dict[str, Any], desde: str) -> Dict[str, Any]:
+        """Checkpoint de uma descoberta concluída, reaberto para buscar só o que surgiu depois dela.
+        
+        Vendas: nova janela da busca a partir do limite superior da descoberta anterior.
+        Produtos: anúncios criados ou alterados desde o fim da descoberta anterior.
+        """
+        checkpoint = dict(checkpoint)
+        checkpoint['descoberta_concluida'] = False
+        if tipo == 'vendas':
+            anterior = checkpoint.get('cursor_vendas') or {}
+            checkpoint['cursor_vendas'] = {'desde': anterior.get('ate'), 'offset': 0}
+        else:
+            checkpoint['cursor_produtos'] = None
+            checkpoint['produtos_alterados_desde'] = desde
+        return checkpoint
+    
+    def reivindicar(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Reivindica o próximo job pendente ou com lease expirado.
+        
+        O UPDATE ... ORDER BY ... LIMIT 1 é atômico: dois workers nunca recebem
+        o mesmo job; o claim_token identifica quem venceu.
+        """
+        conn = self.db.conectar()
+        if not conn:
+            return None
+        
+        try:
+            with conn.cursor(dictionary=True) as cursor:
+                # Jobs abandonados que foram cancelados ou já esgotaram as tentativas
+                cursor.execute("""
+                    UPDATE import_jobs
+                    SET finished_at = NOW(),
+                        message = IF(cancel_requested, 'Cancelado pelo usuário',
+                                     'Importação interrompida: número máximo de tentativas excedido'),
+                        status = IF(cancel_requested, 'cancelled', 'error')
+                    WHERE status = 'running' AND lease_expires_at < NOW()
+                    AND (cancel_requested OR attempts >= %s)
+                """, (self.MAX_TENTATIVAS,))
+                
+                claim_token = str(uuid.uuid4())
+                cursor.execute("""
+                    UPDATE import_jobs
+                    SET status = 'running', worker_id = %s, claim_token = %s,
+                        lease_expires_at = NOW() + INTERVAL %s SECOND, heartbeat_at = NOW(),
+                        started_at = COALESCE(started_at, NOW()), attempts = attempts + 1
+                    WHERE status = 'pending'
+                    OR (status = 'running' AND lease_expires_at < NOW())
+                    ORDER BY id
+                    LIMIT 1
+                """, (worker_id, claim_token, self.LEASE_SEGUNDOS))
+                conn.commit()
+                
+                if cursor.rowcount <= 0:
+                    return None
+                
+                cursor.execute("SELECT * FROM import_jobs WHERE claim_token = %s", (claim_token,))
+                dados = cursor.fetchone()
+                if dados:
+                    self._publicar(dados)
+                return dados
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao reivindicar job de importação: {e}")
+            return None
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def renovar(self, job_id: int, claim_token: str, estado: Dict[str, Any]) -> Optional[bool]:
+        """Heartbeat: grava o progresso e renova o lease.
+        
+        Retorna se o cancelamento foi solicitado, ou None se o lease foi perdido.
+        """
+        conn = self.db.conectar()
+        if not conn:
+            return False
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE import_jobs
+                    SET progress = %s, total_items = %s, processed_items = %s,
+                        success_items = %s, error_items = %s, skipped_items = %s, message = %s,
+                        heartbeat_at = NOW(), lease_expires_at = NOW() + INTERVAL %s SECOND
+                    WHERE id = %s AND claim_token = %s AND status = 'running'
+                """, (estado['progresso'], estado['total'], estado['atual'],
+                      estado['sucesso'], estado['erros'], estado['ignorados'], estado['status'][:500],
+                      self.LEASE_SEGUNDOS, job_id, claim_token))
+                
+                cursor.execute("""
+                    SELECT claim_token, status, cancel_requested FROM import_jobs WHERE id = %s
+                """, (job_id,))
+                linha = cursor.fetchone()
+                conn.commit()
+                
+                if not linha or linha[0] != claim_token or linha[1] != 'running':
+                    return None
+                return bool(linha[2])
+        
+        except Exception as e:
+            logger.error(f"❌ Erro no heartbeat do job {job_id}: {e}")
+            return False
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def finalizar(self, job_id: int, claim_token: str, status: str, estado: Dict[str, Any]) -> bool:
+        """Grava o estado final do job (apenas se o worker ainda detiver o lease)"""
+        conn = self.db.conectar()
+        if not conn:
+            return False
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE import_jobs
+                    SET status = %s, progress = %s, total_items = %s, processed_items = %s,
+                        success_items = %s, error_items = %s, skipped_items = %s, message = %s,
+                        finished_at = NOW(), lease_expires_at = NULL
+                    WHERE id = %s AND claim_token = %s AND status = 'running'
+                """, (status, estado['progresso'], estado['total'], estado['atual'],
+                      estado['sucesso'], estado['erros'], estado['ignorados'], estado['status'][:500],
+                      job_id, claim_token))
+                conn.commit()
+                finalizado = cursor.rowcount > 0
+            
+            if finalizado:
+                self.publicar_status(job_id)
+            return finalizado
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao finalizar job {job_id}: {e}")
+            return False
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def registrar_lote(self, job_id: int, claim_token: str, batch_no: int,
+                       item_ids: List[str], checkpoint: Dict[str, Any]) -> bool:
+        """Grava um lote descoberto e o cursor de descoberta na mesma transação.
+        
+        Retorna False se o worker não detém mais o lease do job.
+        """
+        conn = self.db.conectar()
+        if not conn:
+            raise Exception("Erro de conexão ao registrar lote")
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE import_jobs SET checkpoint = %s
+                    WHERE id = %s AND claim_token = %s AND status = 'running'
+                """, (json.dumps(checkpoint), job_id, claim_token))
+                if cursor.rowcount <= 0:
+                    conn.rollback()
+                    return False
+                
+                if item_ids:
+                    cursor.execute("""
+                        INSERT INTO import_job_batches (job_id, batch_no, item_ids)
+                        VALUES (%s, %s, %s)
+                        ON DUPLICATE KEY UPDATE item_ids = VALUES(item_ids)
+                    """, (job_id, batch_no, json.dumps(item_ids)))
+                
+                conn.commit()
+                return True
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def obter_lotes_pendentes(self, job_id: int) -> List[Tuple[int, List[str]]]:
+        """Lotes ainda não concluídos; de lotes com falha ou cancelados no meio, retorna apenas os itens restantes"""
+        conn = self.db.conectar()
+        if not conn:
+            raise Exception("Erro de conexão ao obter lotes pendentes")
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT batch_no, status, item_ids, failed_items
+                    FROM import_job_batches
+                    WHERE job_id = %s AND status <> 'done'
+                    ORDER BY batch_no
+                """, (job_id,))
+                
+                lotes = []
+                for batch_no, status, item_ids, failed_items in cursor.fetchall():
+                    # Lotes com falha ou interrompidos no meio guardam só o que falta
+                    if failed_items:
+                        itens = list(json.loads(failed_items).keys())
+                    else:
+                        itens = json.loads(item_ids)
+                    lotes.append((batch_no, itens))
+                return lotes
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def concluir_lote(self, job_id: int, batch_no: int, sucesso: int, falhas: Dict[str, str],
+                      cancelados: List[str] = None):
+        """Registra o resultado de um lote; itens com falha ficam para a próxima tentativa.
+        
+        Itens cancelados antes da busca deixam o lote pendente só com o que falta.
+        """
+        restantes = dict(falhas)
+        for item_id in cancelados or []:
+            restantes[item_id] = 'Cancelado antes da busca'
+        
+        if cancelados:
+            status = 'pending'
+        else:
+            status = 'failed' if falhas else 'done'
+        
+        conn = self.db.conectar()
+        if not conn:
+            raise Exception("Erro de conexão ao concluir lote")
+        
+        try:
+            with conn.cursor() as cursor:
+                # success_items acumula entre tentativas; error_items reflete a última
+                cursor.execute("""
+                    UPDATE import_job_batches
+                    SET status = %s, success_items = success_items + %s, error_items = %s,
+                        failed_items = %s, attempts = attempts + 1
+                    WHERE job_id = %s AND batch_no = %s
+                """, (status, sucesso, len(falhas),
+                      json.dumps(restantes) if restantes else None, job_id, batch_no))
+                conn.commit()
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def obter_resumo_lotes(self, job_id: int) -> Dict[str, int]:
+        """Totais dos lotes do job (usados para restaurar o progresso ao retomar)"""
+        conn = self.db.conectar()
+        if not conn:
+            raise Exception("Erro de conexão ao obter resumo dos lotes")
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT COUNT(*),
+                           COALESCE(SUM(JSON_LENGTH(item_ids)), 0),
+                           COALESCE(SUM(success_items), 0),
+                           COALESCE(SUM(error_items), 0),
+                           COALESCE(SUM(IF(status = 'pending', JSON_LENGTH(item_ids), 0)), 0),
+                           COALESCE(SUM(status <> 'done'), 0)
+                    FROM import_job_batches
+                    WHERE job_id = %s
+                """, (job_id,))
+                lotes, itens, sucesso, erros, pendentes, restantes = cursor.fetchone()
+                return {
+                    'lotes': int(lotes),
+                    'itens': int(itens),
+                    'sucesso': int(sucesso),
+                    'erros': int(erros),
+                    'pendentes': int(pendentes),
+                    'lotes_restantes': int(restantes)
+                }
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def solicitar_cancelamento(self, user_id: int, tipo: str) -> bool:
+        """Cancela o job ativo: pendentes são encerrados na hora, em execução são sinalizados"""
+        conn = self.db.conectar()
+        if not conn:
+            return False
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE import_jobs
+                    SET cancel_requested = TRUE,
+                        finished_at = IF(status = 'pending', NOW(), finished_at),
+                        message = IF(status = 'pending', 'Cancelado pelo usuário', 'Cancelando...'),
+                        status = IF(status = 'pending', 'cancelled', status)
+                    WHERE user_id = %s AND job_type = %s AND status IN ('pending', 'running')
+                """, (user_id, tipo))
+                conn.commit()
+                return cursor.rowcount > 0
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao cancelar importação de {tipo} para user_id {user_id}: {e}")
+            return False
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def obter_status_usuario(self, user_id: int) -> Dict[str, Dict[str, Any]]:
+        """Status do job mais recente de cada tipo, no formato usado pela tela de importação"""
+        status = {tipo: self._status_vazio() for tipo in self.TIPOS}
+        
+        conn = self.db.conectar()
+        if not conn:
+            return status
+        
+        try:
+            with conn.cursor(dictionary=True) as cursor:
+                cursor.execute("""
+                    SELECT j.*
+                    FROM import_jobs j
+                    JOIN (
+                        SELECT job_type, MAX(id) AS id
+                        FROM import_jobs
+                        WHERE user_id = %s
+                        GROUP BY job_type
+                    ) ultimo ON ultimo.id = j.id
+                """, (user_id,))
+                
+                for job in cursor.fetchall():
+                    status[job['job_type']] = self._formatar_status(job)
+                
+                return status
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao obter status de importação: {e}")
+            return status
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def publicar_status(self, job_id: int):
+        """Publica o status atual do job no canal de eventos de importação"""
+        conn = self.db.conectar()
+        if not conn:
+            return
+        
+        try:
+            with conn.cursor(dictionary=True) as cursor:
+                cursor.execute("SELECT * FROM import_jobs WHERE id = %s", (job_id,))
+                job = cursor.fetchone()
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao ler job {job_id} para publicação: {e}")
+            return
+        finally:
+            if conn.is_connected():
+                conn.close()
+        
+        if job:
+            self._publicar(job)
+    
+    def _publicar(self, job: Dict[str, Any]):
+        progress_events.publicar(job['user_id'], 'import', 'status', {
+            'job_tipo': job['job_type'],
+            'status': self._formatar_status(job)
+        })
+    
+    @staticmethod
+    def _status_vazio() -> Dict[str, Any]:
+        return {
+            'job_id': None,
+            'ativo': False,
+            'estado': None,
+            'progresso': 0,
+            'total': 0,
+            'atual': 0,
+            'status': 'Aguardando...',
+            'inicio': None,
+            'fim': None,
+            'sucesso': 0,
+            'erros': 0,
+            'ignorados': 0
+        }
+    
+    @staticmethod
+    def _formatar_status(job: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'job_id': job['id'],
+            'ativo': job['status'] in ImportJobQueue.ESTADOS_ATIVOS,
+            'estado': job['status'],
+            'progresso': job['progress'] or 0,
+            'total': job['total_items'] or 0,
+            'atual': job['processed_items'] or 0,
+            'status': job['message'] or '',
+            'inicio': job['started_at'] or job['created_at'],
+            'fim': job['finished_at'],
+            'sucesso': job['success_items'] or 0,
+            'erros': job['error_items'] or 0,
+            'ignorados': job.get('skipped_items') or 0
+        }
+
+
+class ImportJob:
+    """Job reivindicado por um worker; os handlers de importação atualizam seu estado"""
+    
+    def __init__(self, fila: ImportJobQueue, dados: Dict[str, Any]):
+        self.fila = fila
+        self.id = dados['id']
+        self.user_id = dados['user_id']
+        self.tipo = dados['job_type']
+        self.claim_token = dados['claim_token']
+        self.tentativa = dados['attempts']
+        self.cancelado = bool(dados['cancel_requested'])
+        self.lease_perdido = False
+        # Propagado às buscas em andamento: cancelamento ou perda do lease interrompem o trabalho em voo
+        self.token = CancellationToken()
+        if self.cancelado:
+            self.token.cancelar()
+        self.checkpoint = json.loads(dados['checkpoint']) if dados.get('checkpoint') else {}
+        self._lock = threading.Lock()
+        self.estado = {
+            'progresso': 0,
+            'total': 0,
+            'atual': 0,
+            'status': 'Iniciando...',
+            'sucesso': 0,
+            'erros': 0,
+            # Itens já gravados e sem alteração desde a última importação
+            'ignorados': dados.get('skipped_items') or 0
+        }
+        self._estado_publicado = None
+    
+    @property
+    def interrompido(self) -> bool:
+        """Indica que o handler deve parar (cancelamento ou perda do lease)"""
+        return self.cancelado or self.lease_perdido
+    
+    def atualizar(self, **campos):
+        """Atualiza campos do estado (gravados no próximo heartbeat)"""
+        with self._lock:
+            self.estado.update(campos)
+    
+    def incrementar(self, campo: str, quantidade: int = 1):
+        """Incrementa um contador do estado"""
+        with self._lock:
+            self.estado[campo] += quantidade
+    
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.estado)
+    
+    def registrar_lote(self, item_ids: List[str], **cursor_descoberta) -> Optional[int]:
+        """Persiste um lote descoberto junto com o cursor de descoberta atualizado.
+        
+        Retorna o número do lote, ou None se o lease do job foi perdido.
+        """
+        checkpoint = dict(self.checkpoint)
+        checkpoint.update(cursor_descoberta)
+        batch_no = checkpoint.get('proximo_lote', 1)
+        checkpoint['proximo_lote'] = batch_no + 1
+        
+        if not self.fila.registrar_lote(self.id, self.claim_token, batch_no, item_ids, checkpoint):
+            self.lease_perdido = True
+            self.token.cancelar()
+            return None
+        self.checkpoint = checkpoint
+        return batch_no
+    
+    def concluir_descoberta(self):
+        """Marca a descoberta de IDs como concluída (o horário baliza a próxima descoberta incremental)"""
+        self.registrar_lote([], descoberta_concluida=True, descoberta_concluida_em=datetime.now().isoformat())
+    
+    def heartbeat(self):
+        """Grava o progresso, renova o lease e lê pedidos de cancelamento"""
+        estado = self.snapshot()
+        cancelamento = self.fila.renovar(self.id, self.claim_token, estado)
+        if cancelamento is None:
+            self.lease_perdido = True
+            self.token.cancelar()
+            return
+        if cancelamento:
+            self.cancelado = True
+            self.token.cancelar()
+        
+        # Só publica quando o progresso mudou desde o último heartbeat
+        if estado != self._estado_publicado:
+            self._estado_publicado = estado
+            self.fila.publicar_status(self.id)
+
+
+class ImportWorker:
+    """Threads que reivindicam e executam jobs de importação"""
+    
+    INTERVALO_POLL_SEGUNDOS = 2
+    INTERVALO_HEARTBEAT_SEGUNDOS = 2
+    
+    def __init__(self, handlers: Dict[str, Callable[[ImportJob], None]],
+                 fila: ImportJobQueue = None, num_threads: int = 2):
+        self.handlers = handlers
+        self.fila = fila or ImportJobQueue()
+        self.num_threads = num_threads
+        self.running = False
+        self.threads = []
+        self._stop_event = threading.Event()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    
+    def start(self):
+        """Inicia as threads do worker"""
+        if self.running:
+            logger.warning("⚠️ Worker de importação já está rodando")
+            return
+        
+        self.running = True
+        self._stop_event.clear()
+        self.threads = []
+        for indice in range(self.num_threads):
+            thread = threading.Thread(
+                target=self._loop,
+                args=(f"{self.worker_id}:{indice}",),
+                name=f"import-worker-{indice}",
+                daemon=True
+            )
+            self.threads.append(thread)
+            thread.start()
+        logger.info(f"🚀 Worker de importação iniciado ({self.worker_id}, {self.num_threads} threads)")
+    
+    def stop(self):
+        """Para as threads do worker (jobs em andamento serão retomados por outro worker)"""
+        self.running = False
+        self._stop_event.set()
+        for thread in self.threads:
+            if thread.is_alive():
+                thread.join(timeout=5)
+        logger.info("🛑 Worker de importação parado")
+    
+    def _loop(self, worker_id: str):
+        """Loop de reivindicação de jobs"""
+        while self.running:
+            try:
+                dados = self.fila.reivindicar(worker_id)
+                if not dados:
+                    self._stop_event.wait(self.INTERVALO_POLL_SEGUNDOS)
+                    continue
+                
+                self._executar(ImportJob(self.fila, dados))
+            
+            except Exception as e:
+                logger.error(f"❌ Erro no worker de importação: {e}")
+                self._stop_event.wait(self.INTERVALO_POLL_SEGUNDOS)
+    
+    def _executar(self, job: ImportJob):
+        """Executa um job com heartbeat em background"""
+        logger.info(f"📥 Job {job.id}: importação de {job.tipo} para user_id {job.user_id} "
+                    f"(tentativa {job.tentativa})")
+        
+        parar_heartbeat = threading.Event()
+        
+        def heartbeat_loop():
+            while not parar_heartbeat.wait(self.INTERVALO_HEARTBEAT_SEGUNDOS):
+                job.heartbeat()
+        
+        heartbeat_thread = threading.Thread(target=heartbeat_loop, daemon=True)
+        heartbeat_thread.start()
+        
+        status = 'success'
+        try:
+            handler = self.handlers.get(job.tipo)
+            if not handler:
+                raise ValueError(f"Tipo de importação desconhecido: {job.tipo}")
+            
+            handler(job)
+            
+            if not job.interrompido and self.fila.obter_resumo_lotes(job.id)['lotes_restantes']:
+                # Itens com falha ficam nos lotes; a próxima importação do tipo retoma só eles
+                status = 'partial'
+            
+            if job.cancelado:
+                status = 'cancelled'
+                # O que já foi buscado foi gravado; o restante fica pendente para a próxima execução
+                job.atualizar(status=f"Cancelado pelo usuário - {job.estado['sucesso']} de "
+                                     f"{job.estado['total']} importados")
+        
+        except Exception as e:
+            status = 'error'
+            job.incrementar('erros')
+            job.atualizar(status=f'Erro: {str(e)}')
+            logger.error(f"❌ Erro no job {job.id}: {e}")
+            import traceback
+            traceback.print_exc()
+        finally:
+            parar_heartbeat.set()
+            heartbeat_thread.join(timeout=5)
+        
+        if job.lease_perdido:
+            logger.warning(f"⚠️ Job {job.id} perdeu o lease - resultado descartado")
+            return
+        
+        self.fila.finalizar(job.id, job.claim_token, status, job.snapshot())
+        logger.info(f"✅ Job {job.id} finalizado: {status}")
+
+# Fila global de jobs de importação
+import_job_queue = ImportJobQueue()
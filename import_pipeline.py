@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Pipeline de Importação
+Buscas em paralelo (no agendador global) alimentam uma fila limitada; um único
+gravador drena a fila em lotes (por tamanho ou tempo), com uma conexão e uma
+transação por lote. Um token de cancelamento interrompe buscas em voo e
+descarta as da fila, gravando o que já foi buscado
+"""
+
+import queue
+import threading
+import time
+from typing import Dict, List, Any, Callable, Optional, Tuple
+from database import DatabaseManager
+from work_scheduler import WorkScheduler, CancellationToken, OperacaoCancelada, work_scheduler
+
+# Marcador de fim da fila do gravador
+_FIM = object()
+
+class ImportPipeline:
+    """Pipeline produtor/consumidor com backpressure entre a API e o banco.
+    
+    - buscar(item_id) -> dados ou None (None conta como falha do item)
+    - gravar(conn, [(item_id, dados)]) -> {item_id: erro} dos itens que falharam
+    - ao_concluir_lote(batch_no, itens, falhas, cancelados) é chamado pelo
+      gravador quando todos os itens de um lote do checkpoint foram gravados,
+      falharam ou foram cancelados antes da busca
+    - buscar pode levantar OperacaoCancelada ao perceber o token cancelado;
+      o item conta como cancelado, não como falha
+    """
+    
+    def __init__(self, db: DatabaseManager,
+                 buscar: Callable[[str], Any],
+                 gravar: Callable[[Any, List[Tuple[str, Any]]], Dict[str, str]],
+                 ao_concluir_lote: Callable[[int, List[str], Dict[str, str], List[str]], None],
+                 user_id: int,
+                 prioridade: str = 'bulk',
+                 agendador: WorkScheduler = None,
+                 token: CancellationToken = None,
+                 num_buscadores: int = 8,
+                 tamanho_fila: int = 200,
+                 tamanho_lote_gravacao: int = 50,
+                 intervalo_gravacao: float = 2.0):
+        self.db = db
+        self.buscar = buscar
+        self.gravar = gravar
+        self.ao_concluir_lote = ao_concluir_lote
+        self.tamanho_lote_gravacao = tamanho_lote_gravacao
+        self.intervalo_gravacao = intervalo_gravacao
+        self.user_id = user_id
+        self.prioridade = prioridade
+        self.agendador = agendador or work_scheduler
+        self.token = token or CancellationToken()
+        
+        self._fila = queue.Queue(maxsize=tamanho_fila)
+        # Limita itens em busca ou aguardando gravação: quem envia lotes bloqueia
+        # quando o banco fica para trás, e nada se acumula sem limite na memória
+        self._em_voo = threading.Semaphore(tamanho_fila + num_buscadores)
+        # As buscas rodam no agendador global, que divide as threads entre usuários
+        self._buscas = set()
+        self._lock_buscas = threading.Lock()
+        self._gravador = threading.Thread(target=self._loop_gravador, name='import-writer', daemon=True)
+        self._erro_gravador = None
+        self._lock_metricas = threading.Lock()
+        
+        self.metricas = {
+            'itens_buscados': 0,
+            'itens_gravados': 0,
+            'itens_cancelados': 0,
+            'transacoes': 0,
+            'espera_backpressure_s': 0.0
+        }
+    
+    def iniciar(self):
+        """Inicia o gravador"""
+        self._gravador.start()
+        return self
+    
+    def enviar_lote(self, batch_no: int, itens: List[str]):
+        """Envia os itens de um lote para busca (bloqueia sob backpressure).
+        
+        Com o token cancelado, o lote (ou o que falta dele) não é enviado.
+        """
+        if self.token.cancelado:
+            return
+        
+        itens = list(itens)
+        self._fila.put(('abrir', batch_no, itens))
+        
+        for indice, item_id in enumerate(itens):
+            inicio = time.monotonic()
+            while not self._em_voo.acquire(timeout=0.2):
+                if self.token.cancelado:
+                    break
+            self.metricas['espera_backpressure_s'] += time.monotonic() - inicio
+            
+            if self.token.cancelado:
+                # Itens que não chegaram a ocupar vaga: nada a liberar no gravador
+                self._fila.put(('cancelado', batch_no, itens[indice:], False))
+                return
+            
+            busca = self.agendador.submeter(self.user_id, self.prioridade, self._buscar_item, batch_no, item_id)
+            with self._lock_buscas:
+                self._buscas.add(busca)
+            busca.add_done_callback(
+                lambda busca, batch_no=batch_no, item_id=item_id: self._busca_concluida(busca, batch_no, item_id)
+            )
+    
+    def _busca_concluida(self, busca, batch_no: int, item_id: str):
+        with self._lock_buscas:
+            self._buscas.discard(busca)
+        if busca.cancelled():
+            # Descartada na fila do agendador antes de rodar
+            self._fila.put(('cancelado', batch_no, [item_id], True))
+    
+    def finalizar(self):
+        """Aguarda buscas e gravações pendentes e encerra o pipeline.
+        
+        Se o token for cancelado, buscas ainda na fila do agendador são
+        descartadas e só as em execução são aguardadas; o gravador grava o que
+        já foi buscado antes de encerrar.
+        """
+        with self._lock_buscas:
+            pendentes = set(self._buscas)
+        
+        while pendentes:
+            if self.token.cancelado:
+                for busca in pendentes:
+                    busca.cancel()
+            _, pendentes = self.agendador.aguardar(pendentes, timeout=0.5)
+        
+        self._fila.put(_FIM)
+        self._gravador.join()
+        
+        if self._erro_gravador:
+            raise self._erro_gravador
+    
+    def _buscar_item(self, batch_no: int, item_id: str):
+        """Executado pelos buscadores: resultado ou falha vai para a fila do gravador"""
+        if self.token.cancelado:
+            self._fila.put(('cancelado', batch_no, [item_id], True))
+            return
+        
+        try:
+            dados = self.buscar(item_id)
+            if dados:
+                self._fila.put(('item', batch_no, item_id, dados))
+            else:
+                self._fila.put(('falha', batch_no, item_id, 'Falha ao obter detalhes'))
+        except OperacaoCancelada:
+            self._fila.put(('cancelado', batch_no, [item_id], True))
+        except Exception as e:
+            self._fila.put(('falha', batch_no, item_id, str(e)))
+        finally:
+            with self._lock_metricas:
+                self.metricas['itens_buscados'] += 1
+    
+    def _loop_gravador(self):
+        """Drena a fila em lotes por tamanho ou tempo, numa conexão dedicada"""
+        conn = None
+        lotes_abertos = {}  # batch_no -> {'itens': [...], 'pendentes': n, 'falhas': {}, 'cancelados': []}
+        buffer = []
+        limite = time.monotonic() + self.intervalo_gravacao
+        
+        def resolver(batch_no: int, item_id: str, erro: Optional[str] = None, cancelado: bool = False):
+            lote = lotes_abertos[batch_no]
+            if cancelado:
+                lote['cancelados'].append(item_id)
+            elif erro:
+                lote['falhas'][item_id] = erro
+            lote['pendentes'] -= 1
+            if lote['pendentes'] <= 0:
+                del lotes_abertos[batch_no]
+                concluir(batch_no, lote['itens'], lote['falhas'], lote['cancelados'])
+        
+        def concluir(batch_no: int, itens: List[str], falhas: Dict[str, str], cancelados: List[str]):
+            try:
+                self.ao_concluir_lote(batch_no, itens, falhas, cancelados)
+            except Exception as e:
+                # O lote continua pendente no checkpoint e será refeito ao retomar
+                print(f"❌ Erro ao concluir lote {batch_no} da importação: {e}")
+                self._erro_gravador = self._erro_gravador or e
+        
+        def descarregar():
+            nonlocal conn
+            if not buffer:
+                return
+            
+            try:
+                if conn is None or not conn.is_connected():
+                    conn = self.db.conectar()
+                if not conn:
+                    raise Exception("Erro de conexão com o banco")
+                falhas = self.gravar(conn, [(item_id, dados) for _, item_id, dados in buffer])
+                self.metricas['transacoes'] += 1
+                self.metricas['itens_gravados'] += len(buffer) - len(falhas)
+            except Exception as e:
+                falhas = {item_id: f'Erro ao gravar lote: {e}' for _, item_id, _ in buffer}
+            
+            for batch_no, item_id, _ in buffer:
+                resolver(batch_no, item_id, falhas.get(item_id))
+            buffer.clear()
+        
+        try:
+            while True:
+                try:
+                    mensagem = self._fila.get(timeout=max(0.05, limite - time.monotonic()))
+                except queue.Empty:
+                    mensagem = None
+                
+                if mensagem is _FIM:
+                    descarregar()
+                    break
+                
+                if mensagem:
+                    tipo = mensagem[0]
+                    if tipo == 'abrir':
+                        _, batch_no, itens = mensagem
+                        if itens:
+                            lotes_abertos[batch_no] = {
+                                'itens': itens, 'pendentes': len(itens), 'falhas': {}, 'cancelados': []
+                            }
+                        else:
+                            concluir(batch_no, itens, {}, [])
+                    elif tipo == 'item':
+                        _, batch_no, item_id, dados = mensagem
+                        buffer.append((batch_no, item_id, dados))
+                        self._em_voo.release()
+                    elif tipo == 'cancelado':
+                        _, batch_no, itens, ocupava_vaga = mensagem
+                        self.metricas['itens_cancelados'] += len(itens)
+                        for item_id in itens:
+                            if ocupava_vaga:
+                                self._em_voo.release()
+                            resolver(batch_no, item_id, cancelado=True)
+                    else:
+                        _, batch_no, item_id, erro = mensagem
+                        self._em_voo.release()
+                        resolver(batch_no, item_id, erro)
+                
+                if len(buffer) >= self.tamanho_lote_gravacao or time.monotonic() >= limite:
+                    descarregar()
+                    limite = time.monotonic() + self.intervalo_gravacao
+        finally:
+            if conn and conn.is_connected():
+                conn.close()
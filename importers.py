@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Importação de Produtos e Vendas
+Handlers executados pelos workers da fila de jobs de importação
+"""
+
+import time
+from datetime import datetime
+from typing import Dict, List
+from database import DatabaseManager
+from meli_api import MercadoLivreAPI
+from import_jobs import ImportJob, ImportWorker, import_job_queue
+from import_pipeline import ImportPipeline
+from progress_events import progress_events
+
+# Instâncias usadas pelos handlers
+db = DatabaseManager()
+api = MercadoLivreAPI()
+
+def importar_categorias_se_necessario(user_id):
+    """Importa as categorias do site na primeira importação de produtos."""
+    try:
+        access_token = db.obter_access_token(user_id)
+        if access_token:
+            # Verifica se já existem categorias no banco
+            conn = db.conectar()
+            if conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT COUNT(*) FROM categorias_mlb")
+                    count = cursor.fetchone()[0]
+                    if count == 0:
+                        print("📋 Importando categorias automaticamente...")
+                        categorias = api.obter_categorias_site(access_token, "MLB")
+                        if categorias:
+                            db.salvar_categorias_mlb(categorias)
+                            print(f"✅ {len(categorias)} categorias importadas com sucesso")
+                conn.close()
+    except Exception as e:
+        print(f"⚠️ Erro ao importar categorias automaticamente: {e}")
+
+def _restaurar_progresso(job: ImportJob) -> Dict[str, int]:
+    """Restaura os contadores do job a partir dos lotes já registrados"""
+    resumo = import_job_queue.obter_resumo_lotes(job.id)
+    if resumo['lotes']:
+        print(f"♻️ Job {job.id}: retomando com {resumo['itens']} itens em {resumo['lotes']} lotes "
+              f"({resumo['sucesso']} já importados)")
+    job.atualizar(total=resumo['itens'], atual=resumo['sucesso'], sucesso=resumo['sucesso'], erros=0)
+    return resumo
+
+def _criar_pipeline(job: ImportJob, rotulo: str, buscar, gravar, num_buscadores: int) -> ImportPipeline:
+    """Cria o pipeline do job; cada lote concluído vai para o checkpoint e para o progresso"""
+    
+    def ao_concluir_lote(batch_no: int, itens: List[str], falhas: Dict[str, str], cancelados: List[str]):
+        # Itens cancelados antes da busca ficam pendentes no lote para a retomada
+        processados = len(itens) - len(cancelados)
+        sucesso = processados - len(falhas)
+        import_job_queue.concluir_lote(job.id, batch_no, sucesso, falhas, cancelados)
+        job.incrementar('sucesso', sucesso)
+        job.incrementar('erros', len(falhas))
+        job.incrementar('atual', processados)
+        
+        for item_id, erro in falhas.items():
+            print(f"❌ Erro em {rotulo} {item_id}: {erro}")
+        
+        atual, total = job.estado['atual'], job.estado['total']
+        descobrindo = not job.checkpoint.get('descoberta_concluida')
+        job.atualizar(
+            progresso=min(99, int(atual / total * 100)) if total else 0,
+            status=f"Importando {rotulo}: {atual}/{total}{' (buscando mais...)' if descobrindo else ''}"
+        )
+    
+    return ImportPipeline(
+        db, buscar, gravar, ao_concluir_lote,
+        user_id=job.user_id,
+        prioridade='bulk',
+        token=job.token,
+        num_buscadores=num_buscadores
+    ).iniciar()
+
+def _executar_importacao(job: ImportJob, pipeline: ImportPipeline, descobrir):
+    """Envia ao pipeline os lotes pendentes e, em seguida, os lotes descobertos.
+    
+    descobrir() produz (item_ids, cursor) por página; cada página é registrada
+    no checkpoint e enviada ao pipeline na hora, sobrepondo descoberta e gravação.
+    """
+    try:
+        # Lotes de execuções anteriores (ou apenas os itens que falharam)
+        for batch_no, itens in import_job_queue.obter_lotes_pendentes(job.id):
+            if job.interrompido:
+                return
+            pipeline.enviar_lote(batch_no, itens)
+        
+        if job.checkpoint.get('descoberta_concluida'):
+            return
+        
+        for item_ids, cursor in descobrir():
+            if job.interrompido:
+                return
+            batch_no = job.registrar_lote(item_ids, **cursor)
+            if batch_no is None:
+                return
+            job.incrementar('total', len(item_ids))
+            pipeline.enviar_lote(batch_no, item_ids)
+        
+        job.concluir_descoberta()
+    finally:
+        pipeline.finalizar()
+        cancelados = pipeline.metricas['itens_cancelados']
+        print(f"📈 Job {job.id}: {pipeline.metricas['itens_gravados']} itens gravados em "
+              f"{pipeline.metricas['transacoes']} transações "
+              f"(backpressure {pipeline.metricas['espera_backpressure_s']:.1f}s"
+              f"{f', {cancelados} cancelados' if cancelados else ''})")
+
+def _finalizar_importacao(job: ImportJob, rotulo: str, mensagem_vazia: str):
+    if job.interrompido:
+        return
+    
+    if not job.estado['total']:
+        job.atualizar(status=mensagem_vazia, progresso=100)
+        return
+    
+    ignorados = f' ({job.estado["ignorados"]} sem alterações)' if job.estado['ignorados'] else ''
+    job.atualizar(
+        progresso=100,
+        status=f'Concluído! {job.estado["sucesso"]} {rotulo} importados{ignorados}, {job.estado["erros"]} erros'
+    )
+    print(f"✅ Importação de {rotulo} concluída: {job.estado['sucesso']} salvos")
+
+def importar_produtos(job: ImportJob):
+    """Importa os produtos do usuário do job, retomando do checkpoint."""
+    user_id = job.user_id
+    _restaurar_progresso(job)
+    job.atualizar(status='Buscando lista de produtos...')
+    
+    # Importa categorias primeiro (se necessário)
+    if not job.checkpoint.get('descoberta_concluida'):
+        importar_categorias_se_necessario(user_id)
+    
+    def gravar(conn, itens):
+        if db.salvar_produtos_lote([detalhes for _, detalhes in itens], user_id, conn=conn):
+            return {}
+        return {mlb: 'Falha ao salvar lote no banco' for mlb, _ in itens}
+    
+    def descobrir():
+        alterados_desde = job.checkpoint.get('produtos_alterados_desde')
+        if alterados_desde:
+            # Retomada de um job já descoberto: só os anúncios criados ou alterados depois dele
+            for page_ids in api.iterar_ids_produtos_alterados(user_id, datetime.fromisoformat(alterados_desde)):
+                yield page_ids, {}
+            return
+        
+        # Cada página do scan vira um lote, registrado junto com o cursor que a sucede
+        for page_ids, cursor in api.iterar_ids_produtos(user_id, job.checkpoint.get('cursor_produtos')):
+            yield page_ids, {'cursor_produtos': cursor}
+    
+    pipeline = _criar_pipeline(
+        job, 'produtos',
+        buscar=lambda mlb: api.obter_detalhes_completos_produto(mlb, user_id, token=job.token),
+        gravar=gravar,
+        num_buscadores=6
+    )
+    _executar_importacao(job, pipeline, descobrir)
+    _finalizar_importacao(job, 'produtos', 'Nenhum produto encontrado')
+
+def importar_vendas(job: ImportJob):
+    """Importa as vendas do usuário do job, retomando do checkpoint."""
+    user_id = job.user_id
+    print(f"🚀 Iniciando importação de vendas para user_id: {user_id}")
+    
+    access_token = api.db.obter_access_token(user_id)
+    if not access_token:
+        raise Exception('Token de acesso não encontrado')
+    
+    _restaurar_progresso(job)
+    job.atualizar(status='Buscando IDs das vendas...')
+    
+    def gravar(conn, itens):
+        # Vendas sem alteração desde a última gravação não são regravadas
+        resultado = db.salvar_vendas_lote([venda for _, venda in itens], user_id, conn=conn, apenas_alteradas=True)
+        job.incrementar('ignorados', resultado['inalteradas'])
+        return {order_id: 'Falha ao salvar' for order_id in resultado['ids_com_erro']}
+    
+    def buscar(order_id):
+        # O frete é consultado por salvar_vendas_lote, só para as vendas que mudaram
+        job.token.verificar()
+        return api.obter_venda_por_id(order_id, access_token)
+    
+    def descobrir():
+        # Cada página da busca vira um lote, registrado junto com o cursor que a sucede
+        for page_ids, cursor in api.iterar_ids_vendas(user_id, job.checkpoint.get('cursor_vendas')):
+            yield page_ids, {'cursor_vendas': cursor}
+    
+    pipeline = _criar_pipeline(
+        job, 'vendas',
+        buscar=buscar,
+        gravar=gravar,
+        num_buscadores=15
+    )
+    _executar_importacao(job, pipeline, descobrir)
+    _finalizar_importacao(job, 'vendas', 'Nenhuma venda encontrada')
+
+# Handlers registrados por tipo de job
+HANDLERS_IMPORTACAO = {
+    'produtos': importar_produtos,
+    'vendas': importar_vendas,
+}
+
+# Worker global de importação do processo
+import_worker = None
+
+def start_import_worker(num_threads: int = 2):
+    """Cria as tabelas de jobs e de eventos e inicia o worker de importação deste processo"""
+    global import_worker
+    if not import_worker:
+        import_job_queue.criar_tabela()
+        progress_events.criar_tabela()
+        import_worker = ImportWorker(HANDLERS_IMPORTACAO, import_job_queue, num_threads)
+    import_worker.start()
+    return import_worker
+
+def stop_import_worker():
+    """Para o worker de importação deste processo"""
+    if import_worker:
+        import_worker.stop()
+
+if __name__ == "__main__":
+    # Executa apenas o worker de importação (processo dedicado)
+    import os
+    
+    worker = start_import_worker(int(os.getenv('IMPORT_WORKER_THREADS', 2)))
+    print("🧵 Worker de importação em execução - Ctrl+C para parar")
+    
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        worker.stop()
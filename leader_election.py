@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Eleição de Líder dos Loops em Background
+Cada loop de background (sincronização automática, monitor de tokens,
+manutenção) é um papel com lease na tabela background_leases: só o processo
+que detém o lease executa o loop, e outro assume quando o lease expira
+"""
+
+import os
+import json
+import time
+import queue
+import atexit
+import socket
+import threading
+from typing import Dict, List, Any, Callable, Optional
+from database import DatabaseManager
+import logging
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class LeaderElection:
+    """Leases por papel renovados por heartbeat, com o relógio do MySQL.
+    
+    - A aquisição é um único UPDATE condicional: só vence quem já detém o
+      lease ou quem encontra o lease livre/expirado.
+    - fencing_token cresce a cada troca de líder (identifica o mandato).
+    - Um líder que não consegue renovar deixa de se considerar líder antes
+      do lease expirar no banco, então dois processos nunca executam o mesmo
+      loop ao mesmo tempo (salvo pausas maiores que a margem).
+    - ao_assumir/ao_perder rodam numa thread própria de cada papel, em ordem:
+      um callback lento não atrasa a renovação dos leases.
+    """
+    
+    LEASE_SEGUNDOS = int(os.getenv('LEADER_LEASE_SEGUNDOS', 15))
+    INTERVALO_RENOVACAO = max(1, LEASE_SEGUNDOS // 3)
+    # Margem entre o fim do mandato local e a expiração do lease no banco
+    MARGEM_SEGUNDOS = 2
+    
+    def __init__(self, db_manager: DatabaseManager = None):
+        self.db = db_manager or DatabaseManager()
+        self.node_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._papeis = {}  # papel -> (ao_assumir, ao_perder)
+        self._estados = {}  # papel -> função cujo retorno o líder publica a cada renovação
+        self._transicoes = {}  # papel -> fila de callbacks executados pela thread do papel
+        self._mandatos = {}  # papel -> instante (monotonic) em que o mandato local termina
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+    
+    def criar_tabela(self) -> bool:
+        """Cria a tabela de leases dos papéis"""
+        conn = self.db.conectar()
+        if not conn:
+            return False
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS background_leases (
+                        role VARCHAR(64) PRIMARY KEY,
+                        holder VARCHAR(150) NULL,
+                        fencing_token BIGINT NOT NULL DEFAULT 0,
+                        acquired_at DATETIME NULL,
+                        renewed_at DATETIME NULL,
+                        lease_expires_at DATETIME NULL
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+                """)
+                
+                # Estado publicado pelo líder (ex.: métricas), lido pelos outros processos
+                cursor.execute("SHOW COLUMNS FROM background_leases LIKE 'state'")
+                if not cursor.fetchone():
+                    cursor.execute("ALTER TABLE background_leases ADD COLUMN state JSON NULL")
+                    cursor.execute("ALTER TABLE background_leases ADD COLUMN state_updated_at DATETIME NULL")
+                conn.commit()
+                return True
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao criar tabela de leases: {e}")
+            return False
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def registrar(self, papel: str, ao_assumir: Callable[[], None], ao_perder: Callable[[], None],
+                  estado: Callable[[], Dict[str, Any]] = None):
+        """Registra um papel: ao_assumir inicia o loop quando este processo vira líder,
+        ao_perder o para quando a liderança é perdida (ou o processo encerra).
+        Com estado, o líder publica o retorno dela a cada renovação (ver obter_estado)."""
+        with self._lock:
+            self._papeis[papel] = (ao_assumir, ao_perder)
+            if estado:
+                self._estados[papel] = estado
+            if papel not in self._transicoes:
+                self._transicoes[papel] = queue.Queue()
+                threading.Thread(target=self._loop_transicoes, args=(papel,),
+                                 name=f'leader-{papel}', daemon=True).start()
+    
+    def iniciar(self):
+        """Cria a tabela e inicia a thread de eleição"""
+        if self._thread and self._thread.is_alive():
+            return
+        
+        self.criar_tabela()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name='leader-election', daemon=True)
+        self._thread.start()
+        atexit.register(self.parar)
+        logger.info(f"🗳️ Eleição de líder iniciada em {self.node_id} ({', '.join(self._papeis)})")
+    
+    def parar(self):
+        """Para os loops liderados por este processo e libera os leases para failover imediato"""
+        self._stop_event.set()
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        
+        for papel in list(self._mandatos):
+            self._perder(papel, aguardar=True)
+            self._liberar(papel)
+    
+    def eh_lider(self, papel: str) -> bool:
+        """Se este processo detém o papel agora (mandato local ainda válido)"""
+        with self._lock:
+            return self._mandatos.get(papel, 0) > time.monotonic()
+    
+    def obter_lideres(self) -> List[Dict[str, Any]]:
+        """Líder atual de cada papel, segundo o banco"""
+        conn = self.db.conectar()
+        if not conn:
+            return []
+        
+        try:
+            with conn.cursor(dictionary=True) as cursor:
+                cursor.execute("""
+                    SELECT role, holder, fencing_token, acquired_at, renewed_at, lease_expires_at,
+                           lease_expires_at > NOW() AS ativo
+                    FROM background_leases
+                    ORDER BY role
+                """)
+                return [
+                    {
+                        'papel': row['role'],
+                        'lider': row['holder'] if row['ativo'] else None,
+                        'mandato': row['fencing_token'],
+                        'desde': row['acquired_at'].isoformat() if row['acquired_at'] else None,
+                        'renovado_em': row['renewed_at'].isoformat() if row['renewed_at'] else None,
+                        'expira_em': row['lease_expires_at'].isoformat() if row['lease_expires_at'] else None,
+                        'este_processo': bool(row['ativo']) and row['holder'] == self.node_id
+                    }
+                    for row in cursor.fetchall()
+                ]
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao obter líderes: {e}")
+            return []
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def obter_estado(self, papel: str) -> Optional[Dict[str, Any]]:
+        """Último estado publicado pelo líder do papel (None se não houver líder ativo)"""
+        conn = self.db.conectar()
+        if not conn:
+            return None
+        
+        try:
+            with conn.cursor(dictionary=True) as cursor:
+                cursor.execute("""
+                    SELECT holder, state, state_updated_at FROM background_leases
+                    WHERE role = %s AND lease_expires_at > NOW()
+                """, (papel,))
+                row = cursor.fetchone()
+                if not row or row['state'] is None:
+                    return None
+                return {
+                    'lider': row['holder'],
+                    'atualizado_em': row['state_updated_at'].isoformat() if row['state_updated_at'] else None,
+                    'estado': json.loads(row['state'])
+                }
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao obter estado de {papel}: {e}")
+            return None
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def _publicar_estado(self, papel: str):
+        """Grava o estado do papel liderado por este processo"""
+        estado = self._estados.get(papel)
+        if not estado:
+            return
+        
+        conn = self.db.conectar()
+        if not conn:
+            return
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE background_leases SET state = %s, state_updated_at = NOW()
+                    WHERE role = %s AND holder = %s
+                """, (json.dumps(estado(), default=str), papel, self.node_id))
+                conn.commit()
+        except Exception as e:
+            logger.error(f"❌ Erro ao publicar estado de {papel}: {e}")
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def _loop(self):
+        while not self._stop_event.is_set():
+            with self._lock:
+                papeis = list(self._papeis)
+            
+            for papel in papeis:
+                inicio = time.monotonic()
+                if self._adquirir_ou_renovar(papel):
+                    with self._lock:
+                        assumiu = papel not in self._mandatos
+                        self._mandatos[papel] = inicio + self.LEASE_SEGUNDOS - self.MARGEM_SEGUNDOS
+                    if assumiu:
+                        self._assumir(papel)
+                    else:
+                        self._publicar_estado(papel)
+                elif papel in self._mandatos and not self.eh_lider(papel):
+                    # Outro processo assumiu, ou o banco ficou fora por mais que o mandato
+                    self._perder(papel)
+            
+            self._stop_event.wait(self.INTERVALO_RENOVACAO)
+    
+    def _adquirir_ou_renovar(self, papel: str) -> bool:
+        """Renova o lease se for nosso, ou o toma se estiver livre ou expirado"""
+        conn = self.db.conectar()
+        if not conn:
+            return False
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("INSERT IGNORE INTO background_leases (role) VALUES (%s)", (papel,))
+                # holder é atribuído por último: as expressões anteriores ainda veem o líder antigo
+                cursor.execute("""
+                    UPDATE background_leases
+                    SET fencing_token = IF(holder <=> %s, fencing_token, fencing_token + 1),
+                        acquired_at = IF(holder <=> %s, acquired_at, NOW()),
+                        renewed_at = NOW(),
+                        lease_expires_at = NOW() + INTERVAL %s SECOND,
+                        holder = %s
+                    WHERE role = %s
+                    AND (holder <=> %s OR holder IS NULL OR lease_expires_at IS NULL OR lease_expires_at < NOW())
+                """, (self.node_id, self.node_id, self.LEASE_SEGUNDOS, self.node_id, papel, self.node_id))
+                conn.commit()
+                
+                cursor.execute("SELECT holder FROM background_leases WHERE role = %s", (papel,))
+                row = cursor.fetchone()
+                return bool(row) and row[0] == self.node_id
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao renovar lease de {papel}: {e}")
+            return False
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def _liberar(self, papel: str):
+        conn = self.db.conectar()
+        if not conn:
+            return
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE background_leases SET lease_expires_at = NOW()
+                    WHERE role = %s AND holder = %s
+                """, (papel, self.node_id))
+                conn.commit()
+        except Exception as e:
+            logger.error(f"❌ Erro ao liberar lease de {papel}: {e}")
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def _assumir(self, papel: str):
+        logger.info(f"👑 {self.node_id} assumiu a liderança de {papel}")
+        ao_assumir, _ = self._papeis[papel]
+        self._agendar_transicao(papel, ao_assumir, 'iniciar')
+    
+    def _perder(self, papel: str, aguardar: bool = False):
+        with self._lock:
+            if self._mandatos.pop(papel, None) is None:
+                return
+        logger.warning(f"⚠️ {self.node_id} deixou a liderança de {papel}")
+        _, ao_perder = self._papeis[papel]
+        concluida = self._agendar_transicao(papel, ao_perder, 'parar')
+        if aguardar:
+            concluida.wait(self.LEASE_SEGUNDOS)
+    
+    def _agendar_transicao(self, papel: str, callback: Callable[[], None], acao: str) -> threading.Event:
+        """Enfileira o callback para a thread do papel; o evento sinaliza o fim da execução"""
+        concluida = threading.Event()
+        self._transicoes[papel].put((callback, acao, concluida))
+        return concluida
+    
+    def _loop_transicoes(self, papel: str):
+        """Executa, em ordem, os callbacks de assumir/perder do papel"""
+        fila = self._transicoes[papel]
+        while True:
+            callback, acao, concluida = fila.get()
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"❌ Erro ao {acao} {papel}: {e}")
+            finally:
+                concluida.set()
+
+# Eleição de líder do processo
+leader_election = LeaderElection()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Bootstrap Pós-Login
+Executa em background as etapas que não precisam bloquear o callback OAuth;
+o status fica na tabela login_bootstrap (visível de qualquer worker)
+"""
+
+import json
+from datetime import datetime
+from typing import Dict, Any, List, Tuple, Optional
+from database import DatabaseManager
+from work_scheduler import WorkScheduler, work_scheduler
+
+class LoginBootstrap:
+    """Etapas pós-login executadas em background, com status por usuário no banco"""
+    
+    # Cadeias independentes executadas em paralelo; dentro de cada cadeia as etapas são sequenciais
+    CADEIAS = [
+        # (etapas, interromper_em_erro)
+        (['informacoes_usuario', 'consistencia'], False),
+        (['inicializar_sync', 'primeira_sincronizacao'], True),
+    ]
+    # Classe do agendador de cada etapa; as demais são rápidas e rodam como 'interactive'
+    PRIORIDADE_ETAPAS = {'primeira_sincronizacao': 'sync'}
+    TERMINAIS = ('concluida', 'erro', 'ignorada')
+    # Bootstrap "ativo" há mais que isso é de um processo que caiu: pode ser refeito
+    DURACAO_MAXIMA_MINUTOS = 30
+    
+    def __init__(self, api, auth_manager, agendador: WorkScheduler = None, db_manager: DatabaseManager = None):
+        self.api = api
+        self.auth_manager = auth_manager
+        self.agendador = agendador or work_scheduler
+        self.db = db_manager or DatabaseManager()
+    
+    def criar_tabela(self) -> bool:
+        """Cria a tabela de status do bootstrap (uma linha por usuário, sobrescrita a cada login)"""
+        conn = self.db.conectar()
+        if not conn:
+            return False
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS login_bootstrap (
+                        user_id BIGINT PRIMARY KEY,
+                        active BOOLEAN NOT NULL DEFAULT TRUE,
+                        started_at DATETIME NOT NULL,
+                        finished_at DATETIME NULL,
+                        stages JSON NOT NULL
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+                """)
+                conn.commit()
+                return True
+        except Exception as e:
+            print(f"❌ Erro ao criar tabela de bootstrap: {e}")
+            return False
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def iniciar(self, user_id: int) -> bool:
+        """Agenda o bootstrap do usuário; retorna False se já houver um em andamento"""
+        conn = self.db.conectar()
+        if not conn:
+            return False
+        
+        etapas = {
+            etapa: {'status': 'pendente', 'inicio': None, 'fim': None, 'mensagem': None}
+            for etapas, _ in self.CADEIAS for etapa in etapas
+        }
+        try:
+            with conn.cursor() as cursor:
+                # Um bootstrap ativo por usuário, mesmo com logins simultâneos em workers diferentes
+                cursor.execute("""
+                    SELECT active AND started_at > NOW() - INTERVAL %s MINUTE
+                    FROM login_bootstrap WHERE user_id = %s FOR UPDATE
+                """, (self.DURACAO_MAXIMA_MINUTOS, user_id))
+                atual = cursor.fetchone()
+                if atual and atual[0]:
+                    conn.rollback()
+                    return False
+                
+                cursor.execute("""
+                    REPLACE INTO login_bootstrap (user_id, active, started_at, finished_at, stages)
+                    VALUES (%s, TRUE, NOW(), NULL, %s)
+                """, (user_id, json.dumps(etapas)))
+                conn.commit()
+        except Exception as e:
+            print(f"❌ Erro ao registrar bootstrap de user_id {user_id}: {e}")
+            conn.rollback()
+            return False
+        finally:
+            if conn.is_connected():
+                conn.close()
+        
+        for etapas_cadeia, interromper_em_erro in self.CADEIAS:
+            self._submeter_cadeia(user_id, etapas_cadeia, interromper_em_erro)
+        
+        print(f"🚀 Bootstrap pós-login agendado para user_id {user_id}")
+        return True
+    
+    def obter_status(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Retorna o status do bootstrap do usuário"""
+        conn = self.db.conectar()
+        if not conn:
+            return None
+        
+        try:
+            with conn.cursor(dictionary=True) as cursor:
+                cursor.execute("""
+                    SELECT active, started_at, finished_at, stages
+                    FROM login_bootstrap WHERE user_id = %s
+                """, (user_id,))
+                row = cursor.fetchone()
+                if not row:
+                    return None
+                
+                etapas = json.loads(row['stages'])
+                for etapa in etapas.values():
+                    for campo in ('inicio', 'fim'):
+                        etapa[campo] = datetime.fromisoformat(etapa[campo]) if etapa[campo] else None
+                return {
+                    'ativo': bool(row['active']),
+                    'inicio': row['started_at'],
+                    'fim': row['finished_at'],
+                    'etapas': etapas
+                }
+        except Exception as e:
+            print(f"❌ Erro ao obter status do bootstrap de user_id {user_id}: {e}")
+            return None
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def _submeter_cadeia(self, user_id: int, etapas: List[str], interromper_em_erro: bool):
+        prioridade = self.PRIORIDADE_ETAPAS.get(etapas[0], 'interactive')
+        self.agendador.submeter(user_id, prioridade, self._executar_cadeia, user_id, etapas, interromper_em_erro)
+    
+    def _executar_cadeia(self, user_id: int, etapas: List[str], interromper_em_erro: bool):
+        """Executa as etapas de uma cadeia em sequência.
+        
+        Ao chegar numa etapa de outra classe do agendador, o restante da cadeia é
+        submetido de novo nessa classe (a primeira sincronização não ocupa a
+        classe interactive).
+        """
+        prioridade = self.PRIORIDADE_ETAPAS.get(etapas[0], 'interactive')
+        
+        for indice, etapa in enumerate(etapas):
+            if self.PRIORIDADE_ETAPAS.get(etapa, 'interactive') != prioridade:
+                self._submeter_cadeia(user_id, etapas[indice:], interromper_em_erro)
+                return
+            
+            self._atualizar_etapa(user_id, etapa, 'executando')
+            try:
+                sucesso, mensagem = getattr(self, f'_etapa_{etapa}')(user_id)
+            except Exception as e:
+                sucesso, mensagem = False, str(e)
+            
+            self._atualizar_etapa(user_id, etapa, 'concluida' if sucesso else 'erro', mensagem)
+            if not sucesso:
+                print(f"⚠️ Bootstrap user_id {user_id}: etapa {etapa} falhou - {mensagem}")
+                if interromper_em_erro:
+                    for restante in etapas[indice + 1:]:
+                        self._atualizar_etapa(user_id, restante, 'ignorada', 'Etapa anterior falhou')
+                    return
+    
+    def _atualizar_etapa(self, user_id: int, etapa: str, status: str, mensagem: str = None):
+        """Atualiza o status de uma etapa e encerra o bootstrap quando todas terminarem"""
+        conn = self.db.conectar()
+        if not conn:
+            return
+        
+        try:
+            with conn.cursor() as cursor:
+                # As cadeias rodam em paralelo: a linha é travada para ler e regravar as etapas
+                cursor.execute("""
+                    SELECT stages, started_at FROM login_bootstrap WHERE user_id = %s FOR UPDATE
+                """, (user_id,))
+                row = cursor.fetchone()
+                if not row:
+                    conn.rollback()
+                    return
+                
+                etapas = json.loads(row[0])
+                info = etapas[etapa]
+                info['status'] = status
+                info['mensagem'] = mensagem
+                info['inicio' if status == 'executando' else 'fim'] = datetime.now().isoformat()
+                
+                concluido = all(e['status'] in self.TERMINAIS for e in etapas.values())
+                cursor.execute("""
+                    UPDATE login_bootstrap
+                    SET stages = %s, active = %s, finished_at = IF(%s, NOW(), NULL)
+                    WHERE user_id = %s
+                """, (json.dumps(etapas), not concluido, concluido, user_id))
+                conn.commit()
+            
+            if concluido:
+                duracao = (datetime.now() - row[1]).total_seconds()
+                print(f"✅ Bootstrap pós-login concluído para user_id {user_id} em {duracao:.1f}s")
+        except Exception as e:
+            print(f"❌ Erro ao atualizar etapa {etapa} do bootstrap de user_id {user_id}: {e}")
+            conn.rollback()
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def _etapa_informacoes_usuario(self, user_id: int) -> Tuple[bool, str]:
+        if self.api.atualizar_informacoes_usuario(user_id):
+            return True, 'Informações do usuário atualizadas'
+        return False, 'Não foi possível obter as informações do usuário'
+    
+    def _etapa_consistencia(self, user_id: int) -> Tuple[bool, str]:
+        if self.auth_manager.garantir_consistencia_usuario(user_id):
+            return True, 'Tabelas de usuário consistentes'
+        return False, 'Usuário não encontrado nas tabelas de autenticação'
+    
+    def _etapa_inicializar_sync(self, user_id: int) -> Tuple[bool, str]:
+        from sync_manager import obter_sync_manager
+        
+        if obter_sync_manager().inicializar_sync_usuario(user_id):
+            return True, 'Sincronização configurada'
+        return False, 'Erro ao configurar sincronização'
+    
+    def _etapa_primeira_sincronizacao(self, user_id: int) -> Tuple[bool, str]:
+        from sync_manager import obter_sync_manager
+        sync_manager = obter_sync_manager()
+        
+        vendas = sync_manager.sincronizar_vendas_incremental(user_id)
+        produtos = sync_manager.sincronizar_produtos_incremental(user_id)
+        
+        if not vendas.get('success') or not produtos.get('success'):
+            erro = vendas.get('message') if not vendas.get('success') else produtos.get('message')
+            return False, erro
+        return True, f"{vendas.get('items', 0)} vendas e {produtos.get('items', 0)} produtos sincronizados"
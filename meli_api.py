@@ -6,18 +6,28 @@ import requests
 import asyncio
 import httpx
 import time
-from datetime import datetime
-from typing import Optional, List, Dict, Any
-from database import DatabaseManager
+from datetime import datetime, timedelta, date, tzinfo, time as dt_time
+from typing import Optional, List, Dict, Any, Iterator, Tuple
+from database import DatabaseManager, estado_reautenticacao, safe_float, MELI_API_BASE_URL
+from rate_limiter import limitador_ml
+from work_scheduler import CancellationToken, OperacaoCancelada
 
 class MercadoLivreAPI:
     """Classe para gerenciar integrações com a API do Mercado Livre."""
     
+    # Maior offset aceito pela busca de orders
+    LIMITE_OFFSET_BUSCA = 10000
+    # Maior offset da busca de anúncios sem scan
+    LIMITE_OFFSET_BUSCA_ITENS = 1000
+    # IDs por chamada de /items?ids=
+    LIMITE_MULTIGET = 20
+    
     def __init__(self):
         self.db = DatabaseManager()
-        self.base_url = "https://api.mercadolibre.com"
+        self.base_url = MELI_API_BASE_URL
         self.auth_url = "https://auth.mercadolivre.com.br/authorization"
-        self.token_url = "https://api.mercadolibre.com/oauth/token"
+        self.token_url = f"{self.base_url}/oauth/token"
+        self._fusos_datas = {}  # user_id -> fuso das datas dos pedidos, lido na primeira reconciliação
     
     def obter_url_autorizacao(self) -> str:
         """Gera URL para autorização OAuth."""
@@ -162,6 +172,7 @@ class MercadoLivreAPI:
                     WHERE user_id = %s
                 """, (user_id,))
                 conn.commit()
+                estado_reautenticacao.definir(user_id, True)
                 print(f"🔔 Usuário {user_id} marcado para reautenticação")
         except Exception as e:
             print(f"❌ Erro ao marcar para reautenticação: {e}")
@@ -169,8 +180,23 @@ class MercadoLivreAPI:
             if conn and conn.is_connected():
                 conn.close()
 
-    def verificar_necessidade_reautenticacao(self, user_id: int) -> bool:
-        """Verifica se usuário precisa reautenticar."""
+    def verificar_necessidade_reautenticacao(self, user_id: int, consultar_banco: bool = True) -> bool:
+        """Verifica se usuário precisa reautenticar.
+        
+        Usa o estado em memória quando disponível; com consultar_banco=False
+        (caminho dos webhooks) não consulta o usuário no banco: se a tabela em
+        memória expirou, ela é recarregada inteira (no máximo uma vez por TTL
+        no processo) e, sem entrada, assume False.
+        """
+        estado = estado_reautenticacao.obter(user_id)
+        if estado is not None:
+            return estado
+        if not consultar_banco:
+            if estado_reautenticacao.reivindicar_recarga():
+                self.db.carregar_estado_reautenticacao()
+            return bool(estado_reautenticacao.obter(user_id))
+        
+        conn = None
         try:
             conn = self.db.conectar()
             if not conn:
@@ -181,7 +207,9 @@ class MercadoLivreAPI:
                     SELECT needs_reauth FROM tokens WHERE user_id = %s
                 """, (user_id,))
                 resultado = cursor.fetchone()
-                return resultado[0] if resultado else False
+                needs_reauth = bool(resultado[0]) if resultado else False
+                estado_reautenticacao.definir(user_id, needs_reauth)
+                return needs_reauth
         except Exception as e:
             print(f"❌ Erro ao verificar necessidade de reautenticação: {e}")
             return False
@@ -189,150 +217,271 @@ class MercadoLivreAPI:
             if conn and conn.is_connected():
                 conn.close()
 
-    def sincronizar_dados_perdidos(self, user_id: int) -> bool:
-        """Sincroniza dados perdidos durante período de refresh token expirado."""
+    def sincronizar_dados_perdidos(self, user_id: int, tamanho_lote: int = 50) -> bool:
+        """Sincroniza dados perdidos durante período de refresh token expirado.
+        
+        Percorre a janela perdida em fatias diárias com paginação completa,
+        busca os pedidos em paralelo (no agendador global, sob o limitador de requisições), grava em
+        lotes e registra um checkpoint ao fim de cada fatia gravada sem erros,
+        para que uma execução interrompida retome de onde parou.
+        """
         print(f"🔄 Iniciando sincronização de dados perdidos para user_id: {user_id}")
         
         try:
-            conn = self.db.conectar()
-            if not conn:
+            estado = self.db.obter_estado_recuperacao(user_id)
+            if not estado:
+                print("❌ Usuário não encontrado")
                 return False
             
-            with conn.cursor() as cursor:
-                # Busca última tentativa de sincronização
-                cursor.execute("""
-                    SELECT last_reauth_attempt, last_sync_attempt 
-                    FROM tokens WHERE user_id = %s
-                """, (user_id,))
-                resultado = cursor.fetchone()
-                
-                if not resultado:
-                    print("❌ Usuário não encontrado")
-                    return False
-                
-                last_reauth, last_sync = resultado
-                
-                # Se não há data de reautenticação, não precisa sincronizar
-                if not last_reauth:
-                    print("✅ Nenhuma sincronização necessária")
-                    return True
-                
-                # Se já sincronizou após a última reautenticação, não precisa sincronizar novamente
-                if last_sync and last_sync >= last_reauth:
-                    print("✅ Dados já sincronizados")
-                    return True
-                
-                print(f"📅 Período de sincronização: {last_reauth} até agora")
-                
-                # Busca vendas do período perdido
-                access_token = self.db.obter_access_token(user_id)
-                if not access_token:
-                    print("❌ Token de acesso não encontrado")
-                    return False
-                
-                # Busca vendas do período
-                vendas_perdidas = self._buscar_vendas_periodo(user_id, access_token, last_reauth)
-                
-                if vendas_perdidas:
-                    print(f"📦 Encontradas {len(vendas_perdidas)} vendas perdidas")
-                    
-                    # Salva vendas perdidas
-                    sucessos = 0
-                    for venda in vendas_perdidas:
-                        if self.db.salvar_venda_completa(venda, user_id):
-                            sucessos += 1
-                    
-                    print(f"✅ {sucessos}/{len(vendas_perdidas)} vendas perdidas sincronizadas")
-                else:
-                    print("✅ Nenhuma venda perdida encontrada")
-                
-                # Atualiza timestamp de sincronização
-                cursor.execute("""
-                    UPDATE tokens 
-                    SET last_sync_attempt = NOW(), needs_reauth = 0
-                    WHERE user_id = %s
-                """, (user_id,))
-                conn.commit()
-                
+            last_reauth = estado.get('last_reauth_attempt')
+            last_sync = estado.get('last_sync_attempt')
+            checkpoint = estado.get('recovery_checkpoint')
+            
+            # Se não há data de reautenticação, não precisa sincronizar
+            if not last_reauth:
+                print("✅ Nenhuma sincronização necessária")
                 return True
-                
-        except Exception as e:
-            print(f"❌ Erro na sincronização: {e}")
-            import traceback
-            traceback.print_exc()
-            return False
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
-
-    def _buscar_vendas_periodo(self, user_id: int, access_token: str, data_inicio) -> List[Dict[str, Any]]:
-        """Busca vendas de um período específico."""
-        try:
-            from datetime import datetime, timedelta
-            import time
             
-            # Converte data_inicio para datetime se necessário
-            if isinstance(data_inicio, str):
-                data_inicio = datetime.fromisoformat(data_inicio.replace('Z', '+00:00'))
+            # Se já sincronizou após a última reautenticação, não precisa sincronizar novamente
+            if last_sync and last_sync >= last_reauth:
+                print("✅ Dados já sincronizados")
+                return True
             
-            # Busca vendas do período (últimos 30 dias para garantir cobertura)
-            data_fim = datetime.now()
-            data_inicio_periodo = data_inicio - timedelta(days=30)
+            access_token = self.db.obter_access_token(user_id)
+            if not access_token:
+                print("❌ Token de acesso não encontrado")
+                return False
             
-            print(f"🔍 Buscando vendas de {data_inicio_periodo} até {data_fim}")
+            retomando = bool(checkpoint and checkpoint > last_reauth)
+            inicio = checkpoint if retomando else last_reauth
+            fim = datetime.now()
+            print(f"📅 Período de sincronização: {inicio} até {fim}"
+                  + (" (retomando do checkpoint)" if retomando else ""))
             
-            url = f"{self.base_url}/orders/search"
             headers = {"Authorization": f"Bearer {access_token}"}
-            
-            all_orders = []
-            offset = 0
-            page_size = 50
-            max_pages = 200  # Limite de segurança
-            
-            for page in range(max_pages):
-                params = {
-                    "seller": user_id,
-                    "limit": page_size,
-                    "offset": offset,
-                    "order.date_created.from": data_inicio_periodo.isoformat(),
-                    "order.date_created.to": data_fim.isoformat()
-                }
-                
-                try:
-                    response = requests.get(url, headers=headers, params=params, timeout=30)
-                    response.raise_for_status()
-                    
-                    data = response.json()
-                    orders = data.get('results', [])
-                    
-                    if not orders:
-                        break
-                    
-                    # Filtra apenas vendas do período específico
-                    vendas_periodo = []
-                    for order in orders:
-                        order_date = datetime.fromisoformat(order.get('date_created', '').replace('Z', '+00:00'))
-                        if data_inicio <= order_date <= data_fim:
-                            vendas_periodo.append(order)
+            total_sucesso = 0
+            total_erros = 0
+            checkpoint_valido = True
+            
+            for janela_inicio, janela_fim in self._dividir_periodo(inicio, fim, timedelta(days=1)):
+                order_ids = self._buscar_ids_vendas_periodo(user_id, headers, janela_inicio, janela_fim)
+                erros_janela = 0
+                
+                if order_ids:
+                    print(f"📦 {len(order_ids)} vendas entre {janela_inicio} e {janela_fim}")
+                    vendas = self.obter_vendas_paralelo(order_ids, access_token, user_id)
+                    erros_janela += len(order_ids) - len(vendas)
                     
-                    all_orders.extend(vendas_periodo)
-                    
-                    if len(orders) < page_size:
-                        break
-                    
-                    offset += len(orders)
-                    time.sleep(0.1)  # Pausa para não sobrecarregar API
-                    
-                except requests.exceptions.RequestException as e:
-                    print(f"❌ Erro na página {page + 1}: {e}")
-                    break
+                    for i in range(0, len(vendas), tamanho_lote):
+                        resultado = self.db.salvar_vendas_lote(vendas[i:i + tamanho_lote], user_id)
+                        total_sucesso += resultado['sucesso']
+                        erros_janela += resultado['erros']
+                
+                total_erros += erros_janela
+                
+                # O checkpoint só avança enquanto todas as janelas anteriores foram gravadas sem erros
+                if erros_janela:
+                    checkpoint_valido = False
+                elif checkpoint_valido:
+                    self.db.salvar_checkpoint_recuperacao(user_id, janela_fim)
+            
+            print(f"✅ {total_sucesso} vendas perdidas sincronizadas, {total_erros} erros")
             
-            print(f"📊 Total de vendas encontradas no período: {len(all_orders)}")
-            return all_orders
+            if total_erros:
+                print("⚠️ Recuperação incompleta - será retomada a partir do último checkpoint")
+                return False
             
+            return self.db.concluir_recuperacao(user_id)
+        
         except Exception as e:
-            print(f"❌ Erro ao buscar vendas do período: {e}")
-            return []
+            print(f"❌ Erro na sincronização: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+    
+    def _get(self, url: str, headers: Dict[str, str] = None, params: Dict[str, Any] = None,
+             timeout: int = 30, tentativas: int = 3) -> requests.Response:
+        """GET sob o limitador global, respeitando 429/Retry-After."""
+        response = None
+        for tentativa in range(tentativas):
+            limitador_ml.adquirir()
+            response = requests.get(url, headers=headers, params=params, timeout=timeout)
+            if response.status_code != 429:
+                return response
+            
+            espera = safe_float(response.headers.get('Retry-After'), 2 ** tentativa)
+            print(f"⏳ Limite de requisições atingido (429) - aguardando {espera:.1f}s")
+            limitador_ml.pausar(espera)
+        return response
+    
+    @staticmethod
+    def _formatar_data_busca(data: datetime) -> str:
+        """Formata data para os filtros de busca de orders (ISO com fuso)."""
+        return data.astimezone().isoformat(timespec='milliseconds')
+    
+    @staticmethod
+    def _dividir_periodo(inicio: datetime, fim: datetime, passo: timedelta) -> Iterator[Tuple[datetime, datetime]]:
+        """Divide [inicio, fim] em janelas consecutivas de tamanho passo."""
+        atual = inicio
+        while atual < fim:
+            proximo = min(atual + passo, fim)
+            yield atual, proximo
+            atual = proximo
+    
+    def iterar_vendas_atualizadas(self, user_id: int, desde: datetime, ate: datetime = None,
+                                  passo: timedelta = timedelta(days=1)) -> Iterator[Tuple[datetime, List[Dict[str, Any]]]]:
+        """Percorre as vendas atualizadas (order.date_last_updated) entre desde e ate, janela a janela.
+        
+        Cada janela só é produzida depois de paginada por completo, junto com o
+        seu fim: quem consome pode avançar uma marca d'água até ele depois de
+        gravar as vendas. Erros da API são propagados.
+        """
+        access_token = self.db.obter_access_token(user_id)
+        if not access_token:
+            raise Exception("Token de acesso não encontrado")
+        
+        headers = {"Authorization": f"Bearer {access_token}"}
+        for janela_inicio, janela_fim in self._dividir_periodo(desde, ate or datetime.now(), passo):
+            yield janela_fim, self._buscar_vendas_periodo(user_id, headers, janela_inicio, janela_fim)
+    
+    def _buscar_ids_vendas_periodo(self, user_id: int, headers: Dict[str, str],
+                                   data_inicio: datetime, data_fim: datetime) -> List[str]:
+        """Busca IDs de todas as vendas atualizadas na janela, com paginação completa."""
+        vendas = self._buscar_vendas_periodo(user_id, headers, data_inicio, data_fim)
+        return [str(venda['id']) for venda in vendas if venda.get('id')]
+    
+    def _buscar_vendas_periodo(self, user_id: int, headers: Dict[str, str], data_inicio: datetime,
+                               data_fim: datetime, campo_data: str = 'date_last_updated') -> List[Dict[str, Any]]:
+        """Busca todas as vendas da janela (como vêm da busca), com paginação completa.
+        
+        campo_data é a data filtrada (date_last_updated ou date_created). Janelas
+        com mais resultados do que o offset máximo da busca são divididas ao
+        meio recursivamente.
+        """
+        url = f"{self.base_url}/orders/search"
+        page_size = 50
+        params = {
+            "seller": user_id,
+            "limit": page_size,
+            "offset": 0,
+            f"order.{campo_data}.from": self._formatar_data_busca(data_inicio),
+            f"order.{campo_data}.to": self._formatar_data_busca(data_fim),
+            "sort": "date_asc"
+        }
+        
+        response = self._get(url, headers=headers, params=params)
+        response.raise_for_status()
+        data = response.json()
+        total = data.get('paging', {}).get('total', 0)
+        
+        if total > self.LIMITE_OFFSET_BUSCA and data_fim - data_inicio > timedelta(minutes=1):
+            meio = data_inicio + (data_fim - data_inicio) / 2
+            return (self._buscar_vendas_periodo(user_id, headers, data_inicio, meio, campo_data)
+                    + self._buscar_vendas_periodo(user_id, headers, meio, data_fim, campo_data))
+        
+        vendas = [order for order in data.get('results', []) if order.get('id')]
+        offset = len(data.get('results', []))
+        
+        while offset < min(total, self.LIMITE_OFFSET_BUSCA):
+            params['offset'] = offset
+            response = self._get(url, headers=headers, params=params)
+            response.raise_for_status()
+            orders = response.json().get('results', [])
+            if not orders:
+                break
+            vendas.extend(order for order in orders if order.get('id'))
+            offset += len(orders)
+        
+        return vendas
+    
+    def _obter_fuso_datas(self, user_id: int, headers: Dict[str, str]) -> tzinfo:
+        """Fuso em que a API devolve as datas dos pedidos (as vendas gravam a data local
+        desse fuso); lido de um pedido do vendedor uma vez por processo e vendedor."""
+        if user_id not in self._fusos_datas:
+            response = self._get(f"{self.base_url}/orders/search", headers=headers,
+                                 params={"seller": user_id, "limit": 1})
+            response.raise_for_status()
+            pedidos = response.json().get('results', [])
+            data = pedidos[0].get('date_created') if pedidos else None
+            fuso = datetime.fromisoformat(data.replace('Z', '+00:00')).tzinfo if data else None
+            if not fuso:
+                return datetime.now().astimezone().tzinfo  # Sem pedidos: nada a comparar ainda
+            self._fusos_datas[user_id] = fuso
+        return self._fusos_datas[user_id]
+    
+    def janela_dia_vendas(self, user_id: int, dia: date) -> Tuple[datetime, datetime]:
+        """[início, fim) do dia no fuso das datas dos pedidos (o mesmo horário gravado em vendas)"""
+        access_token = self.db.obter_access_token(user_id)
+        if not access_token:
+            raise Exception("Token de acesso não encontrado")
+        
+        fuso = self._obter_fuso_datas(user_id, {"Authorization": f"Bearer {access_token}"})
+        inicio = datetime.combine(dia, dt_time.min, tzinfo=fuso)
+        return inicio, inicio + timedelta(days=1)
+    
+    def _contar_pedidos(self, user_id: int, headers: Dict[str, str], inicio: datetime, fim: datetime,
+                        status: str = None) -> int:
+        """Pedidos criados em [inicio, fim), só pela contagem da busca (paging.total)"""
+        params = {
+            "seller": user_id,
+            "limit": 1,
+            "order.date_created.from": self._formatar_data_busca(inicio),
+            # O filtro da busca é inclusivo nas duas pontas
+            "order.date_created.to": self._formatar_data_busca(fim - timedelta(milliseconds=1))
+        }
+        if status:
+            params["order.status"] = status
+        
+        response = self._get(f"{self.base_url}/orders/search", headers=headers, params=params)
+        response.raise_for_status()
+        return response.json().get('paging', {}).get('total', 0)
+    
+    def contar_vendas_por_dia(self, user_id: int, dias: List[date]) -> Dict[date, Tuple[int, int]]:
+        """(total, canceladas) de pedidos criados em cada dia, no fuso das datas da API.
+        
+        Duas requisições por dia, só com a contagem (paging.total): usadas para
+        comparar com o banco sem baixar os pedidos.
+        """
+        access_token = self.db.obter_access_token(user_id)
+        if not access_token:
+            raise Exception("Token de acesso não encontrado")
+        
+        headers = {"Authorization": f"Bearer {access_token}"}
+        contagens = {}
+        for dia in dias:
+            inicio, fim = self.janela_dia_vendas(user_id, dia)
+            contagens[dia] = (self._contar_pedidos(user_id, headers, inicio, fim),
+                              self._contar_pedidos(user_id, headers, inicio, fim, 'cancelled'))
+        return contagens
+    
+    def contar_vendas_criadas(self, user_id: int, inicio: datetime, fim: datetime) -> int:
+        """Total de pedidos criados em [inicio, fim) (uma requisição, só a contagem)"""
+        access_token = self.db.obter_access_token(user_id)
+        if not access_token:
+            raise Exception("Token de acesso não encontrado")
+        
+        return self._contar_pedidos(user_id, {"Authorization": f"Bearer {access_token}"}, inicio, fim)
+    
+    def buscar_vendas_criadas(self, user_id: int, inicio: datetime, fim: datetime) -> List[Dict[str, Any]]:
+        """Todos os pedidos criados em [inicio, fim), com paginação completa"""
+        access_token = self.db.obter_access_token(user_id)
+        if not access_token:
+            raise Exception("Token de acesso não encontrado")
+        
+        headers = {"Authorization": f"Bearer {access_token}"}
+        return self._buscar_vendas_periodo(user_id, headers, inicio, fim - timedelta(milliseconds=1), 'date_created')
+    
+    def contar_produtos_ativos(self, user_id: int) -> int:
+        """Total de anúncios ativos do vendedor (uma requisição, só a contagem)"""
+        access_token = self.db.obter_access_token(user_id)
+        if not access_token:
+            raise Exception("Token de acesso não encontrado")
+        
+        response = self._get(f"{self.base_url}/users/{user_id}/items/search",
+                             headers={"Authorization": f"Bearer {access_token}"},
+                             params={"status": "active", "limit": 1})
+        response.raise_for_status()
+        return response.json().get('paging', {}).get('total', 0)
     
     def obter_informacoes_usuario(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Obtém informações do usuário."""
@@ -356,58 +505,224 @@ class MercadoLivreAPI:
             print(f'Erro ao obter informações do usuário: {e}')
             return None
     
-    def obter_produtos_usuario(self, user_id: int) -> List[str]:
-        """Obtém lista de IDs dos produtos de um usuário."""
+    def atualizar_informacoes_usuario(self, user_id: int) -> bool:
+        """Atualiza user_info com os dados de /users/me do usuário."""
         access_token = self.db.obter_access_token(user_id)
         if not access_token:
-            return []
+            return False
         
         headers = {"Authorization": f"Bearer {access_token}"}
-        produtos = []
+        
+        try:
+            response = self._get(f"{self.base_url}/users/me", headers=headers, timeout=10)
+            response.raise_for_status()
+            return self.db.salvar_user_info(response.json())
+        except requests.exceptions.RequestException as e:
+            print(f'Erro ao atualizar informações do usuário {user_id}: {e}')
+            return False
+    
+    def iterar_ids_produtos(self, user_id: int, cursor: Dict[str, Any] = None) -> Iterator[Tuple[List[str], Dict[str, Any]]]:
+        """Percorre os IDs de todos os anúncios do usuário (busca scan), página a página.
+        
+        Cada página vem com o cursor que retoma a busca logo após ela:
+        {'scroll_id': scroll da busca, 'entregues': IDs já produzidos}. Se o
+        scroll expirar (inatividade ou retomada de checkpoint), a busca recomeça
+        e descarta os primeiros 'entregues' resultados.
+        """
+        access_token = self.db.obter_access_token(user_id)
+        if not access_token:
+            return
+        
+        url = f"{self.base_url}/users/{user_id}/items/search"
+        headers = {"Authorization": f"Bearer {access_token}"}
         limit = 100
-        scroll_id = None
-        max_iterations = 50  # Previne loop infinito
-        iteration_count = 0
         
-        print(f"🔍 Iniciando busca de produtos para usuário {user_id}")
+        cursor = dict(cursor or {})
+        scroll_id = cursor.get('scroll_id')
+        entregues = cursor.get('entregues', 0)
+        descartar = 0  # Resultados já entregues a pular após recomeçar o scan
+        token_renovado = False
         
-        while iteration_count < max_iterations:
-            iteration_count += 1
-            try:
-                url = f"{self.base_url}/users/{user_id}/items/search?search_type=scan&limit={limit}"
-                if scroll_id:
-                    url += f"&scroll_id={scroll_id}"
-                
-                response = requests.get(url, headers=headers)
-                response.raise_for_status()
-                data = response.json()
-                
-                scroll_id = data.get("scroll_id")
-                batch_produtos = data.get("results", [])
-                
-                if not batch_produtos:
-                    print(f"✅ Busca concluída. Total de produtos encontrados: {len(produtos)}")
+        print(f"🔍 Iniciando busca de produtos para usuário {user_id}"
+              f"{f' (retomando após {entregues})' if entregues else ''}")
+        
+        if entregues and not scroll_id:
+            descartar = entregues
+        
+        while True:
+            params = {"search_type": "scan", "limit": limit}
+            if scroll_id:
+                params["scroll_id"] = scroll_id
+            
+            response = self._get(url, headers=headers, params=params)
+            
+            if response.status_code == 401 and not token_renovado:
+                print("🔄 Token expirado. Tentando renovar...")
+                token_renovado = True
+                if self._renovar_token(user_id):
+                    headers = {"Authorization": f"Bearer {self.db.obter_access_token(user_id)}"}
+                    continue
+            
+            if scroll_id and response.status_code in (400, 404):
+                # Scroll expirado: recomeça o scan sem perder a posição
+                print(f"♻️ Scroll de produtos expirado após {entregues} IDs - recomeçando a busca")
+                scroll_id = None
+                descartar = entregues
+                continue
+            
+            response.raise_for_status()
+            data = response.json()
+            scroll_id = data.get("scroll_id")
+            resultados = [str(mlb) for mlb in data.get("results", [])]
+            
+            if not resultados:
+                print(f"✅ Busca concluída. Total de produtos encontrados: {entregues}")
+                return
+            
+            if descartar:
+                pulados = min(descartar, len(resultados))
+                resultados = resultados[pulados:]
+                descartar -= pulados
+                if not resultados:
+                    continue
+            
+            entregues += len(resultados)
+            yield resultados, {'scroll_id': scroll_id, 'entregues': entregues}
+    
+    @staticmethod
+    def _data_ml_local(valor: Optional[str]) -> Optional[datetime]:
+        """Converte uma data ISO da API para datetime local sem fuso (como as datas de controle)."""
+        if not valor:
+            return None
+        try:
+            data = datetime.fromisoformat(valor.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        return data.astimezone().replace(tzinfo=None) if data.tzinfo else data
+    
+    def _obter_itens_multiget(self, mlbs: List[str], headers: Dict[str, str],
+                              atributos: List[str] = None) -> Dict[str, Dict[str, Any]]:
+        """Busca anúncios com /items?ids= em lotes de LIMITE_MULTIGET; anúncios com erro ficam de fora."""
+        itens = {}
+        for i in range(0, len(mlbs), self.LIMITE_MULTIGET):
+            params = {"ids": ",".join(mlbs[i:i + self.LIMITE_MULTIGET])}
+            if atributos:
+                params["attributes"] = ",".join(atributos)
+            
+            response = self._get(f"{self.base_url}/items", headers=headers, params=params)
+            response.raise_for_status()
+            for resultado in response.json():
+                corpo = resultado.get('body') or {}
+                if resultado.get('code') == 200 and corpo.get('id'):
+                    itens[str(corpo['id'])] = corpo
+        return itens
+    
+    def iterar_ids_produtos_alterados(self, user_id: int, desde: datetime) -> Iterator[List[str]]:
+        """Percorre os IDs dos anúncios atualizados desde a data, página a página.
+        
+        Usa a busca ordenada por última atualização (decrescente) e para no
+        primeiro anúncio mais antigo que desde; as datas vêm de multi-get só
+        com id e last_updated. Se a busca não vier ordenada ou houver mais
+        alterações do que o offset máximo alcança, compara o catálogo inteiro.
+        """
+        access_token = self.db.obter_access_token(user_id)
+        if not access_token:
+            raise Exception("Token de acesso não encontrado")
+        
+        headers = {"Authorization": f"Bearer {access_token}"}
+        url = f"{self.base_url}/users/{user_id}/items/search"
+        limit = 100
+        offset = 0
+        anterior = None
+        entregues = set()
+        
+        while offset + limit <= self.LIMITE_OFFSET_BUSCA_ITENS:
+            params = {"orders": "last_updated_desc", "limit": limit, "offset": offset}
+            response = self._get(url, headers=headers, params=params)
+            response.raise_for_status()
+            page_ids = [str(mlb) for mlb in response.json().get("results", [])]
+            if not page_ids:
+                return
+            
+            datas = self._obter_itens_multiget(page_ids, headers, ["id", "last_updated"])
+            alterados = []
+            encerrar = False
+            for mlb in page_ids:
+                atualizado = self._data_ml_local(datas.get(mlb, {}).get('last_updated'))
+                if atualizado is None:
+                    alterados.append(mlb)  # Sem data: melhor regravar do que perder
+                    continue
+                if anterior and atualizado > anterior:
+                    print("⚠️ Busca de anúncios não veio ordenada por atualização - comparando o catálogo inteiro")
+                    yield from self._iterar_ids_alterados_catalogo(user_id, headers, desde, entregues)
+                    return
+                anterior = atualizado
+                if atualizado < desde:
+                    encerrar = True
                     break
-                
-                produtos.extend(batch_produtos)
-                print(f"📦 Lote {iteration_count}: +{len(batch_produtos)} produtos (total: {len(produtos)})")
-                    
-            except requests.exceptions.RequestException as e:
-                print(f'❌ Erro ao obter produtos: {e}')
-                # Se erro 401, tenta renovar token uma única vez
-                if hasattr(e, 'response') and e.response and e.response.status_code == 401:
-                    print("🔄 Token expirado. Tentando renovar...")
-                    if self._renovar_token(user_id):
-                        print("✅ Token renovado! Tentando novamente...")
-                        new_access_token = self.db.obter_access_token(user_id)
-                        if new_access_token:
-                            headers = {"Authorization": f"Bearer {new_access_token}"}
-                            continue
-                    print("❌ Falha ao renovar token")
-                break
+                alterados.append(mlb)
+            
+            if alterados:
+                entregues.update(alterados)
+                yield alterados
+            if encerrar or len(page_ids) < limit:
+                return
+            offset += len(page_ids)
         
-        if iteration_count >= max_iterations:
-            print(f"⚠️ Limite de iterações atingido ({max_iterations}). Parando busca.")
+        print(f"⚠️ Mais de {self.LIMITE_OFFSET_BUSCA_ITENS} anúncios alterados - comparando o catálogo inteiro")
+        yield from self._iterar_ids_alterados_catalogo(user_id, headers, desde, entregues)
+    
+    def _iterar_ids_alterados_catalogo(self, user_id: int, headers: Dict[str, str], desde: datetime,
+                                       ignorar: set) -> Iterator[List[str]]:
+        """Percorre o catálogo inteiro (scan) e produz os anúncios atualizados desde a data."""
+        for page_ids, _ in self.iterar_ids_produtos(user_id):
+            datas = self._obter_itens_multiget(page_ids, headers, ["id", "last_updated"])
+            alterados = []
+            for mlb in page_ids:
+                if mlb in ignorar:
+                    continue
+                atualizado = self._data_ml_local(datas.get(mlb, {}).get('last_updated'))
+                if atualizado is None or atualizado >= desde:
+                    alterados.append(mlb)
+            if alterados:
+                yield alterados
+    
+    def obter_detalhes_completos_produtos(self, mlbs: List[str], user_id: int,
+                                          token: Optional[CancellationToken] = None) -> Dict[str, Dict[str, Any]]:
+        """Detalhes completos de vários anúncios: dados básicos por multi-get e, em paralelo,
+        sugestão, custos, frete e variações de cada um. Anúncios com erro ficam de fora."""
+        access_token = self.db.obter_access_token(user_id)
+        if not access_token:
+            return {}
+        
+        headers = {"Authorization": f"Bearer {access_token}"}
+        itens = self._obter_itens_multiget(mlbs, headers)
+        if not itens:
+            return {}
+        
+        async def complementar():
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                resultados = await self._gather_cancelavel([
+                    self._complementar_produto_async(client, item, mlb, user_id, headers, token)
+                    for mlb, item in itens.items()
+                ], token, return_exceptions=True)
+            return {mlb: resultado for mlb, resultado in zip(itens, resultados) if isinstance(resultado, dict)}
+        
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(complementar())
+        finally:
+            loop.close()
+    
+    def obter_produtos_usuario(self, user_id: int) -> List[str]:
+        """Obtém lista de IDs dos produtos de um usuário."""
+        produtos = []
+        
+        try:
+            for page_ids, _ in self.iterar_ids_produtos(user_id):
+                produtos.extend(page_ids)
+        except requests.exceptions.RequestException as e:
+            print(f'❌ Erro ao obter produtos: {e}')
         
         return produtos
     
@@ -443,8 +758,29 @@ class MercadoLivreAPI:
                             print(f'❌ Erro mesmo após renovar token: {e2}')
             return None
     
-    async def obter_detalhes_completos_produto_async(self, mlb: str, user_id: int) -> Optional[Dict[str, Any]]:
+    @staticmethod
+    async def _gather_cancelavel(tarefas: List[Any], token: Optional[CancellationToken] = None,
+                                 return_exceptions: bool = False) -> List[Any]:
+        """asyncio.gather que acompanha o token: ao ser cancelado, cancela as
+        requisições ainda pendentes e levanta OperacaoCancelada."""
+        tarefas = [asyncio.ensure_future(tarefa) for tarefa in tarefas]
+        if token is not None:
+            pendentes = set(tarefas)
+            while pendentes:
+                if token.cancelado:
+                    for tarefa in pendentes:
+                        tarefa.cancel()
+                    await asyncio.gather(*pendentes, return_exceptions=True)
+                    raise OperacaoCancelada()
+                _, pendentes = await asyncio.wait(pendentes, timeout=0.2)
+        return await asyncio.gather(*tarefas, return_exceptions=return_exceptions)
+    
+    async def obter_detalhes_completos_produto_async(self, mlb: str, user_id: int,
+                                                     token: Optional[CancellationToken] = None) -> Optional[Dict[str, Any]]:
         """Obtém detalhes COMPLETOS de um produto de forma assíncrona - ULTRA OTIMIZADO."""
+        if token is not None:
+            token.verificar()
+        
         access_token = self.db.obter_access_token(user_id)
         if not access_token:
             return None
@@ -455,103 +791,112 @@ class MercadoLivreAPI:
             try:
                 # 1. Dados básicos do produto (obrigatório)
                 url_produto = f"{self.base_url}/items/{mlb}"
-                response = await client.get(url_produto, headers=headers)
+                response, = await self._gather_cancelavel([client.get(url_produto, headers=headers)], token)
                 response.raise_for_status()
                 produto_data = response.json()
                 
-                # 2. Busca dados adicionais em paralelo (não críticos)
-                tasks = []
-                
-                # Busca sugestões de preço
-                url_sugestao = f"{self.base_url}/suggestions/items/{mlb}/details"
-                tasks.append(self._fetch_optional_data(client, url_sugestao, headers, "sugestao"))
-                
-                # Busca custos (baseado nos dados do produto)
-                price = produto_data.get('price', 0)
-                listing_type = produto_data.get('listing_type_id', '')
-                category = produto_data.get('category_id', '')
-                
-                if price and listing_type and category:
-                    url_custos = f"https://api.mercadolibre.com/sites/MLB/listing_prices?price={price}&listing_type_id={listing_type}&category_id={category}"
-                    tasks.append(self._fetch_optional_data(client, url_custos, headers, "custos"))
-                
-                # Busca frete (sempre busca, depois aplica lógica)
-                frete_gratis = produto_data.get('shipping', {}).get('free_shipping', False)
-                url_frete = f"{self.base_url}/users/{user_id}/shipping_options/free?item_id={mlb}"
-                tasks.append(self._fetch_optional_data(client, url_frete, headers, "frete"))
-                
-                # Busca variações do produto
-                url_variacoes = f"{self.base_url}/items/{mlb}/variations"
-                tasks.append(self._fetch_optional_data(client, url_variacoes, headers, "variacoes"))
-                
-                # Executa todas as requisições em paralelo
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-                
-                # Processa resultados
-                sugestao_data = None
-                custos_data = None
-                frete_data = None
-                variacoes_data = None
-                
-                for result in results:
-                    if isinstance(result, dict):
-                        if result.get("type") == "sugestao":
-                            sugestao_data = result.get("data")
-                        elif result.get("type") == "custos":
-                            custos_data = result.get("data")
-                        elif result.get("type") == "frete":
-                            frete_data = result.get("data")
-                        elif result.get("type") == "variacoes":
-                            variacoes_data = result.get("data")
-                
-                # Processa variações se existirem
-                variations = None
-                if variacoes_data:
-                    # A API retorna um array direto, não um objeto com chave 'variations'
-                    variations_list = variacoes_data if isinstance(variacoes_data, list) else variacoes_data.get('variations', [])
-                    if variations_list:
-                        variations = []
-                        for variation in variations_list:
-                            variation_data = {
-                                'id': variation.get('id'),
-                                'price': variation.get('price', 0),
-                                'available_quantity': variation.get('available_quantity', 0),
-                                'sold_quantity': variation.get('sold_quantity', 0),
-                                'attributes': variation.get('attributes', []),
-                                'picture_ids': variation.get('picture_ids', []),
-                                'attribute_combinations': variation.get('attribute_combinations', [])
-                            }
-                            
-                            # Extrair informações de cor, tamanho, etc.
-                            for attr in variation_data['attribute_combinations']:
-                                if attr.get('id') in ['COLOR', 'SIZE', 'MODEL']:
-                                    variation_data['variation_attribute'] = attr.get('name', '')
-                                    variation_data['variation_value'] = attr.get('value_name', '')
-                                    break
-                            
-                            # Extrair SKU da variação
-                            for attr in variation_data['attributes']:
-                                if attr.get('id') == 'SELLER_SKU':
-                                    variation_data['variation_sku'] = attr.get('value_name', '')
-                                    break
-                            
-                            variations.append(variation_data)
-                
-                # Monta dados completos
-                return {
-                    'produto': produto_data,
-                    'sugestao': sugestao_data,
-                    'custos': custos_data,
-                    'frete': frete_data,
-                    'variations': variations,
-                    'preco_promocional': None,  # Simplificado para velocidade
-                    'preco_regular': None
-                }
+                # 2. Dados adicionais e montagem
+                return await self._complementar_produto_async(client, produto_data, mlb, user_id, headers, token)
                 
+            except OperacaoCancelada:
+                raise
             except Exception as e:
                 print(f"Erro ao obter detalhes do produto {mlb}: {e}")
                 return None
 
+    async def _complementar_produto_async(self, client: httpx.AsyncClient, produto_data: Dict[str, Any], mlb: str,
+                                          user_id: int, headers: dict,
+                                          token: Optional[CancellationToken] = None) -> Dict[str, Any]:
+        """Busca sugestão, custos, frete e variações de um anúncio já obtido e monta os detalhes completos."""
+        # Busca dados adicionais em paralelo (não críticos)
+        tasks = []
+        
+        # Busca sugestões de preço
+        url_sugestao = f"{self.base_url}/suggestions/items/{mlb}/details"
+        tasks.append(self._fetch_optional_data(client, url_sugestao, headers, "sugestao"))
+        
+        # Busca custos (baseado nos dados do produto)
+        price = produto_data.get('price', 0)
+        listing_type = produto_data.get('listing_type_id', '')
+        category = produto_data.get('category_id', '')
+        
+        if price and listing_type and category:
+            url_custos = f"{self.base_url}/sites/MLB/listing_prices?price={price}&listing_type_id={listing_type}&category_id={category}"
+            tasks.append(self._fetch_optional_data(client, url_custos, headers, "custos"))
+        
+        # Busca frete (sempre busca, depois aplica lógica)
+        frete_gratis = produto_data.get('shipping', {}).get('free_shipping', False)
+        url_frete = f"{self.base_url}/users/{user_id}/shipping_options/free?item_id={mlb}"
+        tasks.append(self._fetch_optional_data(client, url_frete, headers, "frete"))
+        
+        # Busca variações do produto
+        url_variacoes = f"{self.base_url}/items/{mlb}/variations"
+        tasks.append(self._fetch_optional_data(client, url_variacoes, headers, "variacoes"))
+        
+        # Executa todas as requisições em paralelo
+        results = await self._gather_cancelavel(tasks, token, return_exceptions=True)
+        
+        # Processa resultados
+        sugestao_data = None
+        custos_data = None
+        frete_data = None
+        variacoes_data = None
+        
+        for result in results:
+            if isinstance(result, dict):
+                if result.get("type") == "sugestao":
+                    sugestao_data = result.get("data")
+                elif result.get("type") == "custos":
+                    custos_data = result.get("data")
+                elif result.get("type") == "frete":
+                    frete_data = result.get("data")
+                elif result.get("type") == "variacoes":
+                    variacoes_data = result.get("data")
+        
+        # Processa variações se existirem
+        variations = None
+        if variacoes_data:
+            # A API retorna um array direto, não um objeto com chave 'variations'
+            variations_list = variacoes_data if isinstance(variacoes_data, list) else variacoes_data.get('variations', [])
+            if variations_list:
+                variations = []
+                for variation in variations_list:
+                    variation_data = {
+                        'id': variation.get('id'),
+                        'price': variation.get('price', 0),
+                        'available_quantity': variation.get('available_quantity', 0),
+                        'sold_quantity': variation.get('sold_quantity', 0),
+                        'attributes': variation.get('attributes', []),
+                        'picture_ids': variation.get('picture_ids', []),
+                        'attribute_combinations': variation.get('attribute_combinations', [])
+                    }
+                    
+                    # Extrair informações de cor, tamanho, etc.
+                    for attr in variation_data['attribute_combinations']:
+                        if attr.get('id') in ['COLOR', 'SIZE', 'MODEL']:
+                            variation_data['variation_attribute'] = attr.get('name', '')
+                            variation_data['variation_value'] = attr.get('value_name', '')
+                            break
+                    
+                    # Extrair SKU da variação
+                    for attr in variation_data['attributes']:
+                        if attr.get('id') == 'SELLER_SKU':
+                            variation_data['variation_sku'] = attr.get('value_name', '')
+                            break
+                    
+                    variations.append(variation_data)
+        
+        # Monta dados completos
+        return {
+            'produto': produto_data,
+            'sugestao': sugestao_data,
+            'custos': custos_data,
+            'frete': frete_data,
+            'variations': variations,
+            'preco_promocional': None,  # Simplificado para velocidade
+            'preco_regular': None
+        }
+    
     async def _fetch_optional_data(self, client: httpx.AsyncClient, url: str, headers: dict, data_type: str) -> dict:
         """Busca dados opcionais de forma assíncrona."""
         try:
@@ -562,15 +907,23 @@ class MercadoLivreAPI:
             pass
         return {"type": data_type, "data": None}
 
-    def obter_detalhes_completos_produto(self, mlb: str, user_id: int) -> Optional[Dict[str, Any]]:
-        """Obtém detalhes COMPLETOS de um produto (dados básicos + sugestões + custos + frete + variações) - OTIMIZADO."""
+    def obter_detalhes_completos_produto(self, mlb: str, user_id: int,
+                                         token: Optional[CancellationToken] = None) -> Optional[Dict[str, Any]]:
+        """Obtém detalhes COMPLETOS de um produto (dados básicos + sugestões + custos + frete + variações) - OTIMIZADO.
+        
+        Com token, as requisições em andamento são canceladas quando ele for
+        cancelado e OperacaoCancelada é propagada ao chamador.
+        """
         # Usa a versão assíncrona para melhor performance
         try:
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
-            result = loop.run_until_complete(self.obter_detalhes_completos_produto_async(mlb, user_id))
-            loop.close()
-            return result
+            try:
+                return loop.run_until_complete(self.obter_detalhes_completos_produto_async(mlb, user_id, token))
+            finally:
+                loop.close()
+        except OperacaoCancelada:
+            raise
         except Exception as e:
             print(f"Erro na versão assíncrona, usando versão síncrona: {e}")
     
@@ -674,7 +1027,7 @@ class MercadoLivreAPI:
             category = produto_data.get('category_id', '')
             
             if price and listing_type and category:
-                url_custos = f"https://api.mercadolibre.com/sites/MLB/listing_prices?price={price}&listing_type_id={listing_type}&category_id={category}"
+                url_custos = f"{self.base_url}/sites/MLB/listing_prices?price={price}&listing_type_id={listing_type}&category_id={category}"
                 response = requests.get(url_custos, headers=headers, timeout=3)  # Timeout reduzido
                 if response.status_code == 200:
                     custos_data = response.json()
@@ -828,7 +1181,8 @@ class MercadoLivreAPI:
             print(f"Erro na requisição de frete para o envio {envio_id}: {e}")
             return envio_id, None
     
-    async def obter_fretes_lote_async(self, orders_batch: List[Dict], user_id: int) -> Dict[str, Any]:
+    async def obter_fretes_lote_async(self, orders_batch: List[Dict], user_id: int,
+                                      token: Optional[CancellationToken] = None) -> Dict[str, Any]:
         """Obtém fretes de um lote de pedidos de forma assíncrona."""
         async with httpx.AsyncClient() as client:
             tasks = []
@@ -837,7 +1191,7 @@ class MercadoLivreAPI:
                 task = self.obter_frete_envio_async(client, envio_id, user_id)
                 tasks.append(task)
             
-            resultados = await asyncio.gather(*tasks)
+            resultados = await self._gather_cancelavel(tasks, token)
             return {envio_id: frete for envio_id, frete in resultados}
 
     def obter_frete_envio_vendas(self, user_id: int, limite: int = 50) -> Dict[str, Any]:
@@ -879,7 +1233,8 @@ class MercadoLivreAPI:
             if conn and conn.is_connected():
                 conn.close()
 
-    async def _obter_fretes_vendas_async(self, vendas: List[Dict], user_id: int) -> Dict[str, Any]:
+    async def _obter_fretes_vendas_async(self, vendas: List[Dict], user_id: int,
+                                         token: Optional[CancellationToken] = None) -> Dict[str, Any]:
         """Obtém fretes de vendas de forma assíncrona."""
         access_token = self.db.obter_access_token(user_id)
         if not access_token:
@@ -893,7 +1248,7 @@ class MercadoLivreAPI:
                 task = self.obter_frete_envio_async(client, envio_id, user_id)
                 tasks.append((pack_id, task))
             
-            resultados = await asyncio.gather(*[task for _, task in tasks])
+            resultados = await self._gather_cancelavel([task for _, task in tasks], token)
             
             # Mapeia pack_id -> frete
             fretes_por_pack = {}
@@ -1053,7 +1408,7 @@ class MercadoLivreAPI:
         headers = {"Authorization": f"Bearer {access_token}"}
         
         try:
-            response = requests.get(url, headers=headers, timeout=30)
+            response = self._get(url, headers=headers, timeout=30)
             response.raise_for_status()
             data = response.json()
             
@@ -1070,7 +1425,7 @@ class MercadoLivreAPI:
                 
                 for billing_url in billing_urls:
                     try:
-                        billing_response = requests.get(billing_url, headers=headers, timeout=30)
+                        billing_response = self._get(billing_url, headers=headers, timeout=30)
                         if billing_response.status_code == 200:
                             billing_data = billing_response.json()
                             print(f"✅ Dados de billing obtidos de {billing_url}")
@@ -1148,65 +1503,76 @@ class MercadoLivreAPI:
         print(f"✅ Busca de vendas concluída. Total: {len(all_orders)} vendas com detalhes completos")
         return all_orders[:limite]  # Garante que não exceda o limite
 
-    def obter_todos_ids_vendas(self, user_id: int, callback_progresso=None) -> List[str]:
-        """Obtém TODOS os IDs das vendas do usuário (fase 1 - rápida)."""
+    def iterar_ids_vendas(self, user_id: int, cursor: Dict[str, Any] = None) -> Iterator[Tuple[List[str], Dict[str, Any]]]:
+        """Percorre os IDs de todas as vendas em ordem de criação, página a página.
+        
+        Cada página vem com o cursor que retoma a busca logo após ela:
+        {'ate': limite superior fixado na primeira página, 'desde': início da
+        janela atual, 'offset': posição dentro da janela}. Perto do offset
+        máximo da busca, a janela avança para a data da última venda vista.
+        """
         access_token = self.db.obter_access_token(user_id)
         if not access_token:
-            return []
-        
-        print(f"🔍 Buscando TODOS os IDs de vendas para usuário {user_id}")
+            return
         
         url = f"{self.base_url}/orders/search"
         headers = {"Authorization": f"Bearer {access_token}"}
-        
-        all_order_ids = []
-        offset = 0
-        max_iterations = 1000
-        iteration_count = 0
         page_size = 50
         
-        while iteration_count < max_iterations:
-            iteration_count += 1
-            
+        cursor = dict(cursor or {})
+        cursor.setdefault('ate', self._formatar_data_busca(datetime.now()))
+        cursor.setdefault('desde', None)
+        cursor.setdefault('offset', 0)
+        
+        while True:
             params = {
                 "seller": user_id,
                 "limit": page_size,
-                "offset": offset
+                "offset": cursor['offset'],
+                "sort": "date_asc",
+                "order.date_created.to": cursor['ate']
             }
+            if cursor['desde']:
+                params["order.date_created.from"] = cursor['desde']
             
-            try:
-                response = requests.get(url, headers=headers, params=params, timeout=30)
-                response.raise_for_status()
-                
-                data = response.json()
-                orders = data.get('results', [])
-                
-                if not orders:
-                    print(f"✅ Nenhuma venda encontrada na página {iteration_count}")
-                    break
-                
-                # Extrai apenas os IDs
-                page_ids = [order.get('id') for order in orders if order.get('id')]
+            response = self._get(url, headers=headers, params=params)
+            response.raise_for_status()
+            orders = response.json().get('results', [])
+            if not orders:
+                return
+            
+            page_ids = [str(order['id']) for order in orders if order.get('id')]
+            proximo_offset = cursor['offset'] + len(orders)
+            ultima_data = orders[-1].get('date_created')
+            
+            if proximo_offset + page_size > self.LIMITE_OFFSET_BUSCA and ultima_data and ultima_data != cursor['desde']:
+                # Vendas com a mesma data da última podem reaparecer; a gravação é idempotente
+                cursor = {'ate': cursor['ate'], 'desde': ultima_data, 'offset': 0}
+            else:
+                cursor = {**cursor, 'offset': proximo_offset}
+            
+            yield page_ids, dict(cursor)
+            
+            if len(orders) < page_size:
+                return
+    
+    def obter_todos_ids_vendas(self, user_id: int, callback_progresso=None) -> List[str]:
+        """Obtém TODOS os IDs das vendas do usuário (fase 1 - rápida)."""
+        print(f"🔍 Buscando TODOS os IDs de vendas para usuário {user_id}")
+        
+        all_order_ids = []
+        pagina = 0
+        
+        try:
+            for page_ids, _ in self.iterar_ids_vendas(user_id):
+                pagina += 1
                 all_order_ids.extend(page_ids)
                 
                 # Callback de progresso
                 if callback_progresso:
-                    callback_progresso(len(all_order_ids), f"Página {iteration_count}")
-                
-                print(f"📦 Página {iteration_count}: {len(orders)} IDs encontrados (Total: {len(all_order_ids)})")
-                
-                # Se retornou menos que o tamanho da página, é a última página
-                if len(orders) < page_size:
-                    break
-                
-                offset += len(orders)
-                
-                # Pequena pausa para não sobrecarregar a API
-                time.sleep(0.05)
-                
-            except requests.exceptions.RequestException as e:
-                print(f"❌ Erro na requisição da página {iteration_count}: {e}")
-                break
+                    callback_progresso(len(all_order_ids), f"Página {pagina}")
+        except requests.exceptions.RequestException as e:
+            print(f"❌ Erro na requisição da página {pagina + 1}: {e}")
         
         print(f"✅ Busca de IDs concluída. Total: {len(all_order_ids)} vendas encontradas")
         return all_order_ids
@@ -1293,7 +1659,7 @@ class MercadoLivreAPI:
                 url = f"{self.base_url}/orders/{order_id}"
                 headers = {"Authorization": f"Bearer {access_token}"}
                 
-                response = requests.get(url, headers=headers, timeout=30)
+                response = self._get(url, headers=headers, timeout=30)
                 response.raise_for_status()
                 
                 return response.json()
@@ -1301,38 +1667,42 @@ class MercadoLivreAPI:
             print(f"❌ Erro ao buscar venda {order_id}: {e}")
             return None
 
-    def obter_vendas_paralelo(self, order_ids: List[str], access_token: str, max_workers: int = 10) -> List[Dict[str, Any]]:
-        """Obtém detalhes de múltiplas vendas em paralelo."""
-        from concurrent.futures import ThreadPoolExecutor, as_completed
+    def obter_vendas_paralelo(self, order_ids: List[str], access_token: str,
+                              user_id: int = None, prioridade: str = 'sync',
+                              token: Optional[CancellationToken] = None) -> List[Dict[str, Any]]:
+        """Obtém detalhes de múltiplas vendas em paralelo (no agendador global).
+        
+        Com o token cancelado, buscas ainda na fila são descartadas e retorna
+        apenas as vendas já obtidas.
+        """
+        from work_scheduler import work_scheduler
         
         def buscar_venda_individual(order_id: str) -> Optional[Dict[str, Any]]:
             """Busca uma venda individual (para uso em paralelo)"""
+            if token is not None and token.cancelado:
+                return None
             try:
                 return self.obter_venda_por_id(order_id, access_token)
             except Exception as e:
                 print(f"❌ Erro ao buscar venda {order_id}: {e}")
                 return None
         
-        vendas_encontradas = []
-        
-        print(f"🚀 Buscando {len(order_ids)} vendas em paralelo com {max_workers} threads...")
-        
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Submete todas as vendas
-            future_to_order = {
-                executor.submit(buscar_venda_individual, order_id): order_id 
-                for order_id in order_ids
-            }
-            
-            # Processa resultados conforme ficam prontos
-            for future in as_completed(future_to_order):
-                venda = future.result()
-                if venda:
-                    vendas_encontradas.append(venda)
-                
-                # Log de progresso a cada 50 vendas processadas
-                if len(vendas_encontradas) % 50 == 0:
-                    print(f"📊 {len(vendas_encontradas)}/{len(order_ids)} vendas processadas")
+        print(f"🚀 Buscando {len(order_ids)} vendas em paralelo...")
+        
+        futures = [
+            work_scheduler.submeter(user_id, prioridade, buscar_venda_individual, order_id)
+            for order_id in order_ids
+        ]
+        if token is None:
+            work_scheduler.aguardar(futures)
+        else:
+            pendentes = set(futures)
+            while pendentes:
+                if token.cancelado:
+                    for future in pendentes:
+                        future.cancel()
+                _, pendentes = work_scheduler.aguardar(pendentes, timeout=0.5)
+        vendas_encontradas = [future.result() for future in futures if not future.cancelled() and future.result()]
         
         print(f"✅ Busca paralela concluída: {len(vendas_encontradas)} vendas encontradas")
         return vendas_encontradas
@@ -1568,7 +1938,7 @@ class MercadoLivreAPI:
         listing_type = produto_data.get('listing_type_id', '')
         category = produto_data.get('category', '')
         
-        url = f"https://api.mercadolibre.com/sites/MLB/listing_prices?price={price}&listing_type_id={listing_type}&category_id={category}"
+        url = f"{self.base_url}/sites/MLB/listing_prices?price={price}&listing_type_id={listing_type}&category_id={category}"
         
         try:
             response = requests.get(url, headers=headers)
@@ -1623,7 +1993,7 @@ class MercadoLivreAPI:
         """Obtém preço promocional e regular de um produto."""
         try:
             headers = {"Authorization": f"Bearer {access_token}"}
-            response = requests.get(f"https://api.mercadolibre.com/items/{mlb}/sale_price", headers=headers, timeout=5)
+            response = requests.get(f"{self.base_url}/items/{mlb}/sale_price", headers=headers, timeout=5)
             response.raise_for_status()
             data = response.json()
             price = data.get("amount")
@@ -1637,7 +2007,7 @@ class MercadoLivreAPI:
         """Obtém categorias do site do Mercado Livre."""
         try:
             headers = {"Authorization": f"Bearer {access_token}"}
-            response = requests.get(f"https://api.mercadolibre.com/sites/{site_id}/categories", headers=headers, timeout=10)
+            response = requests.get(f"{self.base_url}/sites/{site_id}/categories", headers=headers, timeout=10)
             response.raise_for_status()
             data = response.json()
             print(f"✅ Categorias obtidas: {len(data)} categorias")
@@ -1650,7 +2020,7 @@ class MercadoLivreAPI:
         """Obtém o nome de uma categoria específica."""
         try:
             headers = {"Authorization": f"Bearer {access_token}"}
-            response = requests.get(f"https://api.mercadolibre.com/categories/{category_id}", headers=headers, timeout=5)
+            response = requests.get(f"{self.base_url}/categories/{category_id}", headers=headers, timeout=5)
             response.raise_for_status()
             data = response.json()
             return data.get('name', f'Categoria {category_id}')
@@ -1665,7 +2035,7 @@ class MercadoLivreAPI:
             
             # 1. Busca informações básicas do usuário (dados privados)
             print("🔍 Buscando dados básicos do usuário...")
-            response = requests.get("https://api.mercadolibre.com/users/me", headers=headers, timeout=10)
+            response = requests.get(f"{self.base_url}/users/me", headers=headers, timeout=10)
             response.raise_for_status()
             user_data = response.json()
             
@@ -1713,7 +2083,7 @@ class MercadoLivreAPI:
                 
                 # Busca apenas uma amostra para estimar os dados
                 orders_response = requests.get(
-                    f"https://api.mercadolibre.com/orders/search?seller={user_data['id']}&order.date_created.from={date_from}&order.date_created.to={date_to}&limit=50",
+                    f"{self.base_url}/orders/search?seller={user_data['id']}&order.date_created.from={date_from}&order.date_created.to={date_to}&limit=50",
                     headers=headers, timeout=10
                 )
                 
@@ -1836,7 +2206,7 @@ class MercadoLivreAPI:
             print("🔍 Buscando dados públicos do usuário...")
             public_data = None
             try:
-                public_response = requests.get(f"https://api.mercadolibre.com/users/{user_data['id']}", headers=headers, timeout=5)
+                public_response = requests.get(f"{self.base_url}/users/{user_data['id']}", headers=headers, timeout=5)
                 if public_response.status_code == 200:
                     public_data = public_response.json()
                     print("✅ Dados públicos obtidos")
@@ -1998,7 +2368,7 @@ class MercadoLivreAPI:
         """Obtém sugestão de preço do Mercado Livre para um produto."""
         try:
             headers = {"Authorization": f"Bearer {access_token}"}
-            url = f"https://api.mercadolibre.com/suggestions/items/{mlb}/details"
+            url = f"{self.base_url}/suggestions/items/{mlb}/details"
             
             response = requests.get(url, headers=headers)
             response.raise_for_status()
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Eventos de Progresso
+Importações, sincronizações e webhooks publicam eventos na tabela
+progress_events (de qualquer processo); o endpoint SSE os entrega aos
+navegadores conectados, retomando a partir do Last-Event-ID
+"""
+
+import os
+import json
+import time
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Any, Iterator
+from database import DatabaseManager
+import logging
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class ProgressEventBus:
+    """Publicação e leitura dos eventos de progresso.
+    
+    Os eventos carregam o estado completo do recurso (job, sincronização ou
+    notificação), não deltas: se um evento se perder, o próximo o substitui.
+    
+    Um único poller por processo lê os eventos novos do banco para um buffer
+    em memória; cada conexão SSE só lê esse buffer, então o custo no banco não
+    cresce com o número de abas abertas.
+    """
+    
+    CANAIS = ('import', 'sync', 'webhook')
+    
+    RETENCAO_HORAS = 24
+    INTERVALO_LIMPEZA_SEGUNDOS = 600
+    INTERVALO_POLL_SEGUNDOS = 1
+    TAMANHO_BUFFER = 1000
+    LIMITE_CONSULTA = 500
+    
+    INTERVALO_PING_SEGUNDOS = 15  # Comentário SSE para manter proxies com a conexão aberta
+    DURACAO_MAXIMA_STREAM_SEGUNDOS = 300  # O navegador reconecta sozinho enviando o Last-Event-ID
+    RETRY_MS = 3000
+    # Cada stream ocupa um worker/thread do servidor WSGI enquanto está aberto: acima
+    # do limite a conexão é recusada com um retry maior e o navegador tenta de novo depois
+    MAX_STREAMS_POR_PROCESSO = int(os.getenv('SSE_MAX_STREAMS_POR_PROCESSO', 20))
+    RETRY_LOTADO_MS = 30000
+    
+    def __init__(self, db_manager: DatabaseManager = None):
+        self.db = db_manager or DatabaseManager()
+        self._condicao = threading.Condition()
+        self._buffer = deque()
+        self._base_buffer = None  # Id imediatamente anterior ao primeiro evento do buffer
+        self._ultimo_lido = None
+        self._assinantes = 0
+        self._streams_abertos = 0
+        self._lock_streams = threading.Lock()
+        self._acordar = threading.Event()
+        self._poller = None
+        self._lock_poller = threading.Lock()
+        self._proxima_limpeza = 0
+    
+    def criar_tabela(self) -> bool:
+        """Cria a tabela de eventos de progresso"""
+        conn = self.db.conectar()
+        if not conn:
+            return False
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS progress_events (
+                        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                        user_id BIGINT NOT NULL,
+                        channel ENUM('import', 'sync', 'webhook') NOT NULL,
+                        event_type VARCHAR(50) NOT NULL,
+                        payload JSON NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        INDEX idx_user_id (user_id, id),
+                        INDEX idx_created_at (created_at)
+                    )
+                """)
+                conn.commit()
+                logger.info("✅ Tabela de eventos de progresso criada com sucesso")
+                return True
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao criar tabela de eventos de progresso: {e}")
+            return False
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def publicar(self, user_id: int, canal: str, tipo: str, dados: Dict[str, Any]) -> Optional[int]:
+        """Publica um evento para o usuário; falhas são apenas registradas no log"""
+        if not user_id or canal not in self.CANAIS:
+            return None
+        
+        conn = self.db.conectar()
+        if not conn:
+            return None
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO progress_events (user_id, channel, event_type, payload)
+                    VALUES (%s, %s, %s, %s)
+                """, (user_id, canal, tipo, json.dumps(dados, default=str)))
+                
+                if time.monotonic() >= self._proxima_limpeza:
+                    self._proxima_limpeza = time.monotonic() + self.INTERVALO_LIMPEZA_SEGUNDOS
+                    cursor.execute("""
+                        DELETE FROM progress_events
+                        WHERE created_at < NOW() - INTERVAL %s HOUR
+                        LIMIT 5000
+                    """, (self.RETENCAO_HORAS,))
+                
+                conn.commit()
+                evento_id = cursor.lastrowid
+            
+            # Eventos publicados neste processo chegam sem esperar o intervalo do poller
+            self._acordar.set()
+            return evento_id
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao publicar evento {canal}/{tipo} para user_id {user_id}: {e}")
+            return None
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def stream_sse(self, user_id: int, ultimo_id: Optional[int] = None) -> Iterator[str]:
+        """Gera o stream SSE do usuário a partir do evento seguinte a ultimo_id.
+        
+        Sem ultimo_id, começa pelos eventos publicados a partir de agora.
+        Com MAX_STREAMS_POR_PROCESSO streams abertos, encerra logo pedindo
+        ao navegador que reconecte após RETRY_LOTADO_MS.
+        """
+        user_id = int(user_id)
+        with self._lock_streams:
+            lotado = self._streams_abertos >= self.MAX_STREAMS_POR_PROCESSO
+            if not lotado:
+                self._streams_abertos += 1
+        
+        if lotado:
+            logger.warning(f"⚠️ Limite de {self.MAX_STREAMS_POR_PROCESSO} streams SSE atingido; user_id {user_id} reconecta depois")
+            yield f"retry: {self.RETRY_LOTADO_MS}\n\n"
+            return
+        
+        try:
+            yield f"retry: {self.RETRY_MS}\n\n"
+            
+            for evento in self._eventos_usuario(user_id, ultimo_id):
+                if evento is None:
+                    yield ": ping\n\n"
+                    continue
+                
+                yield (f"id: {evento['id']}\n"
+                       f"event: {evento['channel']}\n"
+                       f"data: {json.dumps({'tipo': evento['event_type'], **evento['payload']}, default=str)}\n\n")
+        finally:
+            with self._lock_streams:
+                self._streams_abertos -= 1
+    
+    def _eventos_usuario(self, user_id: int, ultimo_id: Optional[int]) -> Iterator[Optional[Dict[str, Any]]]:
+        """Eventos do usuário em ordem; produz None a cada ping sem eventos"""
+        self._registrar_assinante(1)
+        try:
+            if ultimo_id is None:
+                ultimo_id = self._id_atual()
+            
+            fim = time.monotonic() + self.DURACAO_MAXIMA_STREAM_SEGUNDOS
+            ultimo_envio = time.monotonic()
+            while time.monotonic() < fim:
+                eventos = self._aguardar_eventos(user_id, ultimo_id, self.INTERVALO_PING_SEGUNDOS)
+                if not eventos:
+                    if time.monotonic() - ultimo_envio >= self.INTERVALO_PING_SEGUNDOS:
+                        ultimo_envio = time.monotonic()
+                        yield None
+                    continue
+                
+                ultimo_envio = time.monotonic()
+                for evento in eventos:
+                    ultimo_id = evento['id']
+                    yield evento
+        finally:
+            self._registrar_assinante(-1)
+    
+    def _aguardar_eventos(self, user_id: int, ultimo_id: int, timeout: float) -> List[Dict[str, Any]]:
+        """Eventos do usuário após ultimo_id, aguardando até timeout por novos"""
+        with self._condicao:
+            if self._base_buffer is None or ultimo_id < self._base_buffer:
+                # Retomada anterior ao buffer: lê direto do banco
+                eventos = None
+            else:
+                eventos = self._filtrar_buffer(user_id, ultimo_id)
+                if not eventos:
+                    self._condicao.wait(timeout)
+                    eventos = self._filtrar_buffer(user_id, ultimo_id)
+        
+        if eventos is None:
+            eventos = self._consultar(ultimo_id, user_id)
+            if not eventos:
+                time.sleep(self.INTERVALO_POLL_SEGUNDOS)
+        return eventos
+    
+    def _filtrar_buffer(self, user_id: int, ultimo_id: int) -> List[Dict[str, Any]]:
+        return [e for e in self._buffer if e['id'] > ultimo_id and e['user_id'] == user_id]
+    
+    def _registrar_assinante(self, delta: int):
+        with self._lock_poller:
+            self._assinantes += delta
+            if self._assinantes > 0 and not (self._poller and self._poller.is_alive()):
+                self._poller = threading.Thread(target=self._loop_poller, name='progress-events', daemon=True)
+                self._poller.start()
+    
+    def _loop_poller(self):
+        """Lê os eventos novos do banco para o buffer e acorda as conexões SSE"""
+        conn = None
+        try:
+            while True:
+                self._acordar.wait(self.INTERVALO_POLL_SEGUNDOS)
+                self._acordar.clear()
+                
+                if not self._assinantes:
+                    # Sem conexões: o buffer seria reconstruído a partir de um ponto antigo
+                    with self._condicao:
+                        self._buffer.clear()
+                        self._base_buffer = self._ultimo_lido = None
+                    continue
+                
+                try:
+                    if conn is None or not conn.is_connected():
+                        conn = self.db.conectar()
+                        if not conn:
+                            continue
+                        # Cada SELECT precisa enxergar os commits de outros processos
+                        conn.autocommit = True
+                    
+                    with conn.cursor(dictionary=True) as cursor:
+                        if self._ultimo_lido is None:
+                            cursor.execute("SELECT COALESCE(MAX(id), 0) AS id FROM progress_events")
+                            self._ultimo_lido = cursor.fetchone()['id']
+                            with self._condicao:
+                                self._base_buffer = self._ultimo_lido
+                        
+                        eventos = self._consultar(self._ultimo_lido, cursor=cursor)
+                    
+                    if not eventos:
+                        continue
+                    
+                    with self._condicao:
+                        for evento in eventos:
+                            if len(self._buffer) >= self.TAMANHO_BUFFER:
+                                self._base_buffer = self._buffer.popleft()['id']
+                            self._buffer.append(evento)
+                        self._ultimo_lido = eventos[-1]['id']
+                        self._condicao.notify_all()
+                    
+                    if len(eventos) >= self.LIMITE_CONSULTA:
+                        self._acordar.set()
+                
+                except Exception as e:
+                    logger.error(f"❌ Erro ao ler eventos de progresso: {e}")
+                    if conn and conn.is_connected():
+                        conn.close()
+                    conn = None
+        finally:
+            if conn and conn.is_connected():
+                conn.close()
+    
+    def _consultar(self, apos_id: int, user_id: int = None, cursor=None) -> List[Dict[str, Any]]:
+        """Eventos com id > apos_id (de um usuário ou de todos)"""
+        sql = """
+            SELECT id, user_id, channel, event_type, payload, created_at
+            FROM progress_events
+            WHERE id > %s {filtro}
+            ORDER BY id
+            LIMIT %s
+        """.format(filtro='AND user_id = %s' if user_id is not None else '')
+        params = (apos_id, user_id, self.LIMITE_CONSULTA) if user_id is not None else (apos_id, self.LIMITE_CONSULTA)
+        
+        conn = None
+        try:
+            if cursor is None:
+                conn = self.db.conectar()
+                if not conn:
+                    return []
+                cursor = conn.cursor(dictionary=True)
+            
+            cursor.execute(sql, params)
+            eventos = cursor.fetchall()
+            for evento in eventos:
+                if isinstance(evento['payload'], (str, bytes, bytearray)):
+                    evento['payload'] = json.loads(evento['payload'])
+            return eventos
+        
+        except Exception as e:
+            if conn is None:
+                raise
+            logger.error(f"❌ Erro ao consultar eventos de progresso: {e}")
+            return []
+        finally:
+            if conn and conn.is_connected():
+                conn.close()
+    
+    def _id_atual(self) -> int:
+        """Id do evento mais recente (ponto de partida de um stream novo)"""
+        conn = self.db.conectar()
+        if not conn:
+            return 0
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT COALESCE(MAX(id), 0) FROM progress_events")
+                return cursor.fetchone()[0]
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao obter último evento de progresso: {e}")
+            return 0
+        finally:
+            if conn.is_connected():
+                conn.close()
+
+# Barramento global de eventos de progresso
+progress_events = ProgressEventBus()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Limitador de Requisições da API do Mercado Livre
+Token bucket compartilhado por todas as threads do processo
+"""
+
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+class RateLimiter:
+    """Token bucket thread-safe para requisições à API do Mercado Livre"""
+    
+    def __init__(self, taxa_por_segundo: float, capacidade: int = None):
+        self.taxa_por_segundo = max(0.1, float(taxa_por_segundo))
+        self.capacidade = capacidade or max(1, int(self.taxa_por_segundo))
+        self._tokens = float(self.capacidade)
+        self._ultima_reposicao = time.monotonic()
+        self._pausado_ate = 0.0
+        self._lock = threading.Lock()
+    
+    def _repor(self, agora: float):
+        """Repõe tokens proporcionalmente ao tempo decorrido"""
+        decorrido = agora - self._ultima_reposicao
+        if decorrido > 0:
+            self._tokens = min(self.capacidade, self._tokens + decorrido * self.taxa_por_segundo)
+            self._ultima_reposicao = agora
+    
+    def adquirir(self, tokens: int = 1):
+        """Bloqueia até haver tokens disponíveis"""
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._repor(agora)
+                
+                if agora < self._pausado_ate:
+                    espera = self._pausado_ate - agora
+                elif self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                else:
+                    espera = (tokens - self._tokens) / self.taxa_por_segundo
+            
+            time.sleep(espera)
+    
+    def pausar(self, segundos: float):
+        """Suspende todas as requisições (ex.: após um 429 com Retry-After)"""
+        with self._lock:
+            self._pausado_ate = max(self._pausado_ate, time.monotonic() + segundos)
+            self._tokens = 0.0
+
+# Limitador global do processo para a API do Mercado Livre
+limitador_ml = RateLimiter(
+    float(os.getenv('MELI_RATE_LIMIT_RPS', 10)),
+    int(os.getenv('MELI_RATE_LIMIT_BURST', 20))
+)
@@ -4,12 +4,18 @@ Sistema de Sincronização Incremental
 Detecta e sincroniza apenas mudanças ocorridas durante períodos offline
 """
 
+import os
 import time
+import heapq
 import threading
-from datetime import datetime, timedelta
+from collections import deque
+from datetime import datetime, timedelta, date
 from typing import Dict, List, Optional, Any
 from database import DatabaseManager
 from meli_api import MercadoLivreAPI
+from progress_events import progress_events
+from work_scheduler import work_scheduler
+from auth_manager import MaintenanceJob
 import logging
 
 # Configurar logging
@@ -17,7 +23,57 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class SyncManager:
-    """Gerenciador de sincronização incremental"""
+    """Gerenciador de sincronização incremental.
+    
+    A sincronização automática mantém o próximo vencimento de cada par
+    (usuário, tipo) numa fila de prioridade: o loop dorme até o vencimento mais
+    próximo e despacha só o que venceu, então o custo cresce com o trabalho
+    devido e não com o número de usuários.
+    """
+    
+    # Cada execução recomeça um pouco antes da marca d'água: cobre diferença de
+    # relógio e atraso de indexação da busca; a regravação é idempotente
+    SOBREPOSICAO_WATERMARK = timedelta(minutes=10)
+    PASSO_JANELA_VENDAS = timedelta(days=1)
+    # Itens com erro não seguram a marca d'água: ficam em sync_failed_items e são
+    # refeitos no início das próximas execuções, até MAX_TENTATIVAS_ITEM vezes
+    MAX_TENTATIVAS_ITEM = int(os.getenv('SYNC_MAX_TENTATIVAS_ITEM', 5))
+    
+    INTERVALO_RECARGA_SEGUNDOS = 60  # Releitura dos vencimentos (usuários novos, frequências alteradas)
+    MAX_SINCRONIZACOES_SIMULTANEAS = int(os.getenv('SYNC_MAX_SIMULTANEAS', 8))
+    AMOSTRAS_ATRASO = 500
+    
+    # Frequência adaptativa: o intervalo dobra a cada execução sem mudanças, volta à
+    # frequência configurada quando há mudanças e cai pela metade (até o mínimo) para
+    # vendedores com muito movimento
+    FREQUENCIA_MINIMA_MINUTOS = int(os.getenv('SYNC_FREQUENCIA_MIN_MINUTOS', 5))
+    FREQUENCIA_MAXIMA_MINUTOS = int(os.getenv('SYNC_FREQUENCIA_MAX_MINUTOS', 240))
+    # Com webhooks chegando o polling é só rede de segurança: recua mais e não encurta
+    FREQUENCIA_MAXIMA_COM_WEBHOOK_MINUTOS = int(os.getenv('SYNC_FREQUENCIA_MAX_WEBHOOK_MINUTOS', 720))
+    JANELA_COBERTURA_WEBHOOK = timedelta(hours=6)
+    MUDANCAS_POR_HORA_MOVIMENTADO = 6
+    TOPICOS_WEBHOOK = {'vendas': ('orders_v2', 'orders'), 'produtos': ('items',)}
+    
+    # Com cobertura de webhooks o polling é substituído por reconciliações baratas
+    # (contagens por dia); o polling completo continua como rede de segurança
+    INTERVALO_RECONCILIACAO = timedelta(hours=int(os.getenv('SYNC_INTERVALO_RECONCILIACAO_HORAS', 6)))
+    POLLING_MAXIMO_COM_WEBHOOK = timedelta(hours=24)
+    DIAS_RECONCILIACAO = int(os.getenv('SYNC_DIAS_RECONCILIACAO', 3))
+    # Depois de uma reconciliação achar mudanças que os webhooks não trouxeram
+    JANELA_LACUNA_WEBHOOK = timedelta(hours=24)
+    
+    # Reconciliação noturna: janelas de um dia divididas ao meio enquanto as contagens
+    # divergem, até caberem numa página da busca; só os pedidos ausentes são gravados
+    DIAS_RECONCILIACAO_NOTURNA = int(os.getenv('SYNC_RECONCILIACAO_NOTURNA_DIAS', 30))
+    PEDIDOS_POR_JANELA_FOLHA = 50
+    JANELA_MINIMA_BISSECCAO = timedelta(minutes=1)
+    
+    # sync_history guarda as execuções só por RETENCAO_HISTORICO_DIAS; os dias
+    # fechados ficam em sync_history_daily
+    RETENCAO_HISTORICO_DIAS = int(os.getenv('SYNC_HISTORICO_RETENCAO_DIAS', 7))
+    LOTE_LIMPEZA_HISTORICO = 5000
+    # Execuções que começam perto da meia-noite terminam no dia seguinte
+    CARENCIA_FECHAMENTO_DIA = timedelta(hours=1)
     
     def __init__(self, db_manager: DatabaseManager):
         self.db = db_manager
@@ -26,6 +82,20 @@ class SyncManager:
         self.sync_thread = None
         self.running = False
         
+        self._condicao = threading.Condition()
+        self._fila_agendamento = []  # heap de (vencimento monotônico, user_id, sync_type)
+        self._vencimentos = {}  # (user_id, sync_type) -> vencimento vigente; entradas antigas do heap são ignoradas
+        self._frequencias = {}  # (user_id, sync_type) -> minutos (frequência efetiva)
+        self._frequencias_base = {}  # (user_id, sync_type) -> minutos configurados
+        self._em_execucao = set()
+        self._recarregar = False
+        self._atrasos = deque(maxlen=self.AMOSTRAS_ATRASO)
+        # (user_id, inicio, fim) -> (total_api, total_local) de janelas já conferidas em que o
+        # banco só tem pedidos a mais: com as mesmas contagens, não são bissectadas de novo
+        self._janelas_so_excedente = {}
+        self._metricas_agendamento = {'despachadas': 0, 'concluidas': 0, 'erros': 0, 'ultima_recarga': None,
+                                      'reconciliacoes': 0, 'janelas_divergentes': 0, 'polls_evitados': 0}
+    
     def criar_tabelas_sync(self):
         """Cria tabelas necessárias para controle de sincronização"""
         conn = self.db.conectar()
@@ -54,6 +124,24 @@ class SyncManager:
                     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
                 """)
                 
+                # Marca d'água: tudo atualizado na API até ela já foi gravado
+                cursor.execute("SHOW COLUMNS FROM sync_control LIKE 'sync_watermark'")
+                if not cursor.fetchone():
+                    cursor.execute("ALTER TABLE sync_control ADD COLUMN sync_watermark DATETIME NULL AFTER last_successful_sync")
+                
+                # Frequência efetiva ajustada pela atividade; NULL usa sync_frequency_minutes
+                cursor.execute("SHOW COLUMNS FROM sync_control LIKE 'adaptive_frequency_minutes'")
+                if not cursor.fetchone():
+                    cursor.execute("ALTER TABLE sync_control ADD COLUMN adaptive_frequency_minutes INT NULL AFTER sync_frequency_minutes")
+                
+                # Última reconciliação por contagens e última lacuna de webhooks encontrada por ela
+                cursor.execute("SHOW COLUMNS FROM sync_control LIKE 'last_reconciled_at'")
+                if not cursor.fetchone():
+                    cursor.execute("ALTER TABLE sync_control ADD COLUMN last_reconciled_at DATETIME NULL AFTER sync_watermark")
+                cursor.execute("SHOW COLUMNS FROM sync_control LIKE 'webhook_gap_at'")
+                if not cursor.fetchone():
+                    cursor.execute("ALTER TABLE sync_control ADD COLUMN webhook_gap_at DATETIME NULL AFTER last_reconciled_at")
+                
                 # Tabela de histórico de sincronizações
                 cursor.execute("""
                     CREATE TABLE IF NOT EXISTS sync_history (
@@ -75,23 +163,50 @@ class SyncManager:
                     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
                 """)
                 
-                # Tabela de controle de produtos modificados
+                # Histórico recente por usuário (a tela ordena por started_at)
+                cursor.execute("SHOW INDEX FROM sync_history WHERE Key_name = 'idx_user_started'")
+                if not cursor.fetchall():
+                    cursor.execute("ALTER TABLE sync_history ADD INDEX idx_user_started (user_id, started_at)")
+                
+                # Agregados diários do histórico (mantidos depois que as execuções são removidas)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS sync_history_daily (
+                        user_id INT NOT NULL,
+                        sync_type ENUM('vendas', 'produtos', 'webhooks') NOT NULL,
+                        day DATE NOT NULL,
+                        runs INT NOT NULL DEFAULT 0,
+                        runs_success INT NOT NULL DEFAULT 0,
+                        runs_partial INT NOT NULL DEFAULT 0,
+                        runs_error INT NOT NULL DEFAULT 0,
+                        items_processed INT NOT NULL DEFAULT 0,
+                        items_created INT NOT NULL DEFAULT 0,
+                        items_updated INT NOT NULL DEFAULT 0,
+                        items_errors INT NOT NULL DEFAULT 0,
+                        duration_total_seconds INT NOT NULL DEFAULT 0,
+                        duration_p50_seconds INT NULL,
+                        duration_p95_seconds INT NULL,
+                        duration_max_seconds INT NULL,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                        PRIMARY KEY (user_id, sync_type, day),
+                        INDEX idx_day (day)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+                """)
+                
+                # Itens que falharam numa execução, refeitos nas seguintes
                 cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS product_changes (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
+                    CREATE TABLE IF NOT EXISTS sync_failed_items (
                         user_id INT NOT NULL,
-                        product_id VARCHAR(50) NOT NULL,
-                        change_type ENUM('created', 'updated', 'deleted', 'status_changed') NOT NULL,
-                        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        old_data JSON NULL,
-                        new_data JSON NULL,
-                        synced_at TIMESTAMP NULL,
-                        INDEX idx_user_product (user_id, product_id),
-                        INDEX idx_changed_at (changed_at),
-                        INDEX idx_synced (synced_at)
+                        sync_type ENUM('vendas', 'produtos') NOT NULL,
+                        item_id VARCHAR(50) NOT NULL,
+                        attempts INT NOT NULL DEFAULT 1,
+                        first_failed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        last_failed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (user_id, sync_type, item_id)
                     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
                 """)
                 
+                # product_changes é criada em DatabaseManager.criar_tabelas, junto com produtos
+                
                 conn.commit()
                 logger.info("✅ Tabelas de sincronização criadas com sucesso")
                 return True
@@ -113,6 +228,7 @@ class SyncManager:
             with conn.cursor() as cursor:
                 # Inserir configurações padrão para cada tipo de sync
                 sync_types = ['vendas', 'produtos', 'webhooks']
+                novo = False
                 
                 for sync_type in sync_types:
                     cursor.execute("""
@@ -120,8 +236,11 @@ class SyncManager:
                         (user_id, sync_type, last_sync_at, last_successful_sync, sync_frequency_minutes)
                         VALUES (%s, %s, NULL, NULL, %s)
                     """, (user_id, sync_type, 15 if sync_type == 'vendas' else 30))
+                    novo = novo or cursor.rowcount > 0
                 
                 conn.commit()
+                if novo:
+                    self.solicitar_recarga_agendamentos()
                 logger.info(f"✅ Sincronização inicializada para user_id: {user_id}")
                 return True
                 
@@ -192,262 +311,896 @@ class SyncManager:
             if conn.is_connected():
                 conn.close()
     
+    def obter_watermark(self, user_id: int, sync_type: str) -> Optional[datetime]:
+        """Marca d'água da sincronização: tudo atualizado até ela já foi gravado"""
+        conn = self.db.conectar()
+        if not conn:
+            return None
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT sync_watermark FROM sync_control
+                    WHERE user_id = %s AND sync_type = %s
+                """, (user_id, sync_type))
+                
+                result = cursor.fetchone()
+                return result[0] if result and result[0] else None
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao obter marca d'água de sincronização: {e}")
+            return None
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def avancar_watermark(self, user_id: int, sync_type: str, marca: datetime) -> bool:
+        """Avança a marca d'água (nunca a faz retroceder); chamado depois de gravar a janela"""
+        conn = self.db.conectar()
+        if not conn:
+            return False
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE sync_control
+                    SET sync_watermark = GREATEST(COALESCE(sync_watermark, %s), %s)
+                    WHERE user_id = %s AND sync_type = %s
+                """, (marca, marca, user_id, sync_type))
+                
+                conn.commit()
+                return True
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao avançar marca d'água de sincronização: {e}")
+            return False
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def registrar_itens_com_falha(self, user_id: int, sync_type: str, item_ids: List[str]) -> bool:
+        """Registra itens que falharam para serem refeitos nas próximas execuções"""
+        if not item_ids:
+            return True
+        
+        conn = self.db.conectar()
+        if not conn:
+            return False
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.executemany("""
+                    INSERT INTO sync_failed_items (user_id, sync_type, item_id)
+                    VALUES (%s, %s, %s)
+                    ON DUPLICATE KEY UPDATE attempts = attempts + 1, last_failed_at = NOW()
+                """, [(user_id, sync_type, str(item_id)) for item_id in item_ids])
+                conn.commit()
+                return True
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao registrar itens com falha ({sync_type}): {e}")
+            return False
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def _obter_itens_com_falha(self, user_id: int, sync_type: str) -> List[str]:
+        """Itens com falha que ainda não esgotaram as tentativas"""
+        conn = self.db.conectar()
+        if not conn:
+            return []
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT item_id FROM sync_failed_items
+                    WHERE user_id = %s AND sync_type = %s AND attempts < %s
+                    ORDER BY first_failed_at
+                """, (user_id, sync_type, self.MAX_TENTATIVAS_ITEM))
+                return [row[0] for row in cursor.fetchall()]
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao obter itens com falha ({sync_type}): {e}")
+            return []
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def _remover_itens_com_falha(self, user_id: int, sync_type: str, item_ids: List[str]):
+        """Remove da lista de falhas os itens refeitos com sucesso"""
+        if not item_ids:
+            return
+        
+        conn = self.db.conectar()
+        if not conn:
+            return
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f"""
+                    DELETE FROM sync_failed_items
+                    WHERE user_id = %s AND sync_type = %s AND item_id IN ({', '.join(['%s'] * len(item_ids))})
+                """, (user_id, sync_type, *item_ids))
+                conn.commit()
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao remover itens com falha ({sync_type}): {e}")
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def _refazer_vendas_com_falha(self, user_id: int) -> Dict[str, int]:
+        """Busca e grava de novo as vendas que falharam em execuções anteriores"""
+        stats = {'total': 0, 'created': 0, 'updated': 0, 'errors': 0, 'skipped': 0}
+        order_ids = self._obter_itens_com_falha(user_id, 'vendas')
+        if not order_ids:
+            return stats
+        
+        access_token = self.db.obter_access_token(user_id)
+        if not access_token:
+            return stats
+        
+        logger.info(f"🔁 Refazendo {len(order_ids)} vendas que falharam antes")
+        # Poucas vendas por execução: busca sequencial, sem ocupar o agendador a partir da sincronização
+        vendas = [venda for venda in (self.api.obter_venda_por_id(order_id, access_token) for order_id in order_ids)
+                  if venda]
+        falhas = []
+        stats = self._processar_vendas_modificadas(user_id, vendas, falhas)
+        # Vendas que nem foram obtidas da API também contam como falha
+        obtidas = {str(venda.get('id', '')) for venda in vendas}
+        ausentes = [order_id for order_id in order_ids if order_id not in obtidas]
+        falhas.extend(ausentes)
+        stats['total'] += len(ausentes)
+        stats['errors'] += len(ausentes)
+        
+        self._remover_itens_com_falha(user_id, 'vendas', [order_id for order_id in order_ids if order_id not in falhas])
+        self.registrar_itens_com_falha(user_id, 'vendas', falhas)
+        return stats
+    
+    def _refazer_produtos_com_falha(self, user_id: int) -> Dict[str, int]:
+        """Busca e grava de novo os anúncios que falharam em execuções anteriores"""
+        stats = {'total': 0, 'created': 0, 'updated': 0, 'changed': 0, 'errors': 0}
+        mlbs = self._obter_itens_com_falha(user_id, 'produtos')
+        if not mlbs:
+            return stats
+        
+        logger.info(f"🔁 Refazendo {len(mlbs)} produtos que falharam antes")
+        falhas = []
+        for i in range(0, len(mlbs), self.api.LIMITE_MULTIGET):
+            stats_lote = self._processar_produtos_modificados(user_id, mlbs[i:i + self.api.LIMITE_MULTIGET], falhas)
+            for campo in stats:
+                stats[campo] += stats_lote[campo]
+        
+        self._remover_itens_com_falha(user_id, 'produtos', [mlb for mlb in mlbs if mlb not in falhas])
+        self.registrar_itens_com_falha(user_id, 'produtos', falhas)
+        return stats
+    
     def sincronizar_vendas_incremental(self, user_id: int) -> Dict[str, Any]:
-        """Sincroniza apenas vendas modificadas desde a última sincronização"""
+        """Sincroniza as vendas atualizadas desde a marca d'água.
+        
+        A busca é por data de atualização (pega mudanças de status de vendas
+        antigas), com paginação completa, em janelas; a marca d'água avança até
+        o fim de cada janela gravada. Vendas com erro vão para sync_failed_items
+        e são refeitas no início das execuções seguintes.
+        """
         logger.info(f"🔄 Iniciando sincronização incremental de vendas para user_id: {user_id}")
         
         # Registrar início da sincronização
         sync_id = self._registrar_inicio_sync(user_id, 'vendas')
+        stats = {'total': 0, 'created': 0, 'updated': 0, 'errors': 0, 'skipped': 0}
         
         try:
-            # Obter última sincronização
-            ultima_sync = self.obter_ultima_sincronizacao(user_id, 'vendas')
+            marca = self.obter_watermark(user_id, 'vendas')
+            if not marca:
+                # Sem marca d'água ainda: parte da última sincronização bem-sucedida
+                marca = self.obter_ultima_sincronizacao(user_id, 'vendas')
             
-            if not ultima_sync:
-                logger.info("📅 Primeira sincronização - buscando vendas dos últimos 7 dias")
+            if not marca:
+                logger.info("📅 Primeira sincronização - buscando vendas atualizadas nos últimos 7 dias")
                 data_inicio = datetime.now() - timedelta(days=7)
             else:
-                logger.info(f"📅 Sincronizando desde: {ultima_sync}")
-                data_inicio = ultima_sync
+                data_inicio = marca - self.SOBREPOSICAO_WATERMARK
+                logger.info(f"📅 Sincronizando vendas atualizadas desde: {data_inicio}")
+            
+            stats_refeitas = self._refazer_vendas_com_falha(user_id)
+            for campo in stats:
+                stats[campo] += stats_refeitas[campo]
             
-            # Obter token de acesso
-            access_token = self.db.obter_access_token(user_id)
-            if not access_token:
-                raise Exception("Token de acesso não encontrado")
+            janelas_gravadas = True
+            for fim_janela, vendas in self.api.iterar_vendas_atualizadas(user_id, data_inicio,
+                                                                         passo=self.PASSO_JANELA_VENDAS):
+                if vendas:
+                    falhas = []
+                    stats_janela = self._processar_vendas_modificadas(user_id, vendas, falhas)
+                    for campo in stats:
+                        stats[campo] += stats_janela[campo]
+                    
+                    if falhas:
+                        if not self.registrar_itens_com_falha(user_id, 'vendas', falhas):
+                            # Sem o registro das falhas a janela é refeita a partir da marca d'água atual
+                            logger.warning(f"⚠️ {len(falhas)} vendas com erro na janela até {fim_janela}"
+                                           " - marca d'água mantida")
+                            janelas_gravadas = False
+                            break
+                        logger.warning(f"⚠️ {len(falhas)} vendas com erro na janela até {fim_janela}"
+                                       " - refeitas na próxima execução")
+                
+                self.avancar_watermark(user_id, 'vendas', fim_janela)
             
-            # Buscar vendas modificadas no período
-            vendas_modificadas = self._buscar_vendas_periodo(user_id, access_token, data_inicio)
+            janelas_gravadas = janelas_gravadas and not stats['errors']
+            status = 'success' if janelas_gravadas else 'partial'
+            self._registrar_fim_sync(sync_id, status,
+                                   stats['total'], stats['created'],
+                                   stats['updated'], stats['errors'])
+            self.atualizar_ultima_sincronizacao(
+                user_id, 'vendas', status,
+                None if janelas_gravadas else f"{stats['errors']} vendas com erro"
+            )
             
-            if not vendas_modificadas:
+            if not stats['total']:
                 logger.info("✅ Nenhuma venda modificada encontrada")
-                self._registrar_fim_sync(sync_id, 'success', 0, 0, 0, 0)
-                self.atualizar_ultima_sincronizacao(user_id, 'vendas', 'success')
                 return {'success': True, 'message': 'Nenhuma mudança encontrada', 'items': 0}
             
-            # Processar vendas modificadas
-            stats = self._processar_vendas_modificadas(user_id, vendas_modificadas)
-            
-            # Registrar sucesso
-            self._registrar_fim_sync(sync_id, 'success', 
-                                   stats['total'], stats['created'], 
-                                   stats['updated'], stats['errors'])
-            self.atualizar_ultima_sincronizacao(user_id, 'vendas', 'success')
-            
             logger.info(f"✅ Sincronização concluída: {stats['total']} vendas processadas")
             return {
-                'success': True,
-                'message': f'Sincronização concluída',
+                'success': janelas_gravadas,
+                'message': 'Sincronização concluída' if janelas_gravadas else 'Sincronização parcial',
                 'items': stats['total'],
                 'created': stats['created'],
                 'updated': stats['updated'],
-                'errors': stats['errors']
+                'errors': stats['errors'],
+                'skipped': stats['skipped']
             }
             
         except Exception as e:
             logger.error(f"❌ Erro na sincronização incremental: {e}")
-            self._registrar_fim_sync(sync_id, 'error', 0, 0, 0, 0, str(e))
+            self._registrar_fim_sync(sync_id, 'error', stats['total'], stats['created'],
+                                     stats['updated'], stats['errors'], str(e))
             self.atualizar_ultima_sincronizacao(user_id, 'vendas', 'error', str(e))
             return {'success': False, 'message': str(e)}
     
     def sincronizar_produtos_incremental(self, user_id: int) -> Dict[str, Any]:
-        """Sincroniza apenas produtos modificados desde a última sincronização"""
+        """Sincroniza os anúncios atualizados desde a marca d'água.
+        
+        A descoberta usa a busca ordenada por última atualização e para no
+        primeiro anúncio já sincronizado; os detalhes vêm por multi-get. A marca
+        d'água avança para o início da execução; anúncios com erro (inclusive os
+        que a API não devolve) vão para sync_failed_items e são refeitos nas
+        execuções seguintes, até MAX_TENTATIVAS_ITEM vezes.
+        """
         logger.info(f"🔄 Iniciando sincronização incremental de produtos para user_id: {user_id}")
         
         # Registrar início da sincronização
         sync_id = self._registrar_inicio_sync(user_id, 'produtos')
+        stats = {'total': 0, 'created': 0, 'updated': 0, 'changed': 0, 'errors': 0}
+        # Alterações feitas durante a execução ficam para a próxima
+        inicio_execucao = datetime.now()
         
         try:
-            # Obter última sincronização
-            ultima_sync = self.obter_ultima_sincronizacao(user_id, 'produtos')
+            marca = self.obter_watermark(user_id, 'produtos')
+            if not marca:
+                marca = self.obter_ultima_sincronizacao(user_id, 'produtos')
             
-            if not ultima_sync:
+            if not marca:
                 logger.info("📅 Primeira sincronização - buscando produtos dos últimos 30 dias")
                 data_inicio = datetime.now() - timedelta(days=30)
             else:
-                logger.info(f"📅 Sincronizando produtos desde: {ultima_sync}")
-                data_inicio = ultima_sync
-            
-            # Obter token de acesso
-            access_token = self.db.obter_access_token(user_id)
-            if not access_token:
-                raise Exception("Token de acesso não encontrado")
+                data_inicio = marca - self.SOBREPOSICAO_WATERMARK
+                logger.info(f"📅 Sincronizando produtos atualizados desde: {data_inicio}")
             
-            # Buscar produtos modificados no período
-            produtos_modificados = self._buscar_produtos_periodo(user_id, access_token, data_inicio)
+            stats_refeitos = self._refazer_produtos_com_falha(user_id)
+            for campo in stats:
+                stats[campo] += stats_refeitos[campo]
             
-            if not produtos_modificados:
-                logger.info("✅ Nenhum produto modificado encontrado")
-                self._registrar_fim_sync(sync_id, 'success', 0, 0, 0, 0)
-                self.atualizar_ultima_sincronizacao(user_id, 'produtos', 'success')
-                return {'success': True, 'message': 'Nenhuma mudança encontrada', 'items': 0}
+            falhas = []
+            for page_ids in self.api.iterar_ids_produtos_alterados(user_id, data_inicio):
+                for i in range(0, len(page_ids), self.api.LIMITE_MULTIGET):
+                    stats_lote = self._processar_produtos_modificados(
+                        user_id, page_ids[i:i + self.api.LIMITE_MULTIGET], falhas
+                    )
+                    for campo in stats:
+                        stats[campo] += stats_lote[campo]
             
-            # Processar produtos modificados
-            stats = self._processar_produtos_modificados(user_id, produtos_modificados)
+            if self.registrar_itens_com_falha(user_id, 'produtos', falhas):
+                self.avancar_watermark(user_id, 'produtos', inicio_execucao)
+                if falhas:
+                    logger.warning(f"⚠️ {len(falhas)} produtos com erro - refeitos na próxima execução")
+            else:
+                # Sem o registro das falhas a próxima execução refaz tudo a partir da marca d'água atual
+                logger.warning(f"⚠️ {len(falhas)} produtos com erro - marca d'água mantida")
+            completa = not stats['errors']
             
-            # Registrar sucesso
-            self._registrar_fim_sync(sync_id, 'success', 
-                                   stats['total'], stats['created'], 
+            status = 'success' if completa else 'partial'
+            self._registrar_fim_sync(sync_id, status,
+                                   stats['total'], stats['created'],
                                    stats['updated'], stats['errors'])
-            self.atualizar_ultima_sincronizacao(user_id, 'produtos', 'success')
+            self.atualizar_ultima_sincronizacao(
+                user_id, 'produtos', status,
+                None if completa else f"{stats['errors']} produtos com erro"
+            )
+            
+            if not stats['total']:
+                logger.info("✅ Nenhum produto modificado encontrado")
+                return {'success': True, 'message': 'Nenhuma mudança encontrada', 'items': 0}
             
             logger.info(f"✅ Sincronização de produtos concluída: {stats['total']} produtos processados")
             return {
-                'success': True,
-                'message': f'Sincronização de produtos concluída',
+                'success': completa,
+                'message': 'Sincronização de produtos concluída' if completa else 'Sincronização parcial',
                 'items': stats['total'],
                 'created': stats['created'],
                 'updated': stats['updated'],
+                'changed': stats['changed'],
                 'errors': stats['errors']
             }
             
         except Exception as e:
             logger.error(f"❌ Erro na sincronização incremental de produtos: {e}")
-            self._registrar_fim_sync(sync_id, 'error', 0, 0, 0, 0, str(e))
+            self._registrar_fim_sync(sync_id, 'error', stats['total'], stats['created'],
+                                     stats['updated'], stats['errors'], str(e))
             self.atualizar_ultima_sincronizacao(user_id, 'produtos', 'error', str(e))
             return {'success': False, 'message': str(e)}
     
-    def _buscar_vendas_periodo(self, user_id: int, access_token: str, 
-                              data_inicio: datetime) -> List[Dict[str, Any]]:
-        """Busca vendas modificadas em um período específico"""
+    def _processar_vendas_modificadas(self, user_id: int, vendas: List[Dict[str, Any]],
+                                      falhas: List[str] = None) -> Dict[str, int]:
+        """Grava as vendas modificadas num único lote.
+        
+        Uma consulta classifica o lote (novas, alteradas, sem alteração pelo
+        hash) e as novas e alteradas vão juntas para salvar_vendas_lote; as
+        estatísticas vêm do resultado do lote. Os IDs com erro vão para falhas.
+        """
+        stats = {'total': len(vendas), 'created': 0, 'updated': 0, 'errors': 0, 'skipped': 0}
+        if not vendas:
+            return stats
+        
         try:
-            # Converter data para formato da API
-            data_str = data_inicio.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-            
-            # Buscar vendas usando a API do Mercado Livre
-            url = f"https://api.mercadolibre.com/orders/search"
-            params = {
-                'seller': user_id,
-                'order.date_created.from': data_str,
-                'limit': 50,
-                'access_token': access_token
-            }
-            
-            import requests
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            
-            data = response.json()
-            vendas = data.get('results', [])
+            resultado = self.db.salvar_vendas_lote(vendas, user_id, apenas_alteradas=True)
+        except Exception as e:
+            logger.error(f"❌ Erro ao processar lote de {len(vendas)} vendas: {e}")
+            stats['errors'] = len(vendas)
+            if falhas is not None:
+                falhas.extend(str(venda.get('id', '')) for venda in vendas)
+            return stats
+        
+        stats['skipped'] = resultado['inalteradas']
+        stats['errors'] = resultado['erros']
+        stats['created'] = resultado['criadas']
+        stats['updated'] = resultado['sucesso'] - resultado['inalteradas'] - resultado['criadas']
+        if stats['skipped']:
+            logger.info(f"⏭️ {stats['skipped']} vendas sem alterações puladas")
+        for venda_id in resultado['ids_com_erro']:
+            logger.error(f"❌ Erro ao processar venda {venda_id}")
+        if falhas is not None:
+            falhas.extend(str(venda_id) for venda_id in resultado['ids_com_erro'])
+        
+        return stats
+    
+    def _processar_produtos_modificados(self, user_id: int, mlbs: List[str],
+                                        falhas: List[str] = None) -> Dict[str, int]:
+        """Busca os detalhes dos anúncios e grava todos numa transação; criados e
+        atualizados vêm da classificação feita pela própria gravação; changed conta
+        só os atualizados com diferença nos campos rastreados. Os anúncios com erro
+        ou não devolvidos pela API vão para falhas."""
+        stats = {'total': len(mlbs), 'created': 0, 'updated': 0, 'changed': 0, 'errors': 0}
+        com_erro = list(mlbs)
+        
+        try:
+            detalhes = self.api.obter_detalhes_completos_produtos(mlbs, user_id)
+            if detalhes:
+                contagem = {}
+                if self.db.salvar_produtos_lote(list(detalhes.values()), user_id, contagem=contagem):
+                    stats['created'] = contagem['criados']
+                    stats['updated'] = contagem['atualizados']
+                    stats['changed'] = contagem['alterados']
+                    com_erro = [mlb for mlb in mlbs if mlb not in detalhes]
+                
+        except Exception as e:
+            logger.error(f"❌ Erro ao processar produtos {', '.join(mlbs)}: {e}")
+        
+        stats['errors'] = len(com_erro)
+        if falhas is not None:
+            falhas.extend(com_erro)
+        return stats
+    
+    def compactar_historico(self) -> Dict[str, Any]:
+        """Agrega em sync_history_daily os dias fechados ainda não agregados e remove
+        de sync_history as execuções além da retenção, em lotes com commit próprio.
+        
+        Só são removidas execuções de dias já agregados.
+        """
+        resultado = {'success': True, 'dias_agregados': 0, 'execucoes_removidas': 0, 'lotes': 0}
+        conn = self.db.conectar()
+        if not conn:
+            resultado['success'] = False
+            return resultado
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT MAX(day) FROM sync_history_daily")
+                ultimo_agregado = cursor.fetchone()[0]
+                if ultimo_agregado:
+                    dia = ultimo_agregado + timedelta(days=1)
+                else:
+                    cursor.execute("SELECT MIN(started_at) FROM sync_history")
+                    primeira = cursor.fetchone()[0]
+                    dia = primeira.date() if primeira else None
+                conn.commit()
+                
+                ultimo_fechado = (datetime.now() - self.CARENCIA_FECHAMENTO_DIA).date() - timedelta(days=1)
+                while dia and dia <= ultimo_fechado:
+                    self._agregar_dia_historico(cursor, dia)
+                    conn.commit()
+                    ultimo_agregado = dia
+                    resultado['dias_agregados'] += 1
+                    dia += timedelta(days=1)
+                
+                if not ultimo_agregado:
+                    return resultado
+                
+                limite = min(date.today() - timedelta(days=self.RETENCAO_HISTORICO_DIAS),
+                             ultimo_agregado + timedelta(days=1))
+                while True:
+                    cursor.execute("""
+                        DELETE FROM sync_history
+                        WHERE started_at < %s
+                        ORDER BY started_at
+                        LIMIT %s
+                    """, (limite, self.LOTE_LIMPEZA_HISTORICO))
+                    removidas = cursor.rowcount
+                    conn.commit()
+                    
+                    if removidas <= 0:
+                        break
+                    resultado['execucoes_removidas'] += removidas
+                    resultado['lotes'] += 1
+                    if removidas < self.LOTE_LIMPEZA_HISTORICO:
+                        break
             
-            # Buscar detalhes de cada venda
-            vendas_detalhadas = []
-            for venda in vendas:
-                try:
-                    # Se venda já é um objeto completo, usar diretamente
-                    if isinstance(venda, dict) and 'id' in venda:
-                        vendas_detalhadas.append(venda)
-                    else:
-                        # Se venda é apenas um ID, buscar detalhes
-                        venda_id = venda if isinstance(venda, str) else str(venda)
-                        venda_data = self.api.obter_detalhes_order(venda_id, access_token)
-                        if venda_data:
-                            vendas_detalhadas.append(venda_data)
-                except Exception as e:
-                    logger.warning(f"⚠️ Erro ao obter detalhes da venda {venda}: {e}")
-            
-            return vendas_detalhadas
+            return resultado
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao compactar histórico de sincronização: {e}")
+            conn.rollback()
+            resultado['success'] = False
+            resultado['message'] = str(e)
+            return resultado
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def _agregar_dia_historico(self, cursor, dia: date):
+        """Grava (ou regrava) os agregados de um dia a partir das execuções"""
+        cursor.execute("""
+            SELECT user_id, sync_type, status, items_processed, items_created,
+                   items_updated, items_errors, sync_duration_seconds
+            FROM sync_history
+            WHERE started_at >= %s AND started_at < %s
+        """, (dia, dia + timedelta(days=1)))
+        
+        linhas = [
+            (user_id, sync_type, dia, *agregado)
+            for (user_id, sync_type), agregado in self._agregar_execucoes(cursor.fetchall()).items()
+        ]
+        if linhas:
+            cursor.executemany("""
+                INSERT INTO sync_history_daily
+                (user_id, sync_type, day, runs, runs_success, runs_partial, runs_error,
+                 items_processed, items_created, items_updated, items_errors,
+                 duration_total_seconds, duration_p50_seconds, duration_p95_seconds, duration_max_seconds)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    runs = VALUES(runs), runs_success = VALUES(runs_success),
+                    runs_partial = VALUES(runs_partial), runs_error = VALUES(runs_error),
+                    items_processed = VALUES(items_processed), items_created = VALUES(items_created),
+                    items_updated = VALUES(items_updated), items_errors = VALUES(items_errors),
+                    duration_total_seconds = VALUES(duration_total_seconds),
+                    duration_p50_seconds = VALUES(duration_p50_seconds),
+                    duration_p95_seconds = VALUES(duration_p95_seconds),
+                    duration_max_seconds = VALUES(duration_max_seconds)
+            """, linhas)
+    
+    @staticmethod
+    def _agregar_execucoes(execucoes) -> Dict[tuple, tuple]:
+        """(user_id, sync_type) -> valores das colunas de sync_history_daily, de runs a duration_max"""
+        grupos = {}
+        for user_id, sync_type, status, processados, criados, atualizados, erros, duracao in execucoes:
+            grupo = grupos.setdefault((user_id, sync_type), {
+                'runs': 0, 'success': 0, 'partial': 0, 'error': 0,
+                'itens': [0, 0, 0, 0], 'duracoes': []
+            })
+            grupo['runs'] += 1
+            if status in ('success', 'partial', 'error'):
+                grupo[status] += 1
+            for indice, valor in enumerate((processados, criados, atualizados, erros)):
+                grupo['itens'][indice] += valor or 0
+            if duracao is not None:
+                grupo['duracoes'].append(duracao)
+        
+        def percentil(duracoes: List[int], p: float) -> Optional[int]:
+            if not duracoes:
+                return None
+            return duracoes[min(len(duracoes) - 1, int(p * len(duracoes)))]
+        
+        agregados = {}
+        for chave, grupo in grupos.items():
+            duracoes = sorted(grupo['duracoes'])
+            agregados[chave] = (
+                grupo['runs'], grupo['success'], grupo['partial'], grupo['error'], *grupo['itens'],
+                sum(duracoes), percentil(duracoes, 0.5), percentil(duracoes, 0.95),
+                duracoes[-1] if duracoes else None
+            )
+        return agregados
+    
+    def obter_historico_diario(self, user_id: int, dias: int = 30) -> List[Dict[str, Any]]:
+        """Resumo por dia e tipo dos últimos dias, do mais recente ao mais antigo.
+        
+        Dias fechados vêm de sync_history_daily; os ainda não agregados (hoje,
+        e ontem até a compactação rodar) são agregados na hora a partir das
+        execuções do usuário.
+        """
+        conn = self.db.conectar()
+        if not conn:
+            return []
+        
+        colunas = ('runs', 'runs_success', 'runs_partial', 'runs_error', 'items_processed',
+                   'items_created', 'items_updated', 'items_errors', 'duration_total_seconds',
+                   'duration_p50_seconds', 'duration_p95_seconds', 'duration_max_seconds')
+        inicio = date.today() - timedelta(days=dias - 1)
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT day, sync_type, {', '.join(colunas)}
+                    FROM sync_history_daily
+                    WHERE user_id = %s AND day >= %s
+                """, (user_id, inicio))
+                resumo = {(row[0], row[1]): row[2:] for row in cursor.fetchall()}
+                
+                cursor.execute("SELECT MAX(day) FROM sync_history_daily")
+                ultimo_agregado = cursor.fetchone()[0]
+                desde = max(inicio, ultimo_agregado + timedelta(days=1)) if ultimo_agregado else inicio
+                
+                cursor.execute("""
+                    SELECT DATE(started_at), user_id, sync_type, status, items_processed, items_created,
+                           items_updated, items_errors, sync_duration_seconds
+                    FROM sync_history
+                    WHERE user_id = %s AND started_at >= %s
+                """, (user_id, desde))
+                por_dia = {}
+                for dia, *execucao in cursor.fetchall():
+                    por_dia.setdefault(dia, []).append(execucao)
+                for dia, execucoes in por_dia.items():
+                    for (_, sync_type), agregado in self._agregar_execucoes(execucoes).items():
+                        resumo[(dia, sync_type)] = agregado
             
+            return [
+                {'day': dia.isoformat(), 'sync_type': sync_type, **dict(zip(colunas, valores))}
+                for (dia, sync_type), valores in sorted(resumo.items(), key=lambda item: (item[0][0], item[0][1]), reverse=True)
+            ]
+        
         except Exception as e:
-            logger.error(f"❌ Erro ao buscar vendas do período: {e}")
+            logger.error(f"❌ Erro ao obter histórico diário de sincronização: {e}")
             return []
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def sincronizar_ou_reconciliar(self, user_id: int, sync_type: str) -> Dict[str, Any]:
+        """Execução agendada: polling só quando os webhooks não cobrem o tipo.
+        
+        - Sem cobertura (nenhum webhook recente, ou lacuna recente): polling incremental.
+        - Com cobertura: reconciliação por contagens a cada INTERVALO_RECONCILIACAO
+          e polling completo só a cada POLLING_MAXIMO_COM_WEBHOOK (mantém a marca
+          d'água andando); nas demais execuções nenhuma chamada à API é feita.
+        """
+        cobertura = self.obter_cobertura_webhook(user_id, sync_type)
+        agora = datetime.now()
+        
+        if not cobertura['coberto'] or not cobertura['ultimo_polling'] \
+                or agora - cobertura['ultimo_polling'] >= self.POLLING_MAXIMO_COM_WEBHOOK:
+            if sync_type == 'vendas':
+                return self.sincronizar_vendas_incremental(user_id)
+            return self.sincronizar_produtos_incremental(user_id)
+        
+        if not cobertura['ultima_reconciliacao'] \
+                or agora - cobertura['ultima_reconciliacao'] >= self.INTERVALO_RECONCILIACAO:
+            if sync_type == 'vendas':
+                return self.reconciliar_vendas(user_id)
+            return self.reconciliar_produtos(user_id)
+        
+        self._marcar_execucao(user_id, sync_type)
+        with self._condicao:
+            self._metricas_agendamento['polls_evitados'] += 1
+        logger.info(f"📡 {sync_type} do user_id {user_id} coberto por webhooks - polling evitado")
+        return {'success': True, 'message': 'Coberto por webhooks', 'items': 0, 'evitado': True}
     
-    def _buscar_produtos_periodo(self, user_id: int, access_token: str, 
-                                data_inicio: datetime) -> List[Dict[str, Any]]:
-        """Busca produtos modificados em um período específico"""
+    def reconciliar_vendas(self, user_id: int) -> Dict[str, Any]:
+        """Compara (total, canceladas) por dia de criação entre a API e o banco nos
+        últimos DIAS_RECONCILIACAO dias e busca de novo só os dias divergentes"""
+        logger.info(f"🧮 Reconciliando vendas por contagem para user_id: {user_id}")
+        sync_id = self._registrar_inicio_sync(user_id, 'vendas')
+        stats = {'total': 0, 'created': 0, 'updated': 0, 'errors': 0, 'skipped': 0}
+        
         try:
-            # Converter data para formato da API
-            data_str = data_inicio.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-            
-            # Buscar produtos usando a API do Mercado Livre
-            url = f"https://api.mercadolibre.com/users/{user_id}/items/search"
-            params = {
-                'offset': 0,
-                'limit': 50,
-                'access_token': access_token
-            }
-            
-            import requests
-            response = requests.get(url, params=params)
-            response.raise_for_status()
+            hoje = date.today()
+            dias = [hoje - timedelta(days=n) for n in range(self.DIAS_RECONCILIACAO)]
+            na_api = self.api.contar_vendas_por_dia(user_id, dias)
+            no_banco = self.db.contar_vendas_por_dia(user_id, dias[-1], hoje)
+            divergentes = [dia for dia in dias if na_api[dia] != no_banco.get(dia, (0, 0))]
             
-            data = response.json()
-            produtos_ids = data.get('results', [])
+            for dia in divergentes:
+                logger.info(f"🔎 {dia}: API {na_api[dia]} x banco {no_banco.get(dia, (0, 0))} (total, canceladas)")
+                stats_dia = self._processar_vendas_modificadas(
+                    user_id, self.api.buscar_vendas_criadas(user_id, *self.api.janela_dia_vendas(user_id, dia))
+                )
+                for campo in stats:
+                    stats[campo] += stats_dia[campo]
             
-            # Buscar detalhes de cada produto
-            produtos_detalhados = []
-            for produto_id in produtos_ids:
-                try:
-                    produto_data = self.api.obter_detalhes_produto(produto_id, user_id)
-                    if produto_data:
-                        produtos_detalhados.append(produto_data)
-                except Exception as e:
-                    logger.warning(f"⚠️ Erro ao obter detalhes do produto {produto_id}: {e}")
+            return self._concluir_reconciliacao(sync_id, user_id, 'vendas', stats, len(divergentes))
+        
+        except Exception as e:
+            logger.error(f"❌ Erro na reconciliação de vendas: {e}")
+            self._registrar_fim_sync(sync_id, 'error', stats['total'], stats['created'],
+                                     stats['updated'], stats['errors'], str(e))
+            self.atualizar_ultima_sincronizacao(user_id, 'vendas', 'error', str(e))
+            return {'success': False, 'message': str(e)}
+    
+    def reconciliar_produtos(self, user_id: int) -> Dict[str, Any]:
+        """Compara o total de anúncios ativos na API e no banco; só se divergir roda a
+        sincronização incremental (a marca d'água limita o que é buscado)"""
+        logger.info(f"🧮 Reconciliando produtos por contagem para user_id: {user_id}")
+        
+        try:
+            na_api = self.api.contar_produtos_ativos(user_id)
+            no_banco = self.db.contar_produtos_ativos(user_id)
+        except Exception as e:
+            logger.error(f"❌ Erro na reconciliação de produtos: {e}")
+            return {'success': False, 'message': str(e)}
+        
+        if no_banco is not None and na_api == no_banco:
+            sync_id = self._registrar_inicio_sync(user_id, 'produtos')
+            return self._concluir_reconciliacao(sync_id, user_id, 'produtos',
+                                                {'total': 0, 'created': 0, 'updated': 0, 'changed': 0, 'errors': 0}, 0)
+        
+        logger.info(f"🔎 Anúncios ativos: API {na_api} x banco {no_banco}")
+        resultado = self.sincronizar_produtos_incremental(user_id)
+        if resultado.get('success'):
+            # Anúncios regravados sem diferença nos campos rastreados não são lacuna dos webhooks
+            mudancas = resultado.get('created', 0) + resultado.get('changed', 0)
+            self._marcar_reconciliacao(user_id, 'produtos', lacuna=mudancas > 0)
+            with self._condicao:
+                self._metricas_agendamento['reconciliacoes'] += 1
+                self._metricas_agendamento['janelas_divergentes'] += 1
+        return resultado
+    
+    def reconciliar_vendas_por_janelas(self, user_id: int, dias: int = None) -> Dict[str, Any]:
+        """Confere a contagem de pedidos criados em cada um dos últimos dias (fechados) e
+        isola por bissecção as janelas que divergem do banco.
+        
+        Uma janela cuja contagem bate é aceita sem baixar nada. Uma divergente é
+        dividida ao meio (uma contagem por divisão; a outra metade sai por
+        diferença) até ter no máximo PEDIDOS_POR_JANELA_FOLHA pedidos; então os
+        pedidos dela são buscados e só os ausentes no banco são gravados.
+        """
+        dias = dias or self.DIAS_RECONCILIACAO_NOTURNA
+        logger.info(f"🌙 Reconciliação de vendas por janelas ({dias} dias) para user_id: {user_id}")
+        sync_id = self._registrar_inicio_sync(user_id, 'vendas')
+        stats = {'total': 0, 'created': 0, 'updated': 0, 'errors': 0, 'skipped': 0}
+        metricas = {'dias_divergentes': 0, 'contagens': 0, 'janelas_buscadas': 0, 'ausentes': 0}
+        
+        try:
+            hoje = date.today()
+            limite, _ = self.api.janela_dia_vendas(user_id, hoje - timedelta(days=dias))
+            for chave in [chave for chave in self._janelas_so_excedente if chave[0] == user_id and chave[2] <= limite]:
+                self._janelas_so_excedente.pop(chave, None)
             
-            return produtos_detalhados
+            for n in range(1, dias + 1):
+                inicio, fim = self.api.janela_dia_vendas(user_id, hoje - timedelta(days=n))
+                total_api = self.api.contar_vendas_criadas(user_id, inicio, fim)
+                metricas['contagens'] += 1
+                if self._reconciliar_janela(user_id, inicio, fim, total_api, stats, metricas):
+                    metricas['dias_divergentes'] += 1
             
+            completa = not stats['errors']
+            self._registrar_fim_sync(sync_id, 'success' if completa else 'partial', stats['total'],
+                                     stats['created'], stats['updated'], stats['errors'])
+            logger.info(f"✅ Reconciliação por janelas: {metricas['dias_divergentes']} dias divergentes, "
+                        f"{metricas['contagens']} contagens, {metricas['janelas_buscadas']} janelas buscadas, "
+                        f"{stats['created']} vendas recuperadas")
+            return {'success': completa, 'created': stats['created'], 'errors': stats['errors'], **metricas}
+        
         except Exception as e:
-            logger.error(f"❌ Erro ao buscar produtos do período: {e}")
-            return []
+            logger.error(f"❌ Erro na reconciliação de vendas por janelas: {e}")
+            self._registrar_fim_sync(sync_id, 'error', stats['total'], stats['created'],
+                                     stats['updated'], stats['errors'], str(e))
+            return {'success': False, 'message': str(e), 'created': stats['created'], **metricas}
     
-    def _processar_vendas_modificadas(self, user_id: int, vendas: List[Dict[str, Any]]) -> Dict[str, int]:
-        """Processa vendas modificadas e atualiza banco de dados"""
-        stats = {'total': 0, 'created': 0, 'updated': 0, 'errors': 0}
+    def _reconciliar_janela(self, user_id: int, inicio: datetime, fim: datetime, total_api: int,
+                            stats: Dict[str, int], metricas: Dict[str, int], confiar_contagem: bool = True) -> bool:
+        """Reconcilia [inicio, fim) sabendo a contagem da API; retorna se divergia.
         
-        for venda in vendas:
-            try:
-                stats['total'] += 1
-                
-                # Verificar se venda já existe
-                venda_existe = self.db.verificar_venda_existe(user_id, venda.get('id'))
-                
-                if venda_existe:
-                    # Atualizar venda existente
-                    if self.db.salvar_venda_completa(venda, user_id):
-                        stats['updated'] += 1
-                    else:
-                        stats['errors'] += 1
-                else:
-                    # Criar nova venda
-                    if self.db.salvar_venda_completa(venda, user_id):
-                        stats['created'] += 1
-                    else:
-                        stats['errors'] += 1
-                        
-            except Exception as e:
-                logger.error(f"❌ Erro ao processar venda {venda.get('id')}: {e}")
-                stats['errors'] += 1
+        Dentro de uma janela com pedidos a mais no banco, uma contagem igual pode ser
+        um pedido a mais compensando um ausente (confiar_contagem=False): a janela
+        é bissectada mesmo assim.
+        """
+        # data_criacao guarda o horário local das datas da API, sem fuso
+        inicio_local, fim_local = inicio.replace(tzinfo=None), fim.replace(tzinfo=None)
+        total_local = self.db.contar_vendas_periodo(user_id, inicio_local, fim_local)
+        if total_local is None:
+            raise Exception("Erro de conexão com o banco")
+        if total_local == total_api and confiar_contagem:
+            return False
         
-        return stats
+        # Pedidos a mais no banco (ex.: removidos da busca) podem esconder ausências na mesma
+        # janela, então ela é bissectada como as outras; se só havia excedente, fica registrada
+        chave = (user_id, inicio, fim)
+        excedente = total_local > total_api
+        if excedente and self._janelas_so_excedente.get(chave) == (total_api, total_local):
+            return True
+        ausentes_antes, erros_antes = metricas['ausentes'], stats['errors']
+        
+        self._reconciliar_janela_divergente(user_id, inicio, fim, total_api, total_local, stats, metricas,
+                                            confiar_contagem and not excedente)
+        if excedente and metricas['ausentes'] == ausentes_antes and stats['errors'] == erros_antes:
+            logger.warning(f"⚠️ Banco com mais vendas que a API entre {inicio_local} e {fim_local} "
+                           f"(API {total_api} x banco {total_local}) e nenhuma ausente")
+            self._janelas_so_excedente[chave] = (total_api, total_local)
+        return True
+    
+    def _reconciliar_janela_divergente(self, user_id: int, inicio: datetime, fim: datetime, total_api: int,
+                                       total_local: int, stats: Dict[str, int], metricas: Dict[str, int],
+                                       confiar_contagem: bool):
+        """Busca os pedidos de uma janela pequena, ou a divide ao meio e reconcilia as metades"""
+        inicio_local, fim_local = inicio.replace(tzinfo=None), fim.replace(tzinfo=None)
+        if total_api <= self.PEDIDOS_POR_JANELA_FOLHA or fim - inicio <= self.JANELA_MINIMA_BISSECCAO:
+            vendas = self.api.buscar_vendas_criadas(user_id, inicio, fim)
+            gravadas = self.db.obter_ids_vendas_periodo(user_id, inicio_local, fim_local)
+            ausentes = [venda for venda in vendas if str(venda.get('id')) not in gravadas]
+            metricas['janelas_buscadas'] += 1
+            metricas['ausentes'] += len(ausentes)
+            
+            if ausentes:
+                logger.info(f"🔎 {len(ausentes)} vendas ausentes entre {inicio_local} e {fim_local} "
+                            f"(API {total_api} x banco {total_local})")
+                stats_janela = self._processar_vendas_modificadas(user_id, ausentes)
+                for campo in stats:
+                    stats[campo] += stats_janela[campo]
+            return
+        
+        meio = (inicio + (fim - inicio) / 2).replace(microsecond=0)
+        total_primeira = self.api.contar_vendas_criadas(user_id, inicio, meio)
+        metricas['contagens'] += 1
+        self._reconciliar_janela(user_id, inicio, meio, total_primeira, stats, metricas, confiar_contagem)
+        self._reconciliar_janela(user_id, meio, fim, total_api - total_primeira, stats, metricas, confiar_contagem)
     
-    def _processar_produtos_modificados(self, user_id: int, produtos: List[Dict[str, Any]]) -> Dict[str, int]:
-        """Processa produtos modificados e atualiza banco de dados"""
-        stats = {'total': 0, 'created': 0, 'updated': 0, 'errors': 0}
+    def _concluir_reconciliacao(self, sync_id: int, user_id: int, sync_type: str,
+                                stats: Dict[str, int], divergentes: int) -> Dict[str, Any]:
+        completa = not stats['errors']
+        status = 'success' if completa else 'partial'
+        self._registrar_fim_sync(sync_id, status, stats['total'], stats['created'],
+                                 stats['updated'], stats['errors'])
+        mudancas = stats['created'] + stats['updated']
+        if completa:
+            # last_successful_sync fica com o polling: a reconciliação só marca a execução
+            self._marcar_execucao(user_id, sync_type)
+            self._marcar_reconciliacao(user_id, sync_type, lacuna=mudancas > 0)
+        else:
+            self.atualizar_ultima_sincronizacao(user_id, sync_type, 'partial', f"{stats['errors']} itens com erro")
+        with self._condicao:
+            self._metricas_agendamento['reconciliacoes'] += 1
+            self._metricas_agendamento['janelas_divergentes'] += divergentes
         
-        for produto in produtos:
-            try:
-                stats['total'] += 1
-                
-                # Verificar se produto já existe
-                produto_existe = self.db.verificar_produto_existe(user_id, produto.get('id'))
+        if mudancas:
+            logger.warning(f"⚠️ Reconciliação de {sync_type} do user_id {user_id} achou {mudancas} mudanças "
+                           "que os webhooks não trouxeram - polling retomado")
+        else:
+            logger.info(f"✅ Reconciliação de {sync_type} sem divergências ({divergentes} janelas rebuscadas)")
+        
+        return {
+            'success': completa,
+            'message': 'Reconciliação concluída' if completa else 'Reconciliação parcial',
+            'items': stats['total'],
+            'created': stats['created'],
+            'updated': stats['updated'],
+            'errors': stats['errors'],
+            'divergentes': divergentes
+        }
+    
+    def obter_cobertura_webhook(self, user_id: int, sync_type: str) -> Dict[str, Any]:
+        """Estado da cobertura do tipo por webhooks e das últimas verificações.
+        
+        coberto: houve webhook processado com sucesso nos tópicos do tipo dentro de
+        JANELA_COBERTURA_WEBHOOK e nenhuma lacuna nas últimas JANELA_LACUNA_WEBHOOK.
+        ultimo_polling é a marca d'água (avança só com polling completo).
+        """
+        cobertura = {'coberto': False, 'ultimo_webhook': None, 'lacuna_em': None,
+                     'ultimo_polling': None, 'ultima_reconciliacao': None}
+        conn = self.db.conectar()
+        if not conn:
+            return cobertura
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT sync_watermark, last_reconciled_at, webhook_gap_at FROM sync_control
+                    WHERE user_id = %s AND sync_type = %s
+                """, (user_id, sync_type))
+                row = cursor.fetchone()
+                if row:
+                    cobertura['ultimo_polling'], cobertura['ultima_reconciliacao'], cobertura['lacuna_em'] = row
                 
-                if produto_existe:
-                    # Atualizar produto existente
-                    if self.db.salvar_produto_completo(produto, user_id):
-                        stats['updated'] += 1
-                    else:
-                        stats['errors'] += 1
-                else:
-                    # Criar novo produto
-                    if self.db.salvar_produto_completo(produto, user_id):
-                        stats['created'] += 1
-                    else:
-                        stats['errors'] += 1
-                        
-            except Exception as e:
-                logger.error(f"❌ Erro ao processar produto {produto.get('id')}: {e}")
-                stats['errors'] += 1
+                try:
+                    cobertura['ultimo_webhook'] = self._ultimo_webhook(cursor, user_id, sync_type)
+                except Exception:
+                    return cobertura  # Sem tabela de webhooks: sem cobertura
+            
+            agora = datetime.now()
+            cobertura['coberto'] = (
+                cobertura['ultimo_webhook'] is not None
+                and agora - cobertura['ultimo_webhook'] < self.JANELA_COBERTURA_WEBHOOK
+                and not (cobertura['lacuna_em'] and agora - cobertura['lacuna_em'] < self.JANELA_LACUNA_WEBHOOK)
+            )
+            return cobertura
         
-        return stats
+        except Exception as e:
+            logger.error(f"❌ Erro ao obter cobertura de webhooks: {e}")
+            return cobertura
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def _ultimo_webhook(self, cursor, user_id: int, sync_type: str) -> Optional[datetime]:
+        """Último webhook processado com sucesso nos tópicos do tipo"""
+        topicos = self.TOPICOS_WEBHOOK.get(sync_type, ())
+        if not topicos:
+            return None
+        
+        cursor.execute(f"""
+            SELECT MAX(last_success_at) FROM webhook_stats
+            WHERE user_id = %s AND topic IN ({', '.join(['%s'] * len(topicos))})
+        """, (user_id, *topicos))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    
+    def _marcar_reconciliacao(self, user_id: int, sync_type: str, lacuna: bool):
+        """Grava a reconciliação; com lacuna, a cobertura deixa de valer por JANELA_LACUNA_WEBHOOK"""
+        conn = self.db.conectar()
+        if not conn:
+            return
+        
+        try:
+            with conn.cursor() as cursor:
+                agora = datetime.now()
+                cursor.execute("""
+                    UPDATE sync_control
+                    SET last_reconciled_at = %s, webhook_gap_at = IF(%s, %s, webhook_gap_at)
+                    WHERE user_id = %s AND sync_type = %s
+                """, (agora, lacuna, agora, user_id, sync_type))
+                conn.commit()
+        except Exception as e:
+            logger.error(f"❌ Erro ao registrar reconciliação: {e}")
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def _marcar_execucao(self, user_id: int, sync_type: str):
+        """Marca a execução (last_sync_at, base do agendamento) sem tocar no status do polling"""
+        conn = self.db.conectar()
+        if not conn:
+            return
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE sync_control SET last_sync_at = %s
+                    WHERE user_id = %s AND sync_type = %s
+                """, (datetime.now(), user_id, sync_type))
+                conn.commit()
+        except Exception as e:
+            logger.error(f"❌ Erro ao registrar execução de sincronização: {e}")
+        finally:
+            if conn.is_connected():
+                conn.close()
     
     def _registrar_inicio_sync(self, user_id: int, sync_type: str) -> int:
         """Registra início de uma sincronização"""
@@ -464,7 +1217,10 @@ class SyncManager:
                 """, (user_id, sync_type))
                 
                 conn.commit()
-                return cursor.lastrowid
+                sync_id = cursor.lastrowid
+            
+            self._publicar_evento_sync(conn, sync_id, 'inicio')
+            return sync_id
                 
         except Exception as e:
             logger.error(f"❌ Erro ao registrar início de sync: {e}")
@@ -494,6 +1250,8 @@ class SyncManager:
                      items_errors, error_message, sync_id))
                 
                 conn.commit()
+            
+            self._publicar_evento_sync(conn, sync_id, 'fim')
                 
         except Exception as e:
             logger.error(f"❌ Erro ao registrar fim de sync: {e}")
@@ -501,6 +1259,20 @@ class SyncManager:
             if conn.is_connected():
                 conn.close()
     
+    def _publicar_evento_sync(self, conn, sync_id: int, tipo: str):
+        """Publica o registro de sync_history no canal de eventos de sincronização"""
+        with conn.cursor(dictionary=True) as cursor:
+            cursor.execute("""
+                SELECT id, user_id, sync_type, started_at, completed_at, status,
+                       items_processed, items_created, items_updated, items_errors,
+                       error_message, sync_duration_seconds
+                FROM sync_history WHERE id = %s
+            """, (sync_id,))
+            registro = cursor.fetchone()
+        
+        if registro:
+            progress_events.publicar(registro['user_id'], 'sync', tipo, {'sync': registro})
+    
     def obter_status_sincronizacao(self, user_id: int) -> Dict[str, Any]:
         """Obtém status atual da sincronização para um usuário"""
         conn = self.db.conectar()
@@ -510,9 +1282,9 @@ class SyncManager:
         try:
             with conn.cursor(dictionary=True) as cursor:
                 cursor.execute("""
-                    SELECT sync_type, last_sync_at, last_successful_sync, 
+                    SELECT sync_type, last_sync_at, last_successful_sync, sync_watermark,
                            last_sync_status, last_error_message, sync_frequency_minutes,
-                           is_active
+                           adaptive_frequency_minutes, last_reconciled_at, webhook_gap_at, is_active
                     FROM sync_control 
                     WHERE user_id = %s
                     ORDER BY sync_type
@@ -523,9 +1295,13 @@ class SyncManager:
                     sync_status[row['sync_type']] = {
                         'last_sync': row['last_sync_at'],
                         'last_successful': row['last_successful_sync'],
+                        'watermark': row['sync_watermark'],
                         'status': row['last_sync_status'],
                         'error': row['last_error_message'],
                         'frequency_minutes': row['sync_frequency_minutes'],
+                        'effective_frequency_minutes': row['adaptive_frequency_minutes'] or row['sync_frequency_minutes'],
+                        'last_reconciled': row['last_reconciled_at'],
+                        'webhook_gap': row['webhook_gap_at'],
                         'active': row['is_active']
                     }
                 
@@ -544,6 +1320,11 @@ class SyncManager:
             logger.warning("⚠️ Sincronização automática já está rodando")
             return
         
+        if self.sync_thread and self.sync_thread.is_alive():
+            # parar_sincronizacao_automatica() não espera o loop: o antigo termina antes de o novo começar
+            logger.info("⏳ Aguardando o loop anterior de sincronização terminar")
+            self.sync_thread.join()
+        
         self.running = True
         self.sync_thread = threading.Thread(target=self._loop_sincronizacao, daemon=True)
         self.sync_thread.start()
@@ -552,126 +1333,253 @@ class SyncManager:
     def parar_sincronizacao_automatica(self):
         """Para thread de sincronização automática"""
         self.running = False
+        with self._condicao:
+            self._condicao.notify_all()
         if self.sync_thread and self.sync_thread.is_alive():
             self.sync_thread.join(timeout=5)
         logger.info("🛑 Sincronização automática parada")
     
+    def solicitar_recarga_agendamentos(self):
+        """Relê os horários na próxima volta do loop (ex.: usuário novo ou frequência alterada)"""
+        with self._condicao:
+            self._recarregar = True
+            self._condicao.notify_all()
+    
     def _loop_sincronizacao(self):
-        """Loop principal da sincronização automática"""
+        """Loop principal: dorme até o próximo vencimento e despacha o que venceu"""
         logger.info("🔄 Loop de sincronização automática iniciado")
+        proxima_recarga = 0
         
         while self.running:
             try:
-                # Obter usuários ativos
-                usuarios_ativos = self._obter_usuarios_ativos()
+                if self._recarregar or time.monotonic() >= proxima_recarga:
+                    self._recarregar = False
+                    self._carregar_agendamentos()
+                    proxima_recarga = time.monotonic() + self.INTERVALO_RECARGA_SEGUNDOS
                 
-                # Processar usuários em paralelo
-                self._processar_usuarios_paralelo(usuarios_ativos)
+                self._despachar_vencidas()
                 
-                # Aguardar antes da próxima verificação
-                time.sleep(60)  # Verificar a cada minuto
+                with self._condicao:
+                    espera = proxima_recarga - time.monotonic()
+                    if self._fila_agendamento and len(self._em_execucao) < self.MAX_SINCRONIZACOES_SIMULTANEAS:
+                        espera = min(espera, self._fila_agendamento[0][0] - time.monotonic())
+                    if espera > 0 and self.running and not self._recarregar:
+                        # Acordado antes por sincronizações concluídas (vaga liberada) ou recarga
+                        self._condicao.wait(espera)
                 
             except Exception as e:
                 logger.error(f"❌ Erro no loop de sincronização: {e}")
-                time.sleep(60)
+                time.sleep(self.INTERVALO_RECARGA_SEGUNDOS)
         
         logger.info("🛑 Loop de sincronização automática finalizado")
     
-    def _processar_usuarios_paralelo(self, usuarios_ativos):
-        """Processa usuários em paralelo para sincronização"""
-        if not usuarios_ativos:
-            return
-        
-        # Criar threads para cada usuário
-        threads = []
-        for user_id in usuarios_ativos:
-            if not self.running:
-                break
-            
-            thread = threading.Thread(
-                target=self._sincronizar_usuario_individual,
-                args=(user_id,),
-                daemon=True
-            )
-            threads.append(thread)
-            thread.start()
-        
-        # Aguardar todas as threads terminarem (com timeout)
-        for thread in threads:
-            if thread.is_alive():
-                thread.join(timeout=300)  # 5 minutos timeout por usuário
-    
-    def _sincronizar_usuario_individual(self, user_id):
-        """Sincroniza um usuário individual em thread separada"""
-        try:
-            # Verificar se precisa sincronizar vendas
-            if self._precisa_sincronizar(user_id, 'vendas'):
-                logger.info(f"🔄 Sincronizando vendas para user_id: {user_id}")
-                self.sincronizar_vendas_incremental(user_id)
-            
-            # Verificar se precisa sincronizar produtos
-            if self._precisa_sincronizar(user_id, 'produtos'):
-                logger.info(f"🔄 Sincronizando produtos para user_id: {user_id}")
-                self.sincronizar_produtos_incremental(user_id)
-                
-        except Exception as e:
-            logger.error(f"❌ Erro na sincronização para user_id {user_id}: {e}")
-    
-    def _obter_usuarios_ativos(self) -> List[int]:
-        """Obtém lista de usuários com sincronização ativa"""
+    def _carregar_agendamentos(self):
+        """Calcula numa única consulta o próximo vencimento de cada par (usuário, tipo) ativo"""
         conn = self.db.conectar()
         if not conn:
-            return []
-            
+            return
+        
         try:
             with conn.cursor() as cursor:
                 cursor.execute("""
-                    SELECT DISTINCT user_id FROM sync_control 
-                    WHERE is_active = TRUE
+                    SELECT user_id, sync_type, last_sync_at, sync_frequency_minutes,
+                           COALESCE(adaptive_frequency_minutes, sync_frequency_minutes)
+                    FROM sync_control
+                    WHERE is_active = TRUE AND sync_type IN ('vendas', 'produtos')
                 """)
-                
-                return [row[0] for row in cursor.fetchall()]
-                
+                linhas = cursor.fetchall()
         except Exception as e:
-            logger.error(f"❌ Erro ao obter usuários ativos: {e}")
-            return []
+            logger.error(f"❌ Erro ao carregar agendamentos de sincronização: {e}")
+            return
         finally:
             if conn.is_connected():
                 conn.close()
+        
+        # last_sync_at é gravado com o relógio da aplicação: o atraso é calculado com o mesmo relógio
+        agora, agora_monotonic = datetime.now(), time.monotonic()
+        with self._condicao:
+            self._frequencias = {}
+            self._frequencias_base = {}
+            self._vencimentos = {}
+            for user_id, sync_type, last_sync, base, frequencia in linhas:
+                chave = (user_id, sync_type)
+                self._frequencias[chave] = frequencia
+                self._frequencias_base[chave] = base
+                if chave in self._em_execucao:
+                    continue  # Reagendado ao concluir
+                
+                if last_sync:
+                    atraso = (agora - (last_sync + timedelta(minutes=frequencia))).total_seconds()
+                else:
+                    atraso = 0.0  # Primeira sincronização: vence agora
+                self._vencimentos[chave] = agora_monotonic - atraso
+            
+            self._fila_agendamento = [(vencimento, user_id, sync_type)
+                                      for (user_id, sync_type), vencimento in self._vencimentos.items()]
+            heapq.heapify(self._fila_agendamento)
+            self._metricas_agendamento['ultima_recarga'] = agora
+    
+    def _despachar_vencidas(self):
+        """Envia ao agendador global os pares vencidos, até o limite de sincronizações simultâneas"""
+        despachar = []
+        with self._condicao:
+            agora = time.monotonic()
+            while (self._fila_agendamento and self._fila_agendamento[0][0] <= agora
+                   and len(self._em_execucao) < self.MAX_SINCRONIZACOES_SIMULTANEAS):
+                vencimento, user_id, sync_type = heapq.heappop(self._fila_agendamento)
+                chave = (user_id, sync_type)
+                if self._vencimentos.get(chave) != vencimento:
+                    continue  # Entrada substituída por uma recarga ou reagendamento
+                
+                del self._vencimentos[chave]
+                self._em_execucao.add(chave)
+                self._metricas_agendamento['despachadas'] += 1
+                despachar.append((user_id, sync_type, vencimento))
+        
+        for user_id, sync_type, vencimento in despachar:
+            work_scheduler.submeter(user_id, 'sync', self._executar_sincronizacao_agendada,
+                                    user_id, sync_type, vencimento)
     
-    def _precisa_sincronizar(self, user_id: int, sync_type: str) -> bool:
-        """Verifica se precisa sincronizar baseado na frequência configurada"""
+    def _executar_sincronizacao_agendada(self, user_id: int, sync_type: str, vencimento: float):
+        """Tarefa do agendador global: sincroniza um par e agenda o próximo vencimento"""
+        chave = (user_id, sync_type)
+        with self._condicao:
+            # Atraso entre o vencimento e o início efetivo (inclui a espera na fila do agendador)
+            self._atrasos.append(max(0.0, time.monotonic() - vencimento))
+        
+        resultado = None
+        try:
+            logger.info(f"🔄 Sincronizando {sync_type} para user_id: {user_id}")
+            resultado = self.sincronizar_ou_reconciliar(user_id, sync_type)
+            
+            # Execuções com erro (ou sem consulta à API) não dizem nada sobre a atividade: a frequência fica
+            if resultado and resultado.get('success') and not resultado.get('evitado'):
+                self._adaptar_frequencia(user_id, sync_type, self._mudancas_reais(resultado))
+        except Exception as e:
+            logger.error(f"❌ Erro na sincronização de {sync_type} para user_id {user_id}: {e}")
+        finally:
+            with self._condicao:
+                self._em_execucao.discard(chave)
+                self._metricas_agendamento['concluidas'] += 1
+                if not (resultado and resultado.get('success')):
+                    self._metricas_agendamento['erros'] += 1
+                
+                frequencia = self._frequencias.get(chave)
+                if frequencia:
+                    proximo = time.monotonic() + frequencia * 60
+                    self._vencimentos[chave] = proximo
+                    heapq.heappush(self._fila_agendamento, (proximo, user_id, sync_type))
+                self._condicao.notify_all()
+    
+    def calcular_frequencia_adaptativa(self, atual: int, base: int, mudancas: int,
+                                       cobertura_webhook: bool) -> int:
+        """Próxima frequência (minutos) a partir da atual e das mudanças encontradas nela"""
+        minimo, maximo = self.FREQUENCIA_MINIMA_MINUTOS, self.FREQUENCIA_MAXIMA_MINUTOS
+        if cobertura_webhook:
+            # As mudanças já chegam pelos webhooks: não encurtar abaixo da configurada
+            minimo = max(minimo, base)
+            maximo = max(maximo, self.FREQUENCIA_MAXIMA_COM_WEBHOOK_MINUTOS)
+        
+        if not mudancas:
+            novo = atual * 2
+        elif mudancas * 60 / atual >= self.MUDANCAS_POR_HORA_MOVIMENTADO:
+            novo = min(atual, base) // 2
+        else:
+            novo = min(atual, base)
+        return max(minimo, min(max(maximo, minimo), novo))
+    
+    @staticmethod
+    def _mudancas_reais(resultado: Dict[str, Any]) -> int:
+        """Itens criados ou de fato alterados numa execução.
+        
+        A sobreposição da marca d'água rebusca itens sem mudança: nas vendas o
+        'updated' já exclui as de hash igual; nos produtos vale o 'changed'
+        (diferença nos campos rastreados), não o 'updated'.
+        """
+        return resultado.get('created', 0) + resultado.get('changed', resultado.get('updated', 0))
+    
+    def _adaptar_frequencia(self, user_id: int, sync_type: str, mudancas: int):
+        """Recalcula e grava a frequência efetiva do par depois de uma execução bem-sucedida"""
+        chave = (user_id, sync_type)
+        with self._condicao:
+            atual = self._frequencias.get(chave)
+            base = self._frequencias_base.get(chave, atual)
+        if not atual:
+            return
+        
         conn = self.db.conectar()
         if not conn:
-            return False
-            
+            return
+        
         try:
+            cobertura = self.obter_cobertura_webhook(user_id, sync_type)['coberto']
             with conn.cursor() as cursor:
+                nova = self.calcular_frequencia_adaptativa(atual, base, mudancas, cobertura)
+                if nova == atual:
+                    return
+                
                 cursor.execute("""
-                    SELECT last_sync_at, sync_frequency_minutes, is_active
-                    FROM sync_control 
+                    UPDATE sync_control SET adaptive_frequency_minutes = %s
                     WHERE user_id = %s AND sync_type = %s
-                """, (user_id, sync_type))
-                
-                result = cursor.fetchone()
-                if not result or not result[2]:  # is_active
-                    return False
-                
-                last_sync, frequency = result[0], result[1]
-                
-                if not last_sync:
-                    return True  # Primeira sincronização
-                
-                # Verificar se passou o tempo da frequência
-                next_sync = last_sync + timedelta(minutes=frequency)
-                return datetime.now() >= next_sync
-                
+                """, (nova, user_id, sync_type))
+                conn.commit()
+            
+            with self._condicao:
+                self._frequencias[chave] = nova
+            logger.info(f"⏱️ Frequência de {sync_type} do user_id {user_id}: {atual} → {nova} min "
+                        f"({mudancas} mudanças{', com webhooks' if cobertura else ''})")
+        
         except Exception as e:
-            logger.error(f"❌ Erro ao verificar necessidade de sincronização: {e}")
-            return False
+            logger.error(f"❌ Erro ao adaptar frequência de sincronização: {e}")
         finally:
             if conn.is_connected():
                 conn.close()
+    
+    def obter_metricas_agendamento(self) -> Dict[str, Any]:
+        """Fila de sincronizações automáticas e atraso entre vencimento e início"""
+        with self._condicao:
+            agora = time.monotonic()
+            atrasos = sorted(self._atrasos)
+            vencidas = sum(1 for vencimento in self._vencimentos.values() if vencimento <= agora)
+            proximo = min(self._vencimentos.values(), default=None)
+            ultima_recarga = self._metricas_agendamento['ultima_recarga']
+            frequencias = sorted(self._frequencias.values())
+            em_recuo = sum(1 for chave, frequencia in self._frequencias.items()
+                           if frequencia > self._frequencias_base.get(chave, frequencia))
+            
+            def percentil(p: float) -> Optional[float]:
+                if not atrasos:
+                    return None
+                return round(atrasos[min(len(atrasos) - 1, int(p * len(atrasos)))], 2)
+            
+            return {
+                'pares_agendados': len(self._vencimentos) + len(self._em_execucao),
+                'vencidas_aguardando': vencidas,
+                'em_execucao': len(self._em_execucao),
+                'limite_simultaneas': self.MAX_SINCRONIZACOES_SIMULTANEAS,
+                'proximo_vencimento_s': round(max(0.0, proximo - agora), 1) if proximo is not None else None,
+                'atraso_s': {
+                    'amostras': len(atrasos),
+                    'p50': percentil(0.5),
+                    'p95': percentil(0.95),
+                    'maximo': round(atrasos[-1], 2) if atrasos else None
+                },
+                'frequencia_minutos': {
+                    'minima': frequencias[0] if frequencias else None,
+                    'mediana': frequencias[len(frequencias) // 2] if frequencias else None,
+                    'maxima': frequencias[-1] if frequencias else None,
+                    'pares_em_recuo': em_recuo,
+                    # Execuções por hora somando todos os pares, com as frequências atuais
+                    'execucoes_por_hora': round(sum(60 / f for f in frequencias if f), 1)
+                },
+                'despachadas': self._metricas_agendamento['despachadas'],
+                'concluidas': self._metricas_agendamento['concluidas'],
+                'erros': self._metricas_agendamento['erros'],
+                'reconciliacoes': self._metricas_agendamento['reconciliacoes'],
+                'janelas_divergentes': self._metricas_agendamento['janelas_divergentes'],
+                'polls_evitados': self._metricas_agendamento['polls_evitados'],
+                'ultima_recarga': ultima_recarga.isoformat() if ultima_recarga else None
+            }
 
 # Instância global do SyncManager
 sync_manager = None
@@ -691,3 +1599,86 @@ def obter_sync_manager() -> SyncManager:
     if not sync_manager:
         return inicializar_sync_manager()
     return sync_manager
+
+class SyncHistoryCompactor(MaintenanceJob):
+    """Compactação periódica do histórico de sincronizações em agregados diários"""
+    
+    nome = 'compactação do histórico de sincronização'
+    INTERVALO_HORAS = float(os.getenv('SYNC_COMPACTACAO_INTERVALO_HORAS', 6))
+    
+    def _executar(self) -> Dict[str, Any]:
+        resultado = obter_sync_manager().compactar_historico()
+        
+        if resultado['dias_agregados'] or resultado['execucoes_removidas']:
+            logger.info(f"🗜️ Histórico de sincronização: {resultado['dias_agregados']} dias agregados, "
+                        f"{resultado['execucoes_removidas']} execuções removidas em {resultado['lotes']} lotes")
+        return resultado
+    
+    def _intervalo_segundos(self) -> float:
+        return self.INTERVALO_HORAS * 3600
+
+class NightlyOrderReconciler(MaintenanceJob):
+    """Reconciliação noturna das vendas de todos os vendedores com a API, por janelas diárias"""
+    
+    nome = 'reconciliação noturna de vendas'
+    HORA_EXECUCAO = int(os.getenv('SYNC_RECONCILIACAO_NOTURNA_HORA', 3))
+    
+    def _executar(self) -> Dict[str, Any]:
+        manager = obter_sync_manager()
+        resultado = {'success': True, 'vendedores': 0, 'recuperadas': 0, 'contagens': 0, 'falhas': 0}
+        
+        for user_id in manager.db.obter_usuarios_com_tokens():
+            if not self.running:
+                break
+            
+            # Na fila bulk do agendador global: não disputa com o uso interativo
+            reconciliacao = work_scheduler.submeter(user_id, 'bulk', manager.reconciliar_vendas_por_janelas, user_id)
+            parcial = reconciliacao.result()
+            resultado['vendedores'] += 1
+            resultado['recuperadas'] += parcial.get('created', 0)
+            resultado['contagens'] += parcial.get('contagens', 0)
+            if not parcial.get('success'):
+                resultado['falhas'] += 1
+        
+        falhas = f", {resultado['falhas']} com falha" if resultado['falhas'] else ''
+        logger.info(f"🌙 Reconciliação noturna: {resultado['vendedores']} vendedores, "
+                    f"{resultado['recuperadas']} vendas recuperadas com {resultado['contagens']} contagens{falhas}")
+        return resultado
+    
+    def _intervalo_segundos(self) -> float:
+        agora = datetime.now()
+        proxima = agora.replace(hour=self.HORA_EXECUCAO, minute=0, second=0, microsecond=0)
+        if proxima <= agora:
+            proxima += timedelta(days=1)
+        return (proxima - agora).total_seconds()
+    
+    def _job_loop(self):
+        """Espera o horário antes de cada rodada: assumir a liderança não dispara a reconciliação"""
+        while self.running:
+            if self._stop_event.wait(self._intervalo_segundos()):
+                break
+            
+            try:
+                self.executar()
+            except Exception as e:
+                logger.error(f"❌ Erro na tarefa de {self.nome}: {e}")
+
+# Instâncias globais das tarefas de manutenção da sincronização
+sync_history_compactor = SyncHistoryCompactor()
+nightly_order_reconciler = NightlyOrderReconciler()
+
+def start_sync_history_compactor():
+    """Inicia a compactação periódica do histórico de sincronizações"""
+    sync_history_compactor.start()
+
+def stop_sync_history_compactor():
+    """Para a compactação periódica do histórico de sincronizações"""
+    sync_history_compactor.stop()
+
+def start_nightly_order_reconciler():
+    """Inicia a reconciliação noturna das vendas"""
+    nightly_order_reconciler.start()
+
+def stop_nightly_order_reconciler():
+    """Para a reconciliação noturna das vendas"""
+    nightly_order_reconciler.stop()
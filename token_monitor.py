@@ -19,6 +19,7 @@ class TokenMonitor:
         self.api = MercadoLivreAPI()
         self.running = False
         self.monitor_thread = None
+        self._stop_event = threading.Event()
         self.check_interval = 300  # 5 minutos
         
     def start_monitoring(self):
@@ -27,7 +28,13 @@ class TokenMonitor:
             print("⚠️ Monitor já está rodando")
             return
         
+        if self.monitor_thread and self.monitor_thread.is_alive():
+            # stop_monitoring() não espera a verificação em curso: o loop antigo termina antes
+            print("⏳ Aguardando a verificação anterior de tokens terminar")
+            self.monitor_thread.join()
+        
         self.running = True
+        self._stop_event.clear()
         self.monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
         self.monitor_thread.start()
         print("🔄 Monitor de tokens iniciado")
@@ -35,8 +42,9 @@ class TokenMonitor:
     def stop_monitoring(self):
         """Para o monitoramento"""
         self.running = False
-        if self.monitor_thread:
-            self.monitor_thread.join()
+        self._stop_event.set()
+        if self.monitor_thread and self.monitor_thread.is_alive():
+            self.monitor_thread.join(timeout=5)
         print("⏹️ Monitor de tokens parado")
     
     def _monitor_loop(self):
@@ -45,18 +53,21 @@ class TokenMonitor:
             try:
                 print(f"🔍 Verificando tokens - {datetime.now().strftime('%H:%M:%S')}")
                 
+                # Recarrega o estado de reautenticação usado pelos webhooks
+                self.db.carregar_estado_reautenticacao()
+                
                 # Verifica usuários que precisam reautenticar
                 self._check_expired_tokens()
                 
                 # Sincroniza dados perdidos
                 self._sync_lost_data()
                 
-                # Aguarda próxima verificação
-                time.sleep(self.check_interval)
+                # Aguarda próxima verificação (interrompida ao parar o monitor)
+                self._stop_event.wait(self.check_interval)
                 
             except Exception as e:
                 print(f"❌ Erro no monitor: {e}")
-                time.sleep(60)  # Aguarda 1 minuto em caso de erro
+                self._stop_event.wait(60)  # Aguarda 1 minuto em caso de erro
     
     def _check_expired_tokens(self):
         """Verifica tokens expirados e marca para reautenticação"""
@@ -3,12 +3,16 @@ Sistema Universal de Processamento de Webhooks do Mercado Livre
 Processa todos os tópicos disponíveis do ML de forma inteligente
 """
 
+import os
 import json
 import logging
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 from dataclasses import dataclass
 from enum import Enum
+from progress_events import progress_events
+from work_scheduler import work_scheduler
+from auth_manager import MaintenanceJob
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -50,6 +54,7 @@ class WebhookProcessor:
         self.meli_api = meli_api
         self.db_manager = db_manager
         self.webhook_logger = WebhookLogger(db_manager)
+        self.queue = WebhookQueue(db_manager)
         self.topic_processors = self._initialize_topic_processors()
         
     def _initialize_topic_processors(self) -> Dict[str, callable]:
@@ -133,6 +138,13 @@ class WebhookProcessor:
             # Log do resultado no banco de dados
             self.webhook_logger.log_webhook_received(notification, success)
             
+            # Notifica as telas abertas do usuário
+            progress_events.publicar(notification.user_id, 'webhook', 'notificacao', {
+                'topic': notification.topic,
+                'resource': notification.resource,
+                'success': success
+            })
+            
             # Log do resultado
             if success:
                 logger.info(f"Notificação processada com sucesso: {notification.topic}")
@@ -145,6 +157,15 @@ class WebhookProcessor:
             logger.error(f"Erro ao processar notificação: {e}")
             return False
     
+    def process_queued(self, queue_id: int, notification_data: Dict[str, Any]) -> bool:
+        """Processa uma notificação da fila persistente; só sai da fila se processada com sucesso"""
+        success = self.process_notification(notification_data)
+        if success:
+            self.queue.concluir(queue_id)
+        else:
+            self.queue.registrar_falha(queue_id)
+        return success
+    
     def _parse_notification(self, data: Dict[str, Any]) -> Optional[WebhookNotification]:
         """Faz parse da notificação para estrutura padronizada"""
         try:
@@ -204,7 +225,8 @@ class WebhookProcessor:
         """Processa notificações de orders_v2 (vendas)"""
         try:
             # Verificar se usuário precisa reautenticar (mas não bloquear webhook)
-            if self.meli_api.verificar_necessidade_reautenticacao(notification.user_id):
+            # Consulta apenas o estado em memória - sem ida ao banco por notificação
+            if self.meli_api.verificar_necessidade_reautenticacao(notification.user_id, consultar_banco=False):
                 logger.warning(f"Usuário {notification.user_id} precisa reautenticar - processando webhook mesmo assim")
                 # Não retornar False aqui, continuar processamento
             
@@ -262,8 +284,21 @@ class WebhookProcessor:
         """Processa notificações de itens/produtos"""
         try:
             logger.info(f"Processando item: {notification.resource}")
-            # Implementar lógica específica para itens
-            return True
+            mlb = notification.resource.split('/')[-1]
+            
+            produto = self.meli_api.obter_detalhes_completos_produto(mlb, notification.user_id)
+            if not produto:
+                logger.warning(f"Falha ao obter detalhes do item {mlb}")
+                return False
+            
+            # O sucesso conta como cobertura do tópico: a sincronização agendada deixa
+            # de fazer polling de produtos enquanto os webhooks de items forem gravados
+            success = self.db_manager.salvar_produtos_lote([produto], notification.user_id)
+            if success:
+                logger.info(f"Item {mlb} atualizado com sucesso")
+            else:
+                logger.warning(f"Falha ao salvar item {mlb} no banco de dados")
+            return bool(success)
         except Exception as e:
             logger.error(f"Erro ao processar items: {e}")
             return False
@@ -466,3 +501,167 @@ class WebhookLogger:
         except Exception as e:
             logger.error(f"Erro ao obter estatísticas de webhooks: {e}")
             return {}
+
+
+class WebhookQueue:
+    """Fila persistente das notificações recebidas (tabela webhook_queue).
+    
+    A notificação é gravada antes de o endpoint confirmar o recebimento ao ML e
+    só é removida depois de processada com sucesso. O processamento imediato
+    acontece em memória; se falhar ou o processo cair, WebhookRetrier a
+    reprocessa quando next_attempt_at vencer.
+    """
+    
+    MAX_TENTATIVAS = int(os.getenv('WEBHOOK_MAX_TENTATIVAS', 5))
+    # Prazo do processamento em memória antes de a notificação voltar a ser elegível
+    LEASE_SEGUNDOS = 300
+    ESPERA_MAXIMA_SEGUNDOS = 3600
+    
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+    
+    def criar_tabela(self) -> bool:
+        """Cria a tabela da fila de webhooks"""
+        conn = self.db_manager.conectar()
+        if not conn:
+            return False
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS webhook_queue (
+                        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                        user_id BIGINT NULL,
+                        topic VARCHAR(100) NOT NULL,
+                        payload JSON NOT NULL,
+                        status ENUM('pending', 'failed') NOT NULL DEFAULT 'pending',
+                        attempts INT DEFAULT 0,
+                        next_attempt_at DATETIME NOT NULL,
+                        last_error_at DATETIME NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        INDEX idx_status_next (status, next_attempt_at)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+                """)
+                conn.commit()
+                logger.info("✅ Tabela de fila de webhooks criada com sucesso")
+                return True
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao criar tabela de fila de webhooks: {e}")
+            return False
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def enfileirar(self, notification_data: Dict[str, Any]) -> Optional[int]:
+        """Grava a notificação; None indica que ela não pode ser confirmada ao ML"""
+        conn = self.db_manager.conectar()
+        if not conn:
+            return None
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO webhook_queue (user_id, topic, payload, next_attempt_at)
+                    VALUES (%s, %s, %s, NOW() + INTERVAL %s SECOND)
+                """, (notification_data.get('user_id'), notification_data.get('topic'),
+                      json.dumps(notification_data, default=str), self.LEASE_SEGUNDOS))
+                conn.commit()
+                return cursor.lastrowid
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao gravar notificação na fila: {e}")
+            return None
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def concluir(self, queue_id: int):
+        """Remove da fila uma notificação processada"""
+        self._executar("DELETE FROM webhook_queue WHERE id = %s", (queue_id,))
+    
+    def registrar_falha(self, queue_id: int):
+        """Agenda nova tentativa com espera exponencial; após MAX_TENTATIVAS a notificação fica como failed"""
+        self._executar("""
+            UPDATE webhook_queue
+            SET attempts = attempts + 1,
+                status = IF(attempts >= %s, 'failed', 'pending'),
+                next_attempt_at = NOW() + INTERVAL LEAST(60 * POW(2, attempts - 1), %s) SECOND,
+                last_error_at = NOW()
+            WHERE id = %s
+        """, (self.MAX_TENTATIVAS, self.ESPERA_MAXIMA_SEGUNDOS, queue_id))
+    
+    def reivindicar_pendentes(self, limite: int = 100) -> List[Tuple[int, Dict[str, Any]]]:
+        """Notificações vencidas, reservadas por LEASE_SEGUNDOS para quem as reivindicou"""
+        conn = self.db_manager.conectar()
+        if not conn:
+            return []
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT id, payload FROM webhook_queue
+                    WHERE status = 'pending' AND next_attempt_at <= NOW()
+                    ORDER BY next_attempt_at
+                    LIMIT %s
+                """, (limite,))
+                vencidas = cursor.fetchall()
+                
+                reivindicadas = []
+                for queue_id, payload in vencidas:
+                    cursor.execute("""
+                        UPDATE webhook_queue SET next_attempt_at = NOW() + INTERVAL %s SECOND
+                        WHERE id = %s AND status = 'pending' AND next_attempt_at <= NOW()
+                    """, (self.LEASE_SEGUNDOS, queue_id))
+                    if cursor.rowcount > 0:
+                        reivindicadas.append((queue_id, json.loads(payload)))
+                conn.commit()
+                return reivindicadas
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao reivindicar notificações pendentes: {e}")
+            return []
+        finally:
+            if conn.is_connected():
+                conn.close()
+    
+    def _executar(self, sql: str, params: tuple):
+        conn = self.db_manager.conectar()
+        if not conn:
+            return
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(sql, params)
+                conn.commit()
+        except Exception as e:
+            logger.error(f"❌ Erro ao atualizar fila de webhooks: {e}")
+        finally:
+            if conn.is_connected():
+                conn.close()
+
+class WebhookRetrier(MaintenanceJob):
+    """Reprocessamento das notificações pendentes na fila persistente"""
+    
+    nome = 'reprocessamento de webhooks'
+    INTERVALO_SEGUNDOS = 60
+    
+    def __init__(self, processor: WebhookProcessor):
+        super().__init__()
+        self.processor = processor
+    
+    def _executar(self) -> Dict[str, Any]:
+        pendentes = self.processor.queue.reivindicar_pendentes()
+        futuros = [
+            work_scheduler.submeter(notification_data.get('user_id'), 'webhook',
+                                    self.processor.process_queued, queue_id, notification_data)
+            for queue_id, notification_data in pendentes
+        ]
+        processadas = sum(1 for futuro in futuros if futuro.result())
+        
+        if pendentes:
+            logger.info(f"🔁 Webhooks reprocessados: {processadas}/{len(pendentes)} com sucesso")
+        return {'success': True, 'pendentes': len(pendentes), 'processadas': processadas}
+    
+    def _intervalo_segundos(self) -> float:
+        return self.INTERVALO_SEGUNDOS
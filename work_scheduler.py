@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Agendador Global de Trabalho
+Um único pool de threads por processo para buscas na API, sincronizações,
+webhooks e importações, com fila justa por usuário e classes de prioridade
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from typing import Dict, Any, Callable, Iterable, Tuple, Set
+import logging
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class OperacaoCancelada(Exception):
+    """Levantada pelo trabalho que percebe o token cancelado no meio do caminho"""
+
+
+class CancellationToken:
+    """Sinal de cancelamento compartilhado entre quem pede e quem executa o trabalho.
+    
+    Quem executa consulta o token entre as etapas (ou espera nele em vez de
+    dormir); tarefas ainda na fila do agendador são canceladas antes de rodar.
+    """
+    
+    def __init__(self):
+        self._evento = threading.Event()
+    
+    def cancelar(self):
+        self._evento.set()
+    
+    @property
+    def cancelado(self) -> bool:
+        return self._evento.is_set()
+    
+    def verificar(self):
+        """Levanta OperacaoCancelada se o token foi cancelado"""
+        if self._evento.is_set():
+            raise OperacaoCancelada()
+    
+    def aguardar(self, timeout: float = None) -> bool:
+        """Espera até o cancelamento ou timeout; True se foi cancelado"""
+        return self._evento.wait(timeout)
+
+
+class WorkScheduler:
+    """Pool de threads compartilhado com fila justa por usuário.
+    
+    - Classes de prioridade (interactive > webhook > sync > bulk) são servidas
+      por rodízio ponderado: classes mais altas recebem mais vagas por rodada,
+      mas as mais baixas nunca ficam paradas.
+    - Dentro de uma classe, os usuários são atendidos em rodízio, cada um com
+      tantas tarefas seguidas quanto o seu peso (ex.: por plano).
+    - sync e bulk têm um teto de threads, deixando vagas livres para trabalho
+      interativo e webhooks mesmo com muitas importações simultâneas.
+    """
+    
+    PRIORIDADES = ('interactive', 'webhook', 'sync', 'bulk')
+    PESOS_CLASSE = {'interactive': 8, 'webhook': 4, 'sync': 2, 'bulk': 1}
+    FRACAO_MAXIMA_CLASSE = {'sync': 0.75, 'bulk': 0.6}
+    
+    def __init__(self, num_threads: int = 16):
+        self.num_threads = num_threads
+        self._condicao = threading.Condition()
+        self._filas = {prioridade: OrderedDict() for prioridade in self.PRIORIDADES}  # user_id -> deque
+        self._creditos_classe = dict(self.PESOS_CLASSE)
+        self._creditos_usuario = {}
+        self._pesos_usuario = {}
+        self._executando = {prioridade: 0 for prioridade in self.PRIORIDADES}
+        self._limites = {
+            prioridade: max(1, int(num_threads * self.FRACAO_MAXIMA_CLASSE.get(prioridade, 1)))
+            for prioridade in self.PRIORIDADES
+        }
+        self._threads = []
+        self._local = threading.local()
+    
+    def submeter(self, user_id: int, prioridade: str, fn: Callable, *args, **kwargs) -> Future:
+        """Agenda fn(*args, **kwargs) para o usuário na classe de prioridade informada"""
+        if prioridade not in self.PRIORIDADES:
+            raise ValueError(f"Prioridade desconhecida: {prioridade}")
+        
+        future = Future()
+        with self._condicao:
+            self._iniciar_threads()
+            fila = self._filas[prioridade].get(user_id)
+            if fila is None:
+                fila = self._filas[prioridade][user_id] = deque()
+                self._creditos_usuario[(prioridade, user_id)] = self._pesos_usuario.get(user_id, 1)
+            fila.append((future, fn, args, kwargs))
+            self._condicao.notify()
+        return future
+    
+    def aguardar(self, futures: Iterable[Future], timeout: float = None) -> Tuple[Set[Future], Set[Future]]:
+        """Aguarda as tarefas; chamado de dentro de uma tarefa, executa trabalho pendente
+        enquanto espera, para que tarefas que agendam subtarefas não travem o pool"""
+        pendentes = set(futures)
+        if not getattr(self._local, 'trabalhador', False):
+            return wait(pendentes, timeout=timeout)
+        
+        concluidas = set()
+        limite = time.monotonic() + timeout if timeout is not None else None
+        while pendentes and (limite is None or time.monotonic() < limite):
+            with self._condicao:
+                # Esta thread já ocupa uma vaga: executar aqui não aumenta a concorrência
+                tarefa = self._proxima_tarefa(respeitar_limites=False)
+            if tarefa:
+                self._executar(*tarefa)
+            else:
+                wait(pendentes, timeout=0.1, return_when=FIRST_COMPLETED)
+            
+            prontas = {future for future in pendentes if future.done()}
+            concluidas |= prontas
+            pendentes -= prontas
+        
+        return concluidas, pendentes
+    
+    def definir_peso_usuario(self, user_id: int, peso: int):
+        """Tarefas seguidas que o usuário recebe por rodada (padrão 1)"""
+        with self._condicao:
+            self._pesos_usuario[user_id] = max(1, int(peso))
+    
+    def obter_estatisticas(self) -> Dict[str, Any]:
+        """Tarefas na fila e em execução por classe"""
+        with self._condicao:
+            return {
+                prioridade: {
+                    'na_fila': sum(len(fila) for fila in self._filas[prioridade].values()),
+                    'usuarios': len(self._filas[prioridade]),
+                    'executando': self._executando[prioridade],
+                    'limite': self._limites[prioridade]
+                }
+                for prioridade in self.PRIORIDADES
+            }
+    
+    def _iniciar_threads(self):
+        """Cria as threads na primeira tarefa (chamado com a condição adquirida)"""
+        if self._threads:
+            return
+        for indice in range(self.num_threads):
+            thread = threading.Thread(target=self._loop, name=f'scheduler-{indice}', daemon=True)
+            self._threads.append(thread)
+            thread.start()
+        logger.info(f"🚀 Agendador global iniciado com {self.num_threads} threads")
+    
+    def _proxima_tarefa(self, respeitar_limites: bool = True):
+        """Escolhe a próxima tarefa (chamado com a condição adquirida); None se não houver"""
+        candidatas = [
+            prioridade for prioridade in self.PRIORIDADES
+            if self._filas[prioridade]
+            and (not respeitar_limites or self._executando[prioridade] < self._limites[prioridade])
+        ]
+        if not candidatas:
+            return None
+        
+        # Rodízio ponderado entre classes: quando todas as candidatas gastaram
+        # seus créditos, uma nova rodada começa
+        prioridade = next((p for p in candidatas if self._creditos_classe[p] > 0), None)
+        if prioridade is None:
+            self._creditos_classe = dict(self.PESOS_CLASSE)
+            prioridade = candidatas[0]
+        self._creditos_classe[prioridade] -= 1
+        
+        # Rodízio entre usuários da classe
+        filas = self._filas[prioridade]
+        user_id, fila = next(iter(filas.items()))
+        future, fn, args, kwargs = fila.popleft()
+        
+        chave = (prioridade, user_id)
+        self._creditos_usuario[chave] -= 1
+        if not fila:
+            del filas[user_id]
+            del self._creditos_usuario[chave]
+        elif self._creditos_usuario[chave] <= 0:
+            filas.move_to_end(user_id)
+            self._creditos_usuario[chave] = self._pesos_usuario.get(user_id, 1)
+        
+        self._executando[prioridade] += 1
+        return prioridade, future, fn, args, kwargs
+    
+    def _executar(self, prioridade: str, future: Future, fn: Callable, args: tuple, kwargs: dict):
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+        finally:
+            with self._condicao:
+                self._executando[prioridade] -= 1
+                # Uma vaga liberada pode destravar uma classe que estava no teto
+                self._condicao.notify_all()
+    
+    def _loop(self):
+        self._local.trabalhador = True
+        while True:
+            with self._condicao:
+                tarefa = self._proxima_tarefa()
+                while tarefa is None:
+                    self._condicao.wait()
+                    tarefa = self._proxima_tarefa()
+            self._executar(*tarefa)
+
+# Agendador global do processo
+work_scheduler = WorkScheduler(int(os.getenv('SCHEDULER_THREADS', 16)))